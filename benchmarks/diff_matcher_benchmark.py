@@ -0,0 +1,70 @@
+"""
+Benchmark the diff requirement check on a large synthetic migration diff.
+
+Compares the RequirementMatcher used by the diff requirement rules with the previous
+`all(any(req in line for line in lines) for req in requirements)` check, on the
+deleted and added lines captured from a generated diff of --size-mb megabytes.
+
+    python benchmarks/diff_matcher_benchmark.py --size-mb 50
+"""
+from pathlib import Path
+import argparse
+import sys
+import time
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from run_validation import DIFF_TASKS, TASK_RULES, collect_changed_lines, load_parsers
+from synthetic import generate_diff, requirement_lines
+
+
+def requirement_rules(task):
+    return [rule for rule in TASK_RULES[task]['rules'] if rule['type'] != 'correct_syntax']
+
+
+def naive_check(lines, requirements):
+    return all(any(req in line for line in lines) for req in requirements)
+
+
+def best_of(repeat, function):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the diff requirement matcher')
+    parser.add_argument('--size-mb', type=float, default=50, help='Size of the synthetic diff (default: 50)')
+    parser.add_argument('--task', default='test4-deprecated-material', choices=DIFF_TASKS)
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, best is reported (default: 3)')
+    args = parser.parse_args()
+
+    _, _, diff_parser, diff_query = load_parsers(languages=('diff',))
+
+    requirements = requirement_lines(TASK_RULES[args.task])
+    diff_bytes = generate_diff(requirements, size_bytes=int(args.size_mb * 1024 * 1024)).encode('utf-8')
+    print(f"Synthetic diff: {len(diff_bytes) / 1024 / 1024:.1f} MB, {diff_bytes.count(b'@@ -')} hunks")
+
+    start = time.perf_counter()
+    tree = diff_parser.parse(diff_bytes)
+    lines, line_numbers = collect_changed_lines(tree.root_node, diff_query)
+    print(f"Parse and capture: {time.perf_counter() - start:.2f} s, "
+          f"{len(lines['deletion'])} deletions, {len(lines['addition'])} additions")
+
+    for rule in requirement_rules(args.task):
+        kind = rule['kind']
+        naive_seconds, naive_result = best_of(args.repeat, lambda: naive_check(lines[kind], rule['lines']))
+        matcher = rule['matcher']
+        matcher_seconds, matches = best_of(args.repeat, lambda: matcher.match(lines[kind], line_numbers[kind]))
+
+        assert naive_result == all(matches.values())
+        print(f"{rule['name']}: naive {naive_seconds * 1000:.1f} ms, matcher {matcher_seconds * 1000:.1f} ms "
+              f"({naive_seconds / matcher_seconds:.1f}x)")
+        for requirement, found_on in matches.items():
+            print(f"  line {found_on[:3]}: {requirement}")
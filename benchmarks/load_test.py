@@ -0,0 +1,174 @@
+"""
+Load-test the model server: replay the task prompts at growing concurrency.
+
+For every model and concurrency level (1, 2, 4, 8, ... by default) the five task
+prompts are sent in turn by that many concurrent clients, until the request budget
+(--requests) is used up or --duration seconds have passed. Each level reports requests
+and output tokens per second, latency percentiles and the error rate, which together
+make a saturation curve: throughput flattens and latency grows once the server is busy.
+
+    python benchmarks/load_test.py --models microsoft/phi-4 --levels 1 2 4 8 --requests 40
+
+Runs offline against stub_model_server.py and its service-time model, e.g.
+
+    python stub_model_server.py --port 18234 --prefill-tps 2000 --decode-tps 40 --parallel 2 \\
+        --batch-slowdown 0.3 --completion-tokens 200 &
+    python benchmarks/load_test.py --base-url http://127.0.0.1:18234/v1 --models stub
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import csv
+import sys
+import time
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from run_generation import (DEFAULT_BASE_URL, DEFAULT_TIMEOUT_SECONDS, MODELS, TASKS, chat_completion, load_prompts,
+                            percentile, warm_up_model)
+
+DEFAULT_LEVELS = [1, 2, 4, 8, 16]
+DEFAULT_OUTPUT = REPO_ROOT / 'build' / 'benchmarks' / 'saturation.csv'
+
+SATURATION_FIELDNAMES = [
+    'modelName', 'concurrency', 'requests', 'errors', 'errorRate', 'durationSeconds',
+    'requestsPerSecond', 'outputTokensPerSecond', 'latencyP50Ms', 'latencyP95Ms', 'latencyP99Ms',
+]
+
+
+async def run_level(client, model_name, prompts, concurrency, request_budget, duration):
+    """
+    Send requests from concurrency clients until the budget or the duration is used up.
+
+    Args:
+        client: httpx.AsyncClient whose base_url is the /v1 endpoint
+        model_name: Model to load-test
+        prompts: List of (system_prompt, user_prompt), sent in turn
+        concurrency: Number of clients sending one request after another
+        request_budget: Requests to send in total, or None to only stop after duration
+        duration: Seconds after which no new request is started, or None
+
+    Returns:
+        Row of the saturation CSV
+    """
+    latencies = []
+    output_tokens = 0
+    errors = 0
+    sent = 0
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+
+    async def client_loop():
+        nonlocal output_tokens, errors, sent
+        while True:
+            if request_budget is not None and sent >= request_budget:
+                return
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            system_prompt, user_prompt = prompts[sent % len(prompts)]
+            sent += 1
+            request_start = time.perf_counter()
+            try:
+                _, usage = await chat_completion(client, model_name, system_prompt, user_prompt)
+            except (httpx.HTTPError, KeyError, ValueError):
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - request_start)
+            output_tokens += usage.get('completion_tokens', 0)
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    latency = {
+        name: f"{percentile(latencies, fraction) * 1000:.1f}" if latencies else ''
+        for name, fraction in (('latencyP50Ms', 0.5), ('latencyP95Ms', 0.95), ('latencyP99Ms', 0.99))
+    }
+    return {
+        'modelName': model_name,
+        'concurrency': concurrency,
+        'requests': sent,
+        'errors': errors,
+        'errorRate': f"{errors / sent:.3f}" if sent else '',
+        'durationSeconds': f"{elapsed:.3f}",
+        'requestsPerSecond': f"{len(latencies) / elapsed:.3f}",
+        'outputTokensPerSecond': f"{output_tokens / elapsed:.1f}",
+        **latency,
+    }
+
+
+async def load_test(models, levels, request_budget, duration, base_url, timeout, warm_up=True):
+    """
+    Load-test every model at every concurrency level, one model after another.
+
+    Args:
+        models: Models to load-test
+        levels: Concurrency levels
+        request_budget: Requests per level; None with no duration sends 4 per client, 20 at least
+        duration: Seconds per level, or None
+        base_url: OpenAI-compatible endpoint
+        timeout: Seconds a request may take
+        warm_up: Load each model with a throwaway request before its first level; a model
+                 whose warm-up fails is skipped
+
+    Returns:
+        List of saturation CSV rows
+    """
+    prompts = [load_prompts(task) for task in TASKS]
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    rows = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for model_name in models:
+            if warm_up:
+                # Keep the model load out of the first level
+                try:
+                    await warm_up_model(client, model_name)
+                except httpx.HTTPError as e:
+                    # Its levels would time the load instead; the other models still run
+                    print(f"Error loading {model_name}, skipped: {e!r}")
+                    continue
+            for concurrency in levels:
+                budget = request_budget
+                if budget is None and duration is None:
+                    budget = max(20, 4 * concurrency)
+                row = await run_level(client, model_name, prompts, concurrency, budget, duration)
+                print(f"{model_name:<36}{concurrency:>6}{row['requestsPerSecond']:>10}"
+                      f"{row['outputTokensPerSecond']:>10}{row['latencyP50Ms']:>10}{row['latencyP95Ms']:>10}"
+                      f"{row['latencyP99Ms']:>10}{row['errorRate']:>8}")
+                rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load-test the model server at growing concurrency')
+    parser.add_argument('--base-url', type=str, default=DEFAULT_BASE_URL,
+                        help=f'OpenAI-compatible endpoint (default: {DEFAULT_BASE_URL})')
+    parser.add_argument('--models', nargs='+', default=MODELS, metavar='MODEL',
+                        help='Models to load-test (default: the evaluated models)')
+    parser.add_argument('--levels', nargs='+', type=int, default=DEFAULT_LEVELS, metavar='N',
+                        help=f"Concurrency levels (default: {' '.join(map(str, DEFAULT_LEVELS))})")
+    parser.add_argument('--requests', type=int, default=None,
+                        help='Requests per level (default: 4 per client, 20 at least, unless --duration is given)')
+    parser.add_argument('--duration', type=float, default=None,
+                        help='Seconds per level; no request is started after it (default: no limit)')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT_SECONDS,
+                        help=f'Seconds a request may take (default: {DEFAULT_TIMEOUT_SECONDS})')
+    parser.add_argument('--no-warm-up', action='store_true',
+                        help='Do not load each model with a throwaway request before its first level')
+    parser.add_argument('--output', type=str, default=str(DEFAULT_OUTPUT),
+                        help='Saturation curve CSV (default: build/benchmarks/saturation.csv)')
+    args = parser.parse_args()
+
+    print(f"{'model':<36}{'conc':>6}{'req/s':>10}{'tok/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    rows = asyncio.run(load_test(args.models, args.levels, args.requests, args.duration, args.base_url, args.timeout,
+                                 warm_up=not args.no_warm_up))
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=SATURATION_FIELDNAMES, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nSaturation curve written to {args.output}")
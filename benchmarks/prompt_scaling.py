@@ -0,0 +1,365 @@
+"""
+Measure how prompt length drives latency, and fit per-model prefill and decode costs.
+
+The task prompts are padded with real project code (the reference and generated Kotlin
+files and diffs) to about 1k, 2k, 4k, 8k, 16k and 32k tokens, and every size is sent
+--repeats times as a streamed request. Each request records its time to first token
+(TTFT) and its decode time per output token. Per model, two lines are fitted by least
+squares against the prompt tokens reported by the server:
+
+    TTFT             = ttft_intercept + prompt_tokens * prefill_per_token
+    decode per token = decode_intercept + prompt_tokens * decode_per_token_per_prompt_token
+
+so the latency of a request with P prompt and N output tokens is predicted as
+TTFT(P) + (N - 1) * decode(P). Writes three CSVs to build/benchmarks/: the measurements,
+the fitted coefficients and a prediction table.
+
+    python benchmarks/prompt_scaling.py --models microsoft/phi-4 --sizes 1000 4000 16000
+
+Every prompt starts with a fresh run marker, so a server's prompt cache cannot reuse the
+prefill of the previous, shorter prompt. Runs offline against stub_model_server.py:
+
+    python stub_model_server.py --port 18234 --prefill-tps 20000 --decode-tps 200 --completion-tokens 20 &
+    python benchmarks/prompt_scaling.py --base-url http://127.0.0.1:18234/v1 --models stub
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import csv
+import sys
+import uuid
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from run_generation import (DEFAULT_BASE_URL, DEFAULT_TIMEOUT_SECONDS, MODELS, SAMPLING_PARAMS, TASKS,
+                            chat_completion_stream, load_prompts, warm_up_model)
+
+DEFAULT_SIZES = [1000, 2000, 4000, 8000, 16000, 32000]
+DEFAULT_REPEATS = 2
+DEFAULT_MAX_TOKENS = 256
+DEFAULT_PREDICT_OUTPUT_TOKENS = 500
+DEFAULT_OUTPUT_DIR = REPO_ROOT / 'build' / 'benchmarks'
+# Real project code used as padding, cycled when a prompt needs more than there is
+DEFAULT_CONTEXT = [
+    'resources/golden-reference/**/*.kt',
+    'resources/golden-reference/**/*.diff',
+    'build/test*/result*.kt',
+    'build/test*/result*.diff',
+]
+# Characters per token assumed when sizing the padding; the fits use the server's own counts
+CHARS_PER_TOKEN = 4
+
+MEASUREMENT_FIELDNAMES = [
+    'modelName', 'targetTokens', 'task', 'repeat', 'promptTokens', 'completionTokens',
+    'ttftMs', 'decodeMsPerToken', 'latencyMs', 'error',
+]
+FIT_FIELDNAMES = [
+    'modelName', 'samples', 'ttftInterceptMs', 'prefillMsPerKToken', 'prefillTokensPerSecond', 'ttftR2',
+    'decodeMsPerToken', 'decodeMsPerTokenPerKPromptTokens', 'decodeTokensPerSecond', 'decodeR2',
+]
+PREDICTION_FIELDNAMES = [
+    'modelName', 'promptTokens', 'outputTokens', 'predictedTtftMs', 'predictedDecodeMs', 'predictedLatencyMs',
+]
+
+
+def load_context_files(patterns, root=REPO_ROOT):
+    """
+    Read the files used as padding.
+
+    Args:
+        patterns: Glob patterns relative to root
+        root: Directory the patterns are relative to
+
+    Returns:
+        List of (relative path, text), sorted by path
+    """
+    paths = sorted({path for pattern in patterns for path in root.glob(pattern) if path.is_file()})
+    return [(path.relative_to(root).as_posix(), path.read_text(encoding='utf-8')) for path in paths]
+
+
+def build_padding(context_files, length):
+    """
+    Project files as fenced blocks, cycled and cut to exactly length characters.
+
+    Args:
+        context_files: List of (path, text) from load_context_files
+        length: Characters of padding wanted
+
+    Returns:
+        Padding text
+    """
+    if length <= 0 or not context_files:
+        return ''
+    parts = []
+    size = 0
+    index = 0
+    while size < length:
+        path, text = context_files[index % len(context_files)]
+        block = f"File {path}:\n```{Path(path).suffix.lstrip('.')}\n{text.rstrip()}\n```\n\n"
+        parts.append(block)
+        size += len(block)
+        index += 1
+    return ''.join(parts)[:length]
+
+
+def padded_prompt(system_prompt, user_prompt, context_files, target_tokens):
+    """
+    Pad a task prompt with project code until system and user prompt are about target_tokens long.
+
+    The padding goes before the task, which stays last, behind a run marker unique to
+    this call. A prompt already longer than the target is not shortened.
+
+    Returns:
+        Padded user prompt
+    """
+    header = f"Run {uuid.uuid4().hex}. Project files for context:\n\n"
+    footer = "\n\nTask:\n"
+    padding_length = target_tokens * CHARS_PER_TOKEN - len(system_prompt) - len(user_prompt) - len(header) - len(footer)
+    padding = build_padding(context_files, padding_length)
+    if not padding:
+        return user_prompt
+    return header + padding + footer + user_prompt
+
+
+def fit_line(xs, ys):
+    """
+    Ordinary least-squares fit of y = intercept + slope * x.
+
+    Returns:
+        Tuple of (intercept, slope, r2), or None with fewer than two distinct x values
+    """
+    count = len(xs)
+    if count < 2 or len(set(xs)) < 2:
+        return None
+    mean_x = sum(xs) / count
+    mean_y = sum(ys) / count
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    slope = sxy / sxx
+    intercept = mean_y - slope * mean_x
+    ss_total = sum((y - mean_y) ** 2 for y in ys)
+    ss_residual = sum((y - intercept - slope * x) ** 2 for x, y in zip(xs, ys))
+    r2 = 1 - ss_residual / ss_total if ss_total > 0 else 1.0
+    return intercept, slope, r2
+
+
+def fit_model(measurements):
+    """
+    Fit the TTFT and decode lines of one model.
+
+    Args:
+        measurements: Successful measurements of the model, each a dict with prompt_tokens,
+                      ttft and decode_per_token (seconds; None for a single output token)
+
+    Returns:
+        Dict with 'samples', 'ttft' and 'decode' fits (intercept, slope, r2) in seconds and
+        seconds per prompt token; a fit is None when the sizes do not allow one
+    """
+    decoded = [m for m in measurements if m['decode_per_token'] is not None]
+    return {
+        'samples': len(measurements),
+        'ttft': fit_line([m['prompt_tokens'] for m in measurements], [m['ttft'] for m in measurements]),
+        'decode': fit_line([m['prompt_tokens'] for m in decoded], [m['decode_per_token'] for m in decoded]),
+    }
+
+
+def predict_latency(fit, prompt_tokens, output_tokens):
+    """
+    Predicted (ttft, decode time) in seconds of a request, from a fit_model result.
+
+    A missing decode fit predicts no decode time.
+    """
+    ttft_intercept, prefill_per_token, _ = fit['ttft']
+    ttft = ttft_intercept + prefill_per_token * prompt_tokens
+    decode = 0.0
+    if fit['decode'] is not None and output_tokens > 1:
+        decode_intercept, decode_slope, _ = fit['decode']
+        decode = (output_tokens - 1) * (decode_intercept + decode_slope * prompt_tokens)
+    return ttft, decode
+
+
+def fit_row(model_name, fit):
+    """Row of the coefficients CSV."""
+    ttft_intercept, prefill_per_token, ttft_r2 = fit['ttft']
+    row = {
+        'modelName': model_name,
+        'samples': fit['samples'],
+        'ttftInterceptMs': f"{ttft_intercept * 1000:.1f}",
+        'prefillMsPerKToken': f"{prefill_per_token * 1e6:.2f}",
+        'prefillTokensPerSecond': f"{1 / prefill_per_token:.1f}" if prefill_per_token > 0 else '',
+        'ttftR2': f"{ttft_r2:.4f}",
+    }
+    if fit['decode'] is not None:
+        decode_intercept, decode_slope, decode_r2 = fit['decode']
+        row.update({
+            'decodeMsPerToken': f"{decode_intercept * 1000:.3f}",
+            'decodeMsPerTokenPerKPromptTokens': f"{decode_slope * 1e6:.4f}",
+            'decodeTokensPerSecond': f"{1 / decode_intercept:.2f}" if decode_intercept > 0 else '',
+            'decodeR2': f"{decode_r2:.4f}",
+        })
+    return row
+
+
+async def measure(client, model_name, system_prompt, user_prompt, sampling):
+    """
+    Send one streamed request and time it.
+
+    Returns:
+        Dict with prompt_tokens, completion_tokens, ttft, decode_per_token and latency (seconds)
+    """
+    _, usage, start, token_times = await chat_completion_stream(client, model_name, system_prompt, user_prompt,
+                                                                sampling)
+    if not token_times:
+        raise ValueError('no content was streamed')
+    completion_tokens = usage.get('completion_tokens') or len(token_times)
+    decode_time = token_times[-1] - token_times[0]
+    return {
+        'prompt_tokens': usage.get('prompt_tokens', 0),
+        'completion_tokens': completion_tokens,
+        'ttft': token_times[0] - start,
+        'decode_per_token': decode_time / (completion_tokens - 1) if completion_tokens > 1 else None,
+        'latency': token_times[-1] - start,
+    }
+
+
+async def prompt_scaling(models, sizes, repeats, base_url, timeout, context_files, max_tokens=DEFAULT_MAX_TOKENS,
+                         warm_up=True):
+    """
+    Measure every model at every prompt size, smallest first.
+
+    A request that fails, e.g. because the prompt does not fit the model's context, ends
+    the model's larger sizes. A model whose warm-up fails is skipped without measurements.
+
+    Args:
+        models: Models to measure
+        sizes: Prompt sizes in (estimated) tokens
+        repeats: Requests per size; repeat r pads the prompt of task r (cycled)
+        base_url: OpenAI-compatible endpoint
+        timeout: Seconds a request may take
+        context_files: Padding files from load_context_files
+        max_tokens: Output token limit of every request
+        warm_up: Load each model with a throwaway request before measuring it
+
+    Returns:
+        Tuple of (measurement CSV rows, dict of model name to successful measurements)
+    """
+    prompts = [(task['name'], *load_prompts(task)) for task in TASKS]
+    sampling = {**SAMPLING_PARAMS, 'max_tokens': max_tokens}
+    rows = []
+    measurements = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        for model_name in models:
+            if warm_up:
+                try:
+                    await warm_up_model(client, model_name)
+                except httpx.HTTPError as e:
+                    # The other models still run and keep their rows
+                    print(f"Error loading {model_name}, skipped: {e!r}")
+                    continue
+            measurements[model_name] = []
+            failed = False
+            for target_tokens in sorted(sizes):
+                for repeat in range(repeats):
+                    task_name, system_prompt, user_prompt = prompts[repeat % len(prompts)]
+                    user_prompt = padded_prompt(system_prompt, user_prompt, context_files, target_tokens)
+                    row = {'modelName': model_name, 'targetTokens': target_tokens, 'task': task_name,
+                           'repeat': repeat + 1}
+                    try:
+                        result = await measure(client, model_name, system_prompt, user_prompt, sampling)
+                    except (httpx.HTTPError, KeyError, ValueError) as e:
+                        row['error'] = str(e) or type(e).__name__
+                        rows.append(row)
+                        print(f"{model_name:<36}{target_tokens:>8}  failed: {row['error']}")
+                        failed = True
+                        break
+                    measurements[model_name].append(result)
+                    decode = result['decode_per_token']
+                    row.update({
+                        'promptTokens': result['prompt_tokens'],
+                        'completionTokens': result['completion_tokens'],
+                        'ttftMs': f"{result['ttft'] * 1000:.1f}",
+                        'decodeMsPerToken': f"{decode * 1000:.3f}" if decode is not None else '',
+                        'latencyMs': f"{result['latency'] * 1000:.1f}",
+                    })
+                    rows.append(row)
+                    print(f"{model_name:<36}{target_tokens:>8}{result['prompt_tokens']:>10}{row['ttftMs']:>10}"
+                          f"{row['decodeMsPerToken']:>10}{row['latencyMs']:>12}")
+                if failed:
+                    break
+    return rows, measurements
+
+
+def write_csv(path, fieldnames, rows):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, restval='', lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fit per-model prefill and decode costs over growing prompt sizes')
+    parser.add_argument('--base-url', type=str, default=DEFAULT_BASE_URL,
+                        help=f'OpenAI-compatible endpoint (default: {DEFAULT_BASE_URL})')
+    parser.add_argument('--models', nargs='+', default=MODELS, metavar='MODEL',
+                        help='Models to measure (default: the evaluated models)')
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, metavar='TOKENS',
+                        help=f"Prompt sizes in tokens (default: {' '.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                        help=f'Requests per size, each padding the next task prompt (default: {DEFAULT_REPEATS})')
+    parser.add_argument('--max-tokens', type=int, default=DEFAULT_MAX_TOKENS,
+                        help=f'Output token limit of every request (default: {DEFAULT_MAX_TOKENS})')
+    parser.add_argument('--context', nargs='+', default=DEFAULT_CONTEXT, metavar='GLOB',
+                        help='Files used as padding, as glob patterns relative to the repository '
+                             '(default: the reference and generated Kotlin files and diffs)')
+    parser.add_argument('--predict-output-tokens', type=int, default=DEFAULT_PREDICT_OUTPUT_TOKENS,
+                        help=f'Output tokens of the prediction table (default: {DEFAULT_PREDICT_OUTPUT_TOKENS})')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT_SECONDS,
+                        help=f'Seconds a request may take (default: {DEFAULT_TIMEOUT_SECONDS})')
+    parser.add_argument('--no-warm-up', action='store_true',
+                        help='Do not load each model with a throwaway request before measuring it')
+    parser.add_argument('--output-dir', type=str, default=str(DEFAULT_OUTPUT_DIR),
+                        help='Directory of the CSVs (default: build/benchmarks)')
+    args = parser.parse_args()
+
+    context_files = load_context_files(args.context)
+    if not context_files:
+        parser.error(f"no padding files match {' '.join(args.context)}")
+
+    print(f"{'model':<36}{'target':>8}{'prompt':>10}{'ttft ms':>10}{'ms/tok':>10}{'latency ms':>12}")
+    rows, measurements = asyncio.run(prompt_scaling(args.models, args.sizes, args.repeats, args.base_url, args.timeout,
+                                                    context_files, args.max_tokens, warm_up=not args.no_warm_up))
+
+    fit_rows = []
+    prediction_rows = []
+    for model_name, model_measurements in measurements.items():
+        fit = fit_model(model_measurements)
+        if fit['ttft'] is None:
+            print(f"{model_name}: fewer than two prompt sizes measured, no fit")
+            continue
+        fit_rows.append(fit_row(model_name, fit))
+        for target_tokens in sorted(args.sizes):
+            ttft, decode = predict_latency(fit, target_tokens, args.predict_output_tokens)
+            prediction_rows.append({
+                'modelName': model_name,
+                'promptTokens': target_tokens,
+                'outputTokens': args.predict_output_tokens,
+                'predictedTtftMs': f"{ttft * 1000:.1f}",
+                'predictedDecodeMs': f"{decode * 1000:.1f}",
+                'predictedLatencyMs': f"{(ttft + decode) * 1000:.1f}",
+            })
+
+    print(f"\n{'model':<36}{'ttft0 ms':>10}{'prefill tok/s':>15}{'r2':>8}{'decode tok/s':>14}{'ms/tok per 1k':>15}")
+    for row in fit_rows:
+        print(f"{row['modelName']:<36}{row['ttftInterceptMs']:>10}{row['prefillTokensPerSecond']:>15}"
+              f"{row['ttftR2']:>8}{row.get('decodeTokensPerSecond', ''):>14}"
+              f"{row.get('decodeMsPerTokenPerKPromptTokens', ''):>15}")
+
+    output_dir = Path(args.output_dir)
+    write_csv(output_dir / 'prompt-scaling.csv', MEASUREMENT_FIELDNAMES, rows)
+    write_csv(output_dir / 'prompt-scaling-fit.csv', FIT_FIELDNAMES, fit_rows)
+    write_csv(output_dir / 'prompt-scaling-prediction.csv', PREDICTION_FIELDNAMES, prediction_rows)
+    print(f"\nMeasurements, fits and predictions written to {output_dir}/prompt-scaling*.csv")
@@ -0,0 +1,161 @@
+"""
+Deterministic synthetic Kotlin files and diffs for the benchmarks.
+
+Both generators grow the same building blocks the validators look at (imports,
+annotated functions, classes with parents, property initializers, changed lines),
+so the work per validator scales with the size of the input.
+"""
+import random
+
+KOTLIN_HEADER = [
+    "package com.google.samples.apps.nowinandroid.feature.synthetic",
+    "",
+    "import androidx.compose.runtime.Composable",
+    "import androidx.compose.ui.tooling.preview.Preview",
+    "import com.google.samples.apps.nowinandroid.core.model.data.FollowableTopic",
+    "import com.google.samples.apps.nowinandroid.core.model.data.Topic",
+    "import com.google.samples.apps.nowinandroid.core.database.model.TopicEntity",
+    "import org.junit.Test",
+    "",
+]
+
+CONTEXT_LINES = [
+    "    val state by viewModel.uiState.collectAsStateWithLifecycle()",
+    "    Scaffold(modifier = modifier.fillMaxSize()) { padding ->",
+    "        LazyColumn(contentPadding = padding) {",
+    "            items(topics, key = { it.id }) { topic ->",
+    "    }",
+]
+CHANGED_LINES = [
+    "import androidx.compose.material3.TopAppBarDefaults",
+    "private fun Project.configureAndroid() = configure<ApplicationExtension> {",
+    "        title = { Text(text = stringResource(id = titleRes)) },",
+    "        colors = TopAppBarDefaults.smallTopAppBarColors(",
+    "    compileSdk = 35",
+]
+
+
+def _kotlin_class(index, rng):
+    """A test class extending DatabaseTest with a use case property and a few @Test functions."""
+    lines = [
+        f"class SyntheticTest{index} : DatabaseTest() {{",
+        f"    private val useCase = GetFollowableTopicsUseCase(repository{index})",
+        "",
+    ]
+    for test in range(rng.randint(2, 6)):
+        lines.extend([
+            "    @Test",
+            f"    fun topic{index}_case{test}_isFollowed() = runTest {{",
+            f"        val topics = listOf(Topic(id = \"{index}\", name = \"Topic {test}\"))",
+            "        val result = useCase(sortBy = TopicSortField.NAME).first()",
+            "        assertEquals(topics.size, result.size)",
+            "    }",
+            "",
+        ])
+    lines.append("}")
+    lines.append("")
+    return lines
+
+
+def _kotlin_preview(index):
+    """A @Preview @Composable function."""
+    return [
+        "@Preview",
+        "@Composable",
+        f"fun SyntheticPreview{index}() {{",
+        f"    NiaTheme {{ TopicCard(name = \"Topic {index}\", onClick = {{}}) }}",
+        "}",
+        "",
+    ]
+
+
+def generate_kotlin(size_bytes, seed=0):
+    """
+    Generate a Kotlin file of about size_bytes.
+
+    Test classes and preview functions alternate, so the number of annotated functions
+    and classes grows linearly with the size.
+
+    Args:
+        size_bytes: Target size of the file
+        seed: Seed of the random generator, so the same size always gives the same file
+
+    Returns:
+        The Kotlin source as bytes
+    """
+    rng = random.Random(seed)
+    parts = ['\n'.join(KOTLIN_HEADER) + '\n']
+    size = len(parts[0])
+    index = 0
+    while size < size_bytes:
+        block = _kotlin_class(index, rng) if index % 2 == 0 else _kotlin_preview(index)
+        text = '\n'.join(block) + '\n'
+        parts.append(text)
+        size += len(text)
+        index += 1
+    return ''.join(parts).encode('utf-8')
+
+
+def generate_diff(requirement_lines, hunk_count=None, size_bytes=None, seed=0):
+    """
+    Generate a multi-file unified diff whose last hunk holds the required lines.
+
+    Putting the requirements at the end is the worst case for a check that scans the
+    changed lines in order. Generation stops once hunk_count hunks or size_bytes bytes
+    were written, whichever is given.
+
+    Args:
+        requirement_lines: Dict with 'deletion' and 'addition' lists of lines to put in the last hunk
+        hunk_count: Number of generated hunks before the last one
+        size_bytes: Approximate size of the diff
+        seed: Seed of the random generator
+
+    Returns:
+        The diff as a string
+    """
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    hunks = 0
+    file_index = 0
+
+    def done():
+        if hunk_count is not None:
+            return hunks >= hunk_count
+        return size >= size_bytes
+
+    while not done():
+        path = f"feature/module{file_index}/src/main/kotlin/Screen{file_index}.kt"
+        section = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}"]
+        for hunk in range(rng.randint(1, 6)):
+            start = hunk * 40 + 1
+            section.append(f"@@ -{start},7 +{start},7 @@")
+            for _ in range(3):
+                section.append(" " + rng.choice(CONTEXT_LINES))
+            section.append("-" + rng.choice(CHANGED_LINES))
+            section.append("+" + rng.choice(CHANGED_LINES) + f" // {file_index}")
+            for _ in range(3):
+                section.append(" " + rng.choice(CONTEXT_LINES))
+            hunks += 1
+            if hunk_count is not None and hunks >= hunk_count:
+                break
+        text = '\n'.join(section) + '\n'
+        parts.append(text)
+        size += len(text)
+        file_index += 1
+
+    path = "app/src/main/kotlin/Last.kt"
+    last = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}", "@@ -1,4 +1,4 @@"]
+    last.extend("-" + line for line in requirement_lines.get('deletion', []))
+    last.extend("+" + line for line in requirement_lines.get('addition', []))
+    parts.append('\n'.join(last) + '\n')
+    return ''.join(parts)
+
+
+def requirement_lines(task_rules):
+    """Required deleted and added lines of a compiled diff task, for generate_diff."""
+    lines = {'deletion': [], 'addition': []}
+    for rule in task_rules['rules']:
+        if rule['type'] != 'correct_syntax':
+            lines[rule['kind']].extend(rule['lines'])
+    return lines
@@ -0,0 +1,195 @@
+"""
+Benchmark the validation pipeline on synthetic inputs of growing size.
+
+Kotlin files from 1 KB to 10 MB and diffs from 10 to 100k hunks are generated with
+benchmarks/synthetic.py. For every input the stages of each validator are timed
+separately (best of --repeat runs):
+
+    kotlin: parse, collect (fact collection: imports, annotated functions, ...), check
+    diff:   parse, query (changed-line captures), check (requirement matching)
+
+Peak memory of every stage is measured in a separate run with tracemalloc, which only
+sees Python allocations, not the trees tree-sitter allocates in C.
+
+    python benchmarks/validation_benchmark.py --save build/benchmarks/baseline.json
+    python benchmarks/validation_benchmark.py --compare build/benchmarks/baseline.json --threshold 0.2
+"""
+from pathlib import Path
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from kotlin_collector import collect_kotlin_facts
+from rule_engine import evaluate_diff_task, evaluate_kotlin_task, match_diff_task
+from run_validation import (DIFF_TASKS, KOTLIN_TASKS, TASK_RULES, VALIDATION_RULES_VERSION, collect_changed_lines,
+                            load_parsers)
+from synthetic import generate_diff, generate_kotlin, requirement_lines
+
+KOTLIN_SIZES = [1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024]
+DIFF_HUNKS = [10, 100, 1000, 10000, 100000]
+
+# Inputs above these limits are skipped with --quick
+QUICK_MAX_KOTLIN_SIZE = 1024 * 1024
+QUICK_MAX_DIFF_HUNKS = 10000
+
+
+def size_label(size_bytes):
+    if size_bytes >= 1024 * 1024:
+        return f"{size_bytes // (1024 * 1024)}MB"
+    return f"{size_bytes // 1024}KB"
+
+
+def measure(repeat, function):
+    """Best wall time of repeat runs of function, then its peak Python memory in one traced run."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': best, 'peak_bytes': peak}, result
+
+
+def benchmark_kotlin(kotlin_parser, sizes, repeat):
+    """Time every Kotlin validator's stages on one synthetic file per size."""
+    results = {}
+    for size in sizes:
+        kt_bytes = generate_kotlin(size)
+        case = f"kotlin/{size_label(size)}"
+        results[f"{case}/parse"], tree = measure(repeat, lambda: kotlin_parser.parse(kt_bytes))
+        correct_syntax = not tree.root_node.has_error
+
+        for task_name in KOTLIN_TASKS:
+            task = TASK_RULES[task_name]
+            results[f"{case}/{task_name}/collect"], facts = measure(
+                repeat, lambda: collect_kotlin_facts(tree, kt_bytes, facts=task['facts'], constructors=task['constructors'])
+            )
+            results[f"{case}/{task_name}/check"], _ = measure(
+                repeat, lambda: evaluate_kotlin_task(task, correct_syntax, facts)
+            )
+        print(f"{case}: {len(kt_bytes)} bytes, parse {results[f'{case}/parse']['seconds'] * 1000:.1f} ms")
+    return results
+
+
+def benchmark_diff(diff_parser, diff_query, hunk_counts, repeat):
+    """Time every diff validator's stages on one synthetic diff per hunk count."""
+    results = {}
+    for hunk_count in hunk_counts:
+        for task_name in DIFF_TASKS:
+            task = TASK_RULES[task_name]
+            diff_bytes = generate_diff(requirement_lines(task), hunk_count=hunk_count).encode('utf-8')
+            case = f"diff/{hunk_count}-hunks/{task_name}"
+
+            results[f"{case}/parse"], tree = measure(repeat, lambda: diff_parser.parse(diff_bytes))
+            correct_syntax = not tree.root_node.has_error
+            results[f"{case}/query"], (lines, line_numbers) = measure(
+                repeat, lambda: collect_changed_lines(tree.root_node, diff_query)
+            )
+            results[f"{case}/check"], _ = measure(
+                repeat, lambda: evaluate_diff_task(task, correct_syntax, match_diff_task(task, lines, line_numbers))
+            )
+            print(f"{case}: {len(diff_bytes)} bytes, parse {results[f'{case}/parse']['seconds'] * 1000:.1f} ms")
+    return results
+
+
+def compare(baseline, results, threshold, min_seconds):
+    """
+    Compare a run with a baseline and list the stages that got slower or bigger.
+
+    Args:
+        baseline: Results of an earlier run, as saved with --save
+        results: Results of this run
+        threshold: Allowed relative growth, e.g. 0.2 for 20%
+        min_seconds: Stages faster than this in both runs are not checked for time, as
+                     their timings are mostly noise
+
+    Returns:
+        List of regression descriptions
+    """
+    regressions = []
+    print(f"\n{'stage':<58}{'base ms':>10}{'now ms':>10}{'ratio':>8}{'base KB':>10}{'now KB':>10}")
+    for key, now in results.items():
+        base = baseline['results'].get(key)
+        if base is None:
+            print(f"{key:<58}{'-':>10}{now['seconds'] * 1000:>10.2f}")
+            continue
+
+        ratio = now['seconds'] / base['seconds'] if base['seconds'] else float('inf')
+        flags = []
+        if max(base['seconds'], now['seconds']) >= min_seconds and ratio > 1 + threshold:
+            flags.append('time')
+        if base['peak_bytes'] and now['peak_bytes'] > base['peak_bytes'] * (1 + threshold):
+            flags.append('memory')
+
+        print(f"{key:<58}{base['seconds'] * 1000:>10.2f}{now['seconds'] * 1000:>10.2f}{ratio:>8.2f}"
+              f"{base['peak_bytes'] / 1024:>10.0f}{now['peak_bytes'] / 1024:>10.0f}"
+              f"{'  REGRESSION (' + ', '.join(flags) + ')' if flags else ''}")
+        for flag in flags:
+            regressions.append(f"{key}: {flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the validation pipeline on synthetic inputs')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage, best is reported (default: 3)')
+    parser.add_argument('--quick', action='store_true',
+                        help='Skip the largest inputs (Kotlin above 1 MB, diffs above 10k hunks)')
+    parser.add_argument('--save', type=str, help='Write the results to this JSON file, e.g. as a new baseline')
+    parser.add_argument('--compare', type=str, help='Baseline JSON file to compare the results with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown or memory growth reported as a regression (default: 0.2)')
+    parser.add_argument('--min-ms', type=float, default=1.0,
+                        help='Stages under this many milliseconds are not checked for slowdowns (default: 1.0)')
+    args = parser.parse_args()
+
+    kotlin_sizes = [size for size in KOTLIN_SIZES if not args.quick or size <= QUICK_MAX_KOTLIN_SIZE]
+    diff_hunks = [hunks for hunks in DIFF_HUNKS if not args.quick or hunks <= QUICK_MAX_DIFF_HUNKS]
+
+    kotlin_parser, _, diff_parser, diff_query = load_parsers()
+
+    results = {}
+    results.update(benchmark_kotlin(kotlin_parser, kotlin_sizes, args.repeat))
+    results.update(benchmark_diff(diff_parser, diff_query, diff_hunks, args.repeat))
+
+    run = {
+        'metadata': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'rules_version': VALIDATION_RULES_VERSION,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(run, f, indent=2)
+        print(f"\nResults written to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold, args.min_ms / 1000)
+        if regressions:
+            print(f"\n{len(regressions)} regressions above {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions above {args.threshold:.0%}")
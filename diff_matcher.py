@@ -0,0 +1,53 @@
+class RequirementMatcher:
+    """
+    Find which of a fixed list of required substrings occur in a batch of lines.
+
+    The lines are joined into one buffer and every requirement is located with the C-level
+    substring search of str.find, jumping to the next line after each hit. The cost is
+    linear in the size of the diff instead of requirements x lines x line length, and a
+    line is never searched twice for the same requirement.
+    """
+
+    def __init__(self, requirements):
+        self.requirements = tuple(dict.fromkeys(requirements))
+
+    def match(self, lines, line_numbers=None):
+        """
+        Report on which lines each requirement occurs.
+
+        Args:
+            lines: List of strings without newlines, e.g. the content of added lines
+            line_numbers: Line number of each entry of lines (default: 1, 2, ...)
+
+        Returns:
+            Dictionary mapping every requirement to the ascending list of line numbers it
+            occurs on; the list is empty when the requirement is missing
+        """
+        matches = {requirement: [] for requirement in self.requirements}
+        if not lines:
+            return matches
+
+        buffer = '\n'.join(lines)
+        find = buffer.find
+        hits = []
+        for requirement in self.requirements:
+            if '\n' in requirement:
+                # A requirement spanning lines can never be inside a single line
+                continue
+            position = find(requirement)
+            while position != -1:
+                hits.append((position, requirement))
+                line_end = find('\n', position + len(requirement))
+                if line_end == -1:
+                    break
+                position = find(requirement, line_end + 1)
+
+        # Hits sorted by offset, so newlines are counted once over the whole buffer
+        hits.sort()
+        line_index = 0
+        counted_to = 0
+        for position, requirement in hits:
+            line_index += buffer.count('\n', counted_to, position)
+            counted_to = position
+            matches[requirement].append(line_numbers[line_index] if line_numbers is not None else line_index + 1)
+        return matches
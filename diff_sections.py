@@ -0,0 +1,108 @@
+import mmap
+import re
+
+GIT_HEADER = b'diff --git '
+OLD_FILE_HEADER = b'--- '
+NEW_FILE_HEADER = b'+++ '
+HUNK_HEADER = b'@@ '
+# Line counts of a hunk header, e.g. `@@ -12,7 +12,8 @@`; a missing count is 1
+HUNK_RANGES = re.compile(rb'@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@')
+
+
+def _section_starts(mapped):
+    """Yield the offset of every line starting a file section of the diff."""
+    if mapped[:len(GIT_HEADER)] == GIT_HEADER or mapped.find(b'\n' + GIT_HEADER) != -1:
+        if mapped[:len(GIT_HEADER)] == GIT_HEADER:
+            yield 0
+        position = mapped.find(b'\n' + GIT_HEADER)
+        while position != -1:
+            yield position + 1
+            position = mapped.find(b'\n' + GIT_HEADER, position + 1)
+        return
+
+    # Plain unified diff: a section starts at a `--- ` line directly followed by a `+++ ` line,
+    # outside a hunk; a deleted `-- x` line followed by an added `++ y` line looks the same
+    size = len(mapped)
+    position = 0
+    # Old and new lines still to come in the current hunk, from its @@ header
+    old_left = new_left = 0
+    while position < size:
+        line_end = mapped.find(b'\n', position)
+        next_line = size if line_end == -1 else line_end + 1
+        if old_left > 0 or new_left > 0:
+            marker = mapped[position:position + 1]
+            if marker == b'-':
+                old_left -= 1
+            elif marker == b'+':
+                new_left -= 1
+            elif marker != b'\\':
+                # Context line; `\ No newline at end of file` counts for neither side
+                old_left -= 1
+                new_left -= 1
+        elif mapped[position:position + len(OLD_FILE_HEADER)] == OLD_FILE_HEADER:
+            if mapped[next_line:next_line + len(NEW_FILE_HEADER)] == NEW_FILE_HEADER:
+                yield position
+        elif mapped[position:position + len(HUNK_HEADER)] == HUNK_HEADER:
+            match = HUNK_RANGES.match(mapped[position:next_line])
+            if match:
+                old_left = int(match.group(1) or 1)
+                new_left = int(match.group(2) or 1)
+        position = next_line
+
+
+def _section_bounds(mapped):
+    """Yield (start, end) offsets of the sections, including a preamble before the first header."""
+    previous = 0
+    for start in _section_starts(mapped):
+        if start > previous:
+            yield previous, start
+        previous = start
+    if previous < len(mapped):
+        yield previous, len(mapped)
+
+
+def iter_diff_sections(path):
+    """
+    Split a diff file into its per-file sections without reading it into memory.
+
+    The file is memory-mapped and only one section is copied out at a time, so memory
+    is bounded by the largest section rather than the whole diff. Sections start at
+    `diff --git` lines, or at `---`/`+++` header pairs for diffs without git headers;
+    anything before the first header is yielded as a section of its own.
+
+    Args:
+        path: Path of the diff file
+
+    Returns:
+        Iterator of dicts with keys:
+            'index': Position of the section in the diff, starting at 1
+            'name': First line of the section, e.g. its `diff --git` header
+            'first_line': Line number of the section's first line in the diff
+            'data': Content of the section as bytes
+    """
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return
+
+    with mapped:
+        first_line = 1
+        released_to = 0
+        for index, (start, end) in enumerate(_section_bounds(mapped), start=1):
+            data = mapped[start:end]
+            name_end = data.find(b'\n')
+            yield {
+                'index': index,
+                'name': data[:name_end if name_end != -1 else len(data)].decode('utf-8', 'replace').rstrip('\r'),
+                'first_line': first_line,
+                'data': data,
+            }
+            first_line += data.count(b'\n')
+
+            # Let the kernel drop the mapped pages already processed, so resident memory stays flat
+            released = end - end % mmap.PAGESIZE
+            if hasattr(mmap, 'MADV_DONTNEED') and released > released_to:
+                mapped.madvise(mmap.MADV_DONTNEED, released_to, released - released_to)
+                released_to = released
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# Share of max_bytes the writers of a cache may add, together, before rescanning its size
+SYNC_FRACTION = 0.05
+
+
+def sha256_bytes(data):
+    """Hex SHA-256 digest of a bytes object."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    """Hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Persistent JSON cache with size-bounded LRU eviction.
+
+    Each entry is one file named after its key. Reading an entry refreshes its mtime, so
+    when the cache grows past max_bytes the entries with the oldest mtime are evicted
+    first. Writes go through a temporary file and os.replace, so several processes can
+    share one cache directory.
+
+    The processes writing to the directory at the same time share the size budget: each
+    one rescans the real total after writing its share of SYNC_FRACTION * max_bytes, and
+    evicts once the total it last saw plus its own writes could, with the unseen writes of
+    the others, pass max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes, writers=1):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._sync_bytes = max_bytes * SYNC_FRACTION / writers
+        # The other writers add at most _sync_bytes each between two rescans of this one
+        self._limit_bytes = max_bytes - self._sync_bytes * (writers - 1)
+        self._scan()
+
+    def _scan(self):
+        """Read the real size of the cache, including the entries of other processes."""
+        self._scanned_bytes = sum(size for _, _, size in self._entries())
+        self._written_bytes = 0
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _entries(self):
+        """Yield (mtime, path, size) for every entry in the cache directory."""
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.json'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield stat.st_mtime, entry.path, stat.st_size
+
+    def get(self, key):
+        """Return the value stored under key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return value
+
+    def put(self, key, value):
+        """Store a JSON-serialisable value under key, evicting old entries if needed."""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        data = json.dumps(value).encode('utf-8')
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._written_bytes += len(data)
+        if self._written_bytes >= self._sync_bytes:
+            self._scan()
+        if self._scanned_bytes + self._written_bytes > self._limit_bytes:
+            self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache is back under 90% of max_bytes."""
+        # Evicting below the limit leaves headroom, so the next writes do not rescan the directory
+        target = self.max_bytes * 0.9
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._scanned_bytes = total
+        self._written_bytes = 0
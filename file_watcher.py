@@ -0,0 +1,112 @@
+import os
+import time
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+INOTIFY_EVENTS = 0 if inotify_simple is None else (
+    inotify_simple.flags.CLOSE_WRITE | inotify_simple.flags.MOVED_TO | inotify_simple.flags.CREATE
+    | inotify_simple.flags.DELETE | inotify_simple.flags.MOVED_FROM
+)
+
+
+def _signature(path):
+    """(mtime, size) of a file, or None when it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class FileWatcher:
+    """
+    Report which of a fixed set of files changed on disk.
+
+    The directories containing the files are watched with inotify when the optional
+    inotify_simple package is installed, and polled otherwise. Either way a file is only
+    reported when its mtime or size actually changed, so events for unrelated files in
+    the same directory are ignored.
+    """
+
+    def __init__(self, paths, poll_interval=0.5, settle_ms=50, use_inotify=True):
+        self.paths = list(dict.fromkeys(paths))
+        self.poll_interval = poll_interval
+        self.settle_ms = settle_ms
+        self._signatures = {path: _signature(path) for path in self.paths}
+
+        self._by_directory = {}
+        for path in self.paths:
+            directory = os.path.dirname(os.path.abspath(path))
+            self._by_directory.setdefault(directory, []).append(path)
+
+        self._inotify = None
+        self._watched = {}
+        if use_inotify and inotify_simple is not None:
+            self._inotify = inotify_simple.INotify()
+            self._add_watches()
+
+    @property
+    def mode(self):
+        return 'inotify' if self._inotify is not None else 'polling'
+
+    def _add_watches(self):
+        """Watch every directory that exists; returns the files of directories watched just now."""
+        appeared = []
+        for directory, paths in self._by_directory.items():
+            if directory in self._watched.values() or not os.path.isdir(directory):
+                continue
+            try:
+                wd = self._inotify.add_watch(directory, INOTIFY_EVENTS)
+            except FileNotFoundError:
+                continue
+            self._watched[wd] = directory
+            appeared.extend(paths)
+        return appeared
+
+    def _changed(self, candidates):
+        """Candidates whose signature differs from the one seen last."""
+        changed = []
+        for path in candidates:
+            signature = _signature(path)
+            if signature != self._signatures[path]:
+                self._signatures[path] = signature
+                changed.append(path)
+        return changed
+
+    def wait(self):
+        """
+        Block until at least one watched file changed.
+
+        Returns:
+            List of changed paths, as given to the watcher; a deleted file is included too
+        """
+        while True:
+            if self._inotify is None:
+                time.sleep(self.poll_interval)
+                candidates = self.paths
+            else:
+                # Directories created after start-up (e.g. a new build/test*/) are picked up on timeout
+                candidates = self._add_watches()
+                for event in self._inotify.read(timeout=int(self.poll_interval * 1000), read_delay=self.settle_ms):
+                    directory = self._watched.get(event.wd)
+                    if directory is None:
+                        continue
+                    if event.mask & inotify_simple.flags.IGNORED:
+                        # The directory itself was removed; watch it again once it is recreated
+                        del self._watched[event.wd]
+                        candidates.extend(self._by_directory[directory])
+                        continue
+                    candidates.extend(
+                        path for path in self._by_directory[directory]
+                        if os.path.basename(path) == event.name
+                    )
+            changed = self._changed(dict.fromkeys(candidates))
+            if changed:
+                return changed
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
@@ -0,0 +1,140 @@
+from pathlib import Path
+from tree_sitter import Language
+import json
+import os
+
+from disk_cache import sha256_file
+
+GRAMMAR_DIR = Path(__file__).resolve().parent / 'build' / 'tree-sitter-binaries'
+
+# Grammar sources built when no binary is available, pinned so cached builds stay valid
+GRAMMAR_SOURCES = {
+    'kotlin': {
+        'archive': 'https://github.com/fwcd/tree-sitter-kotlin/archive/refs/tags/0.3.8.tar.gz',
+        'revision': '0.3.8',
+    },
+    'diff': {
+        # tree-sitter-diff publishes no release tags
+        'archive': 'https://github.com/the-mikedavis/tree-sitter-diff/archive/refs/heads/main.tar.gz',
+        'revision': 'main',
+    },
+}
+
+
+def grammar_cache_dir():
+    """
+    Directory of the grammars built from source.
+
+    Binaries depend on the tree-sitter bindings they were built for, so every bindings
+    version gets a directory of its own.
+    """
+    # Imported here, like the build dependencies below, to keep them out of every run's start-up
+    from importlib import metadata
+    return GRAMMAR_DIR / f"tree-sitter-{metadata.version('tree-sitter')}"
+
+
+def grammar_library_path(name):
+    """
+    Resolve the compiled grammar library for a language, building it on first use.
+
+    A prebuilt binary in GRAMMAR_DIR (e.g. build/tree-sitter-binaries/kotlin.so) wins;
+    otherwise the binary built from the pinned sources in the versioned cache directory
+    is used, and built once if it is not there yet.
+
+    Args:
+        name: Language name, a key of GRAMMAR_SOURCES
+
+    Returns:
+        Path of the grammar library
+    """
+    prebuilt = GRAMMAR_DIR / f"{name}.so"
+    if prebuilt.exists():
+        return prebuilt
+
+    source = GRAMMAR_SOURCES[name]
+    cached = grammar_cache_dir() / f"{name}-{source['revision']}.so"
+    if not cached.exists():
+        build_grammar(name, cached)
+    return cached
+
+
+def build_grammar(name, output_path, source_dir=None):
+    """
+    Compile a grammar from source into a shared library.
+
+    Args:
+        name: Language name, a key of GRAMMAR_SOURCES
+        output_path: Path of the library to write
+        source_dir: Checkout of the grammar repository; the pinned archive is downloaded if None
+    """
+    import shutil
+    import tarfile
+    import tempfile
+    import urllib.request
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if source_dir is None:
+            archive = GRAMMAR_SOURCES[name]['archive']
+            print(f"Building the {name} grammar from {archive} (once per tree-sitter version)")
+            archive_path = os.path.join(work_dir, 'grammar.tar.gz')
+            with urllib.request.urlopen(archive) as response, open(archive_path, 'wb') as f:
+                shutil.copyfileobj(response, f)
+            with tarfile.open(archive_path) as tar:
+                tar.extractall(work_dir, filter='data')
+            source_dir = next(
+                path.parent.parent for path in Path(work_dir).glob('*/src/parser.c')
+            )
+
+        # Build next to the target and move it into place, so concurrent runs never load a partial file
+        tmp_path = output_path.with_suffix(f'.{os.getpid()}.tmp.so')
+        Language.build_library(str(tmp_path), [str(source_dir)])
+        os.replace(tmp_path, output_path)
+
+
+def load_language(name, library_path=None):
+    """
+    Load the tree-sitter language of a grammar.
+
+    Args:
+        name: Language name, e.g. 'kotlin'
+        library_path: Compiled grammar to load, resolved with grammar_library_path if None
+
+    Returns:
+        Tree-sitter language instance
+    """
+    if library_path is None:
+        library_path = grammar_library_path(name)
+    return Language(str(library_path), name)
+
+
+def grammar_digest(library_path):
+    """
+    SHA-256 of a grammar library, remembered next to it while its size and mtime stay the same.
+
+    Hashing a large grammar binary takes longer than validating a file, so it is only
+    done when the binary changed.
+    """
+    library_path = Path(library_path)
+    stat = library_path.stat()
+    digest_path = library_path.with_name(f"{library_path.name}.sha256.json")
+    try:
+        with open(digest_path, 'r', encoding='utf-8') as f:
+            recorded = json.load(f)
+        if recorded['size'] == stat.st_size and recorded['mtime_ns'] == stat.st_mtime_ns:
+            return recorded['sha256']
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+
+    digest = sha256_file(library_path)
+    try:
+        tmp_path = digest_path.with_name(f"{digest_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}, f)
+        os.replace(tmp_path, digest_path)
+    except OSError:
+        # A read-only grammar directory only costs hashing again next time
+        pass
+    return digest
@@ -0,0 +1,98 @@
+def _common_prefix_length(old, new):
+    """Length of the common prefix of two byte strings, compared in slices rather than per byte."""
+    low, high = 0, min(len(old), len(new))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[low:middle] == new[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix_length(old, new, limit):
+    """Length of the common suffix of two byte strings, at most limit bytes."""
+    old_end, new_end = len(old), len(new)
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[old_end - middle:old_end - low] == new[new_end - middle:new_end - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _point(source, offset):
+    """Tree-sitter (row, column) point of a byte offset; columns are counted in bytes."""
+    row = source.count(b'\n', 0, offset)
+    column = offset - (source.rfind(b'\n', 0, offset) + 1)
+    return row, column
+
+
+def source_edit(old, new):
+    """
+    Describe the change from old to new as the single edited range tree-sitter expects.
+
+    Everything between the longest common prefix and the longest common suffix is treated
+    as replaced, which covers the typical regeneration of a file with a few changed lines.
+
+    Args:
+        old: Source the existing tree was parsed from, as bytes
+        new: New source, as bytes
+
+    Returns:
+        Dictionary of Tree.edit keyword arguments
+    """
+    prefix = _common_prefix_length(old, new)
+    suffix = _common_suffix_length(old, new, min(len(old), len(new)) - prefix)
+    old_end = len(old) - suffix
+    new_end = len(new) - suffix
+    return {
+        'start_byte': prefix,
+        'old_end_byte': old_end,
+        'new_end_byte': new_end,
+        'start_point': _point(old, prefix),
+        'old_end_point': _point(old, old_end),
+        'new_end_point': _point(new, new_end),
+    }
+
+
+class IncrementalParser:
+    """
+    Keep the last tree parsed for every file and reparse new versions incrementally.
+
+    The old tree is edited with the changed range and handed back to the parser, so only
+    the nodes around the edit are rebuilt instead of the whole file.
+    """
+
+    def __init__(self):
+        self._trees = {}
+
+    def parse(self, key, parser, source):
+        """
+        Parse a new version of a file, reusing its previous tree when there is one.
+
+        Args:
+            key: Identifies the file, e.g. its path
+            parser: Tree-sitter parser for the file's language
+            source: File content as bytes
+
+        Returns:
+            Tree-sitter tree of source
+        """
+        previous = self._trees.get(key)
+        if previous is None or previous[0] is not parser:
+            tree = parser.parse(source)
+        else:
+            _, old_source, old_tree = previous
+            if old_source == source:
+                return old_tree
+            old_tree.edit(**source_edit(old_source, source))
+            tree = parser.parse(source, old_tree)
+        self._trees[key] = (parser, source, tree)
+        return tree
+
+    def forget(self, key):
+        """Drop the tree kept for a file, e.g. when it was deleted."""
+        self._trees.pop(key, None)
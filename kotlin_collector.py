@@ -0,0 +1,205 @@
+import re
+
+ANNOTATION_CARRIER_TYPES = ('prefix_expression', 'annotated_lambda')
+
+# Every node a fact is read from spans one of its keywords
+FACT_KEYWORDS = {
+    'imports': (b'import',),
+    'functions': (b'fun',),
+    'constructors': (b'val', b'var'),
+    'classes': (b'class', b'interface'),
+}
+FACT_NODE_TYPES = {
+    'imports': ('import_header',),
+    'functions': ('function_declaration', 'infix_expression'),
+    'constructors': ('property_declaration',),
+    'classes': ('class_declaration',),
+}
+ALL_FACTS = tuple(FACT_KEYWORDS)
+
+_keyword_patterns = {}
+
+
+def collect_kotlin_facts(tree, kt_bytes, facts=ALL_FACTS, constructors=None):
+    """
+    Collect the imports, functions with their annotations, constructor calls and class
+    parents the Kotlin validators check, in a single top-down pass over the tree.
+
+    The pass only enters nodes on the way to a declaration keyword (`fun`, `val`, `class`,
+    ...), located with one regex scan of the source, so subtrees without one, such as the
+    statements of a test body, are never visited. When the constructor names a check looks
+    up are given, they replace `val`/`var` as the keywords of the constructors fact, so
+    the properties declared inside function bodies are only entered when they call one of
+    them. Ancestors are kept on a stack while
+    descending, so annotations on enclosing prefix_expression/annotated_lambda nodes are
+    read without walking back up the tree. Text is decoded straight from byte-offset
+    slices of a memoryview over the source.
+
+    Args:
+        tree: Tree-sitter tree parsed from kt_bytes
+        kt_bytes: The Kotlin file content as bytes
+        facts: Subset of ALL_FACTS to collect; the others are returned empty
+        constructors: Names the constructors fact is checked for, or None to collect every
+                      property initializer
+
+    Returns:
+        Dictionary with keys:
+            'imports': List of import paths
+            'functions': List of dicts with 'name' and 'annotations'
+            'constructors': List of names called in property initializers (e.g., val x = ClassName());
+                            with constructors given, it has every one of them that is called, and
+                            possibly others
+            'classes': List of dicts with 'name' and 'parents'
+    """
+    facts = tuple(sorted(facts))
+    constructors = tuple(sorted(constructors)) if constructors is not None else None
+    keyword_pattern = _keyword_patterns.get((facts, constructors))
+    if keyword_pattern is None:
+        keywords = []
+        for fact in facts:
+            if fact == 'constructors' and constructors is not None:
+                keywords.extend(re.escape(name.encode('utf-8')) for name in constructors)
+            else:
+                keywords.extend(FACT_KEYWORDS[fact])
+        keyword_pattern = re.compile(rb'\b(?:' + b'|'.join(keywords) + rb')\b')
+        _keyword_patterns[(facts, constructors)] = keyword_pattern
+    collected_types = {node_type for fact in facts for node_type in FACT_NODE_TYPES[fact]}
+
+    source = memoryview(kt_bytes)
+
+    def text(node):
+        return str(source[node.start_byte:node.end_byte], 'utf8')
+
+    imports = []
+    functions = []
+    constructors = []
+    classes = {}
+
+    offsets = [match.start() for match in keyword_pattern.finditer(kt_bytes)]
+    ancestors = []
+    # Each frame is [children, next child index, first keyword index, keyword end index]
+    frames = [[tree.root_node.children, 0, 0, len(offsets)]]
+
+    while frames:
+        frame = frames[-1]
+        children, position, first, last = frame
+        if first >= last or position >= len(children):
+            frames.pop()
+            if frames:
+                ancestors.pop()
+            continue
+
+        node = children[position]
+        frame[1] = position + 1
+        end_byte = node.end_byte
+        if offsets[first] >= end_byte:
+            continue
+
+        # Keywords first..inside-1 lie in this node, the rest in its next siblings
+        inside = first + 1
+        while inside < last and offsets[inside] < end_byte:
+            inside += 1
+        frame[2] = inside
+
+        node_children = node.children
+        node_type = node.type
+
+        if node_type in collected_types:
+            if node_type == 'import_header':
+                for child in node_children:
+                    if child.type == 'identifier':
+                        imports.append(text(child))
+
+            elif node_type == 'function_declaration':
+                names = [child for child in node_children if child.type == 'simple_identifier']
+                if names:
+                    annotations = _function_annotations(node_children, ancestors, text)
+                    for name in names:
+                        functions.append({'name': text(name), 'annotations': annotations})
+
+            elif node_type == 'infix_expression':
+                # Expression-style declaration: `<modifier> fun Name() { ... }`
+                names = []
+                seen_fun = False
+                for child in node_children:
+                    child_type = child.type
+                    if child_type == 'simple_identifier':
+                        seen_fun = seen_fun or text(child) == 'fun'
+                    elif seen_fun and child_type == 'call_expression':
+                        names.extend(c for c in child.children if c.type == 'simple_identifier')
+                if names:
+                    annotations = _function_annotations(node_children, ancestors, text)
+                    for name in names:
+                        functions.append({'name': text(name), 'annotations': annotations})
+
+            elif node_type == 'property_declaration':
+                has_variable = False
+                for child in node_children:
+                    child_type = child.type
+                    if child_type == 'variable_declaration':
+                        if not has_variable:
+                            has_variable = any(c.type == 'simple_identifier' for c in child.children)
+                    elif has_variable and child_type == 'call_expression':
+                        for c in child.children:
+                            if c.type == 'simple_identifier':
+                                constructors.append(text(c))
+
+            else:
+                names = []
+                parents = []
+                for child in node_children:
+                    child_type = child.type
+                    if child_type == 'type_identifier':
+                        names.append(text(child))
+                    elif child_type == 'delegation_specifier':
+                        parents.extend(_delegated_types(child, text))
+                for name in names:
+                    classes.setdefault(name, [])
+                if names:
+                    classes[names[0]].extend(parents)
+
+        if node_children:
+            ancestors.append(node)
+            frames.append([node_children, 0, first, inside])
+
+    return {
+        'imports': imports,
+        'functions': functions,
+        'constructors': constructors,
+        'classes': [{'name': name, 'parents': parents} for name, parents in classes.items()],
+    }
+
+
+def _function_annotations(anchor_children, ancestors, text):
+    """Annotations in the anchor's modifiers, then on the prefix_expression/annotated_lambda around it."""
+    annotations = []
+    for child in anchor_children:
+        if child.type == 'modifiers':
+            for mod in child.children:
+                if mod.type == 'annotation':
+                    annotations.append(text(mod))
+
+    if ancestors and ancestors[-1].type in ANNOTATION_CARRIER_TYPES:
+        seen = set(annotations)
+        for curr in reversed(ancestors):
+            if curr.type not in ANNOTATION_CARRIER_TYPES:
+                break
+            for child in curr.children:
+                if child.type == 'annotation':
+                    ann_text = text(child)
+                    if ann_text not in seen:
+                        seen.add(ann_text)
+                        annotations.append(ann_text)
+    return annotations
+
+
+def _delegated_types(delegation_specifier, text):
+    """Type names of `constructor_invocation (user_type (type_identifier))` under a delegation specifier."""
+    types = []
+    for invocation in delegation_specifier.children:
+        if invocation.type != 'constructor_invocation':
+            continue
+        for user_type in invocation.children:
+            if user_type.type == 'user_type':
+                types.extend(text(c) for c in user_type.children if c.type == 'type_identifier')
+    return types
@@ -1,38 +1,448 @@
-import csv
+"""
+Merge the execution-results.csv of every task and join them with the validation results.
+
+Rows are streamed one at a time: the headers of all files are unioned first, then every
+execution row is written as soon as it is read, joined with the validation row of the
+same task and model. Only the smaller side of the join is held in memory, as a hash
+index on (task, result file); when even that would exceed --memory-mb, both sides are
+first split into hash partitions on disk and joined one partition at a time, and the
+joined partitions are merged back into the row order of an in-memory join.
+
+Execution rows name their model by its full name (microsoft/phi-4) and validation rows
+by a short one (phi-4), so both sides are keyed by their result file instead: the
+resultPath column, and the file_path column or, for CSVs without it, the file mappings.
+
+    python merge_csv.py
+    python merge_csv.py --output build/merged-execution-results.parquet
+"""
 from pathlib import Path
+import argparse
+import csv
+import heapq
+import json
+import math
+import os
+import tempfile
+import zlib
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 BUILD_DIR = Path("build")
 OUTPUT_FILE = BUILD_DIR / "merged-execution-results.csv"
+VALIDATION_FILE = BUILD_DIR / "validation-results" / "results-target.csv"
+MAPPINGS_FILE = Path("resources") / "config" / "file-mappings-target.json"
+
+DEFAULT_MEMORY_MB = 64
+# Rough size in memory of an indexed row (a dict of str) relative to its CSV text
+ROW_MEMORY_FACTOR = 10
+# Rows buffered per record batch of a Parquet or Arrow output
+BATCH_ROWS = 65536
+
+FORMATS = ('csv', 'parquet', 'arrow')
+
+# Columns carried through a partitioned join to restore the row order of an in-memory one
+EXECUTION_SEQ = "_execution_seq"
+VALIDATION_SEQ = "_validation_seq"
+ORDER_FIELDS = ("_order_0", "_order_1", "_order_2")
+
+
+def find_execution_csvs(build_dir=BUILD_DIR):
+    """All build/test*/execution-results.csv, sorted so the output order does not depend on the file system."""
+    return sorted(Path(build_dir).glob("test*/execution-results.csv"))
+
+
+def read_header(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), [])
+
+
+def union_header(paths, leading=()):
+    """Columns of all files, in order of first appearance, after the leading columns."""
+    header = list(leading)
+    for path in paths:
+        for field in read_header(path):
+            if field not in header:
+                header.append(field)
+    return header
+
+
+def iter_execution_rows(paths):
+    """Rows of the execution-results.csv files, each with the task directory as test_name."""
+    for path in paths:
+        test_name = Path(path).parent.name
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                yield {"test_name": test_name, **row}
+
+
+def iter_rows(paths):
+    for path in paths:
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+
+
+def load_result_names(mappings_path):
+    """
+    Result file of every (model_name, task) of a file mappings JSON.
+
+    Returns:
+        Dict mapping (model_name, task) to the file name, e.g. result1-microsoft_phi-4.kt;
+        empty when the file does not exist
+    """
+    if mappings_path is None or not os.path.exists(mappings_path):
+        return {}
+    with open(mappings_path, 'r', encoding='utf-8') as f:
+        mappings = json.load(f)
+    return {(mapping['model_name'], mapping['task']): Path(mapping['file_path']).name for mapping in mappings}
+
+
+def execution_key(row):
+    return row.get("test_name"), row.get("resultPath")
+
+
+def validation_key_function(result_names):
+    """Key of a validation row: its task and result file, from file_path or else the mappings."""
+    def validation_key(row):
+        file_path = row.get("file_path")
+        name = Path(file_path).name if file_path else result_names.get((row.get("model_name"), row.get("task")))
+        return row.get("task"), name
+    return validation_key
+
+
+class CsvSink:
+    def __init__(self, path, fieldnames):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames, restval="", extrasaction="ignore")
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowSink:
+    """
+    Columnar output through pyarrow: Parquet, or an Arrow IPC (Feather v2) file.
+
+    Every column is a string, as the CSVs are untyped; empty cells become nulls. Rows are
+    buffered in record batches of BATCH_ROWS, so memory stays bounded.
+    """
+
+    def __init__(self, path, fieldnames, file_format):
+        if pyarrow is None:
+            raise RuntimeError(f"Writing {file_format} needs pyarrow (pip install pyarrow)")
+        self.fieldnames = fieldnames
+        self.schema = pyarrow.schema([(name, pyarrow.string()) for name in fieldnames])
+        if file_format == 'parquet':
+            from pyarrow import parquet
+            self.writer = parquet.ParquetWriter(path, self.schema)
+        else:
+            from pyarrow import ipc
+            self.writer = ipc.new_file(path, self.schema)
+        self.columns = {name: [] for name in fieldnames}
+        self.count = 0
+
+    def write(self, row):
+        for name, values in self.columns.items():
+            values.append(row.get(name) or None)
+        self.count += 1
+        if self.count >= BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if self.count:
+            batch = pyarrow.record_batch([self.columns[name] for name in self.fieldnames], schema=self.schema)
+            self.writer.write_batch(batch)
+            self.columns = {name: [] for name in self.fieldnames}
+            self.count = 0
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+def output_format(path, file_format=None):
+    """Format given explicitly, or from the output suffix: .parquet, .arrow or .feather, else CSV."""
+    if file_format:
+        return file_format
+    suffix = Path(path).suffix.lower()
+    if suffix == '.parquet':
+        return 'parquet'
+    if suffix in ('.arrow', '.feather'):
+        return 'arrow'
+    return 'csv'
+
+
+def open_sink(path, fieldnames, file_format):
+    if file_format == 'csv':
+        return CsvSink(path, fieldnames)
+    return ArrowSink(path, fieldnames, file_format)
+
+
+def hash_join(execution_rows, validation_rows, validation_key, emit, index_validation=True):
+    """
+    Left join of execution rows with validation rows, indexing one side in memory.
+
+    Every execution row is emitted once per matching validation row, or once on its own
+    without a match. Validation rows without an execution row are dropped.
+
+    Args:
+        execution_rows: Iterable of execution rows (with test_name)
+        validation_rows: Iterable of validation rows
+        validation_key: Key function of a validation row, see validation_key_function
+        emit: Called with each joined row
+        index_validation: Index the validation rows and stream the execution rows, else the
+                          other way round; index the smaller side
+
+    Returns:
+        Number of execution rows that found a validation row
+    """
+    matched = 0
+    if index_validation:
+        index = {}
+        for row in validation_rows:
+            index.setdefault(validation_key(row), []).append(row)
+        for row in execution_rows:
+            matches = index.get(execution_key(row))
+            if matches:
+                matched += 1
+                for match in matches:
+                    emit({**match, **row})
+            else:
+                emit(row)
+        return matched
+
+    index = {}
+    for row in execution_rows:
+        index.setdefault(execution_key(row), []).append(row)
+    found = set()
+    for match in validation_rows:
+        key = validation_key(match)
+        rows = index.get(key)
+        if rows:
+            found.add(key)
+            for row in rows:
+                emit({**match, **row})
+    # Execution rows without a validation row come last
+    for key, rows in index.items():
+        if key in found:
+            matched += len(rows)
+        else:
+            for row in rows:
+                emit(row)
+    return matched
+
+
+def partition_rows(rows, key_function, fieldnames, count, directory, prefix):
+    """
+    Split rows into count CSV files by the hash of their key, so equal keys share a partition.
+
+    Returns:
+        List of the partition paths
+    """
+    paths = [os.path.join(directory, f"{prefix}-{index}.csv") for index in range(count)]
+    files = [open(path, "w", newline="", encoding="utf-8") for path in paths]
+    try:
+        writers = [csv.DictWriter(f, fieldnames=fieldnames, restval="", extrasaction="ignore") for f in files]
+        for writer in writers:
+            writer.writeheader()
+        for row in rows:
+            key = "\0".join(part or "" for part in key_function(row))
+            writers[zlib.crc32(key.encode("utf-8")) % count].writerow(row)
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def numbered(rows, field):
+    """Rows with their position in a field, so it survives a round trip through partition files."""
+    for seq, row in enumerate(rows):
+        row[field] = seq
+        yield row
+
+
+def partitioned_join(execution_csvs, validation_csvs, validation_key, emit, index_validation, partitions,
+                     execution_header, validation_header, joined_header):
+    """
+    Hash join in partitions spilled to a temporary directory, emitting the rows in the order hash_join does.
+
+    Both sides are numbered before they are split. hash_join emits the rows of one
+    partition in ascending (execution, validation) order when it indexes the validation
+    rows, and in validation order followed by the unmatched execution rows grouped by key
+    otherwise; the joined rows of every partition are written with that order as a sort
+    key, and the partitions are then merged on it, holding one row per partition.
+
+    Returns:
+        Number of execution rows that found a validation row
+    """
+    matched = 0
+    with tempfile.TemporaryDirectory(prefix="merge-csv-") as directory:
+        execution_parts = partition_rows(numbered(iter_execution_rows(execution_csvs), EXECUTION_SEQ), execution_key,
+                                         execution_header + [EXECUTION_SEQ], partitions, directory, "execution")
+        validation_parts = partition_rows(numbered(iter_rows(validation_csvs), VALIDATION_SEQ), validation_key,
+                                          validation_header + [VALIDATION_SEQ], partitions, directory, "validation")
+
+        joined_fieldnames = joined_header + list(ORDER_FIELDS)
+        joined_parts = []
+        for index, (execution_part, validation_part) in enumerate(zip(execution_parts, validation_parts)):
+            path = os.path.join(directory, f"joined-{index}.csv")
+            joined_parts.append(path)
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=joined_fieldnames, restval="", extrasaction="ignore")
+                writer.writeheader()
+                group = [None, None]
+
+                def write_ordered(row):
+                    execution_seq = int(row[EXECUTION_SEQ])
+                    validation_seq = row.get(VALIDATION_SEQ)
+                    if index_validation:
+                        order = (execution_seq, int(validation_seq) + 1 if validation_seq else 0, 0)
+                    elif validation_seq:
+                        order = (0, int(validation_seq), execution_seq)
+                    else:
+                        # Unmatched rows come grouped by key, in order of the key's first row
+                        key = execution_key(row)
+                        if key != group[0]:
+                            group[:] = [key, execution_seq]
+                        order = (1, group[1], execution_seq)
+                    writer.writerow({**row, **dict(zip(ORDER_FIELDS, order))})
+
+                matched += hash_join(iter_rows([execution_part]), iter_rows([validation_part]), validation_key,
+                                     write_ordered, index_validation)
+
+        files = [open(path, newline="", encoding="utf-8") for path in joined_parts]
+        try:
+            readers = [csv.DictReader(f) for f in files]
+            for row in heapq.merge(*readers, key=lambda row: tuple(int(row[field]) for field in ORDER_FIELDS)):
+                emit(row)
+        finally:
+            for f in files:
+                f.close()
+    return matched
+
+
+def merge(execution_csvs, validation_csvs=(), output=OUTPUT_FILE, file_format=None, mappings=MAPPINGS_FILE,
+          memory_bytes=DEFAULT_MEMORY_MB * 1024 * 1024):
+    """
+    Stream the execution results into one file, joined with the validation results.
 
-csv_files = []
+    Args:
+        execution_csvs: execution-results.csv files; their task is the name of their directory
+        validation_csvs: Validation CSVs of run_validation.py, or empty to only merge
+        output: Output file
+        file_format: 'csv', 'parquet' or 'arrow', or None to go by the output suffix
+        mappings: File mappings JSON resolving validation rows without a file_path column
+        memory_bytes: Memory the join index may take; a larger smaller side is joined in
+                      hash partitions spilled to a temporary directory, with the same output
 
-# Find all execution-results.csv under test* directories
-for path in BUILD_DIR.glob("test*/execution-results.csv"):
-    csv_files.append(path)
+    Returns:
+        Dictionary with 'rows' written, 'matched' execution rows and 'partitions' used
+    """
+    execution_csvs = list(execution_csvs)
+    validation_csvs = list(validation_csvs)
+    execution_header = union_header(execution_csvs, ["test_name"])
+    header = list(execution_header)
+    validation_header = union_header(validation_csvs)
+    # The task is already the test_name column
+    header += [field for field in validation_header if field not in header and field != "task"]
 
-if not csv_files:
-    raise FileNotFoundError("No execution-results.csv files found.")
+    validation_key = validation_key_function(load_result_names(mappings))
+    execution_bytes = sum(os.path.getsize(path) for path in execution_csvs)
+    validation_bytes = sum(os.path.getsize(path) for path in validation_csvs)
+    index_validation = validation_bytes <= execution_bytes
+    index_bytes = min(execution_bytes, validation_bytes) * ROW_MEMORY_FACTOR
+    partitions = max(1, math.ceil(index_bytes / memory_bytes))
 
-merged_rows = []
-header = None
+    file_format = output_format(output, file_format)
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    sink = open_sink(output, header, file_format)
+    written = 0
 
-for csv_file in csv_files:
-    test_name = csv_file.parent.name
+    def emit(row):
+        nonlocal written
+        sink.write(row)
+        written += 1
 
-    with csv_file.open(newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
+    try:
+        if partitions == 1:
+            matched = hash_join(iter_execution_rows(execution_csvs), iter_rows(validation_csvs), validation_key,
+                                emit, index_validation)
+        else:
+            matched = partitioned_join(execution_csvs, validation_csvs, validation_key, emit, index_validation,
+                                       partitions, execution_header, validation_header, header)
+    finally:
+        sink.close()
+    return {'rows': written, 'matched': matched, 'partitions': partitions}
 
-        if header is None:
-            header = ["test_name"] + reader.fieldnames
 
-        for row in reader:
-            row_with_test = {"test_name": test_name, **row}
-            merged_rows.append(row_with_test)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Merge the execution-results.csv files and join them with the validation results'
+    )
+    parser.add_argument(
+        '--build-dir',
+        type=str,
+        default=str(BUILD_DIR),
+        help='Directory of the test*/execution-results.csv files (default: build)'
+    )
+    parser.add_argument(
+        '--validation',
+        nargs='+',
+        default=[str(VALIDATION_FILE)],
+        metavar='CSV',
+        help=f'Validation results to join with (default: {VALIDATION_FILE})'
+    )
+    parser.add_argument(
+        '--no-validation',
+        action='store_true',
+        help='Only merge the execution results'
+    )
+    parser.add_argument(
+        '--mappings',
+        type=str,
+        default=str(MAPPINGS_FILE),
+        help=f'File mappings of validation CSVs without a file_path column (default: {MAPPINGS_FILE})'
+    )
+    parser.add_argument(
+        '--output',
+        type=str,
+        default=str(OUTPUT_FILE),
+        help=f'Output file; a .parquet or .arrow suffix picks that format (default: {OUTPUT_FILE})'
+    )
+    parser.add_argument(
+        '--format',
+        choices=FORMATS,
+        help='Output format, overriding the suffix of --output; parquet and arrow need pyarrow'
+    )
+    parser.add_argument(
+        '--memory-mb',
+        type=int,
+        default=DEFAULT_MEMORY_MB,
+        help=f'Memory the join index may take before the join is partitioned on disk (default: {DEFAULT_MEMORY_MB})'
+    )
+    args = parser.parse_args()
+    if args.memory_mb < 1:
+        parser.error('--memory-mb must be at least 1')
 
-# Write merged CSV
-with OUTPUT_FILE.open("w", newline="", encoding="utf-8") as f:
-    writer = csv.DictWriter(f, fieldnames=header)
-    writer.writeheader()
-    writer.writerows(merged_rows)
+    csv_files = find_execution_csvs(args.build_dir)
+    if not csv_files:
+        raise FileNotFoundError("No execution-results.csv files found.")
+    validation_csvs = [] if args.no_validation else args.validation
+    for path in validation_csvs:
+        if not os.path.exists(path):
+            parser.error(f"validation results {path} not found (run run_validation.py, or pass --no-validation)")
+    file_format = output_format(args.output, args.format)
+    if file_format != 'csv' and pyarrow is None:
+        parser.error(f"--format {file_format} needs pyarrow (pip install pyarrow)")
 
-print(f"Merged {len(csv_files)} CSV files into {OUTPUT_FILE}")
+    summary = merge(csv_files, validation_csvs, args.output, file_format, args.mappings, args.memory_mb * 1024 * 1024)
+    print(f"Merged {len(csv_files)} CSV files into {args.output}: {summary['rows']} rows, "
+          f"{summary['matched']} joined with validation results")
+    if summary['partitions'] > 1:
+        print(f"Joined in {summary['partitions']} partitions to stay within {args.memory_mb} MB")
@@ -0,0 +1,418 @@
+"""
+Multi-sample evaluation: pass@1 and pass@k of every (model, task) pair with confidence intervals.
+
+run_generation.py draws one completion per pair at temperature 0, so a single lucky or
+unlucky sample decides is_valid. Here every pair is sampled up to --max-samples times at
+a non-zero temperature, in batches of --batch-size requests. Each batch is saved and
+validated through run_validation.validate_mapping before the next one is drawn, and the
+pair stops early once the Wilson interval of its pass rate is narrower than --ci-width.
+"""
+from pathlib import Path
+from statistics import NormalDist
+import argparse
+import asyncio
+import csv
+import math
+import os
+
+import httpx
+
+from run_generation import (BUILD_DIR, DEFAULT_BASE_URL, DEFAULT_RESPONSE_CACHE_DIR, DEFAULT_RESPONSE_CACHE_MAX_MB,
+                            DEFAULT_TIMEOUT_SECONDS, MODELS, PROMPT_DIR, TASKS, ResponseCache, chat_completion,
+                            group_jobs, load_prompts, plan_jobs, save_result)
+from run_validation import (CSV_FIELDNAMES, DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_MB, ValidationCache, load_parsers,
+                            mapping_languages, validate_mapping)
+
+DEFAULT_OUTPUT_DIR = BUILD_DIR / 'pass-at-k'
+DEFAULT_MAX_SAMPLES = 20
+DEFAULT_MIN_SAMPLES = 8
+DEFAULT_BATCH_SIZE = 4
+DEFAULT_TEMPERATURE = 0.8
+DEFAULT_CI_WIDTH = 0.3
+DEFAULT_CONFIDENCE = 0.95
+
+# Columns of samples.csv: one validation row of run_validation.py per sample
+SAMPLE_FIELDNAMES = CSV_FIELDNAMES[:2] + ['sample', 'seed'] + CSV_FIELDNAMES[2:]
+
+# Columns of pass-at-k.csv: one row per (model, task) pair
+SUMMARY_FIELDNAMES = [
+    'model_name', 'task', 'samples', 'passed', 'failed_requests', 'stopped_early',
+    'pass_at_1', 'pass_at_1_low', 'pass_at_1_high', 'k', 'pass_at_k', 'pass_at_k_low', 'pass_at_k_high',
+]
+
+
+def wilson_interval(passed, samples, confidence=DEFAULT_CONFIDENCE):
+    """
+    Wilson score interval of a pass rate.
+
+    Unlike the normal approximation it stays inside [0, 1] and is not empty when every
+    sample passed or failed, which is the common case with few samples.
+
+    Returns:
+        Tuple of (low, high); (0.0, 1.0) without samples
+    """
+    if samples == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    rate = passed / samples
+    denominator = 1 + z * z / samples
+    center = (rate + z * z / (2 * samples)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / samples + z * z / (4 * samples * samples)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def pass_at_k(samples, passed, k):
+    """
+    Probability that at least one of k samples passes.
+
+    With at least k samples this is the unbiased estimator 1 - C(n - c, k) / C(n, k) of
+    Chen et al. (2021); with fewer, e.g. after an early stop, the pass rate is extrapolated
+    as 1 - (1 - c / n) ** k.
+    """
+    if samples == 0:
+        return 0.0
+    if samples >= k:
+        if samples - passed < k:
+            return 1.0
+        return 1.0 - math.comb(samples - passed, k) / math.comb(samples, k)
+    return 1.0 - (1.0 - passed / samples) ** k
+
+
+def should_stop(passed, samples, min_samples, ci_width, confidence=DEFAULT_CONFIDENCE):
+    """
+    Sequential stopping rule: enough samples were drawn once the pass-rate interval is narrow.
+
+    The interval is recomputed after every batch without correcting for the repeated
+    looks, so it is a sampling budget rule rather than a test at the stated confidence.
+    """
+    if samples < min_samples:
+        return False
+    low, high = wilson_interval(passed, samples, confidence)
+    return high - low <= ci_width
+
+
+def sample_file_name(model_index, model_name, sample, extension):
+    """Name of a sample's file, e.g. result1-microsoft_phi-4.sample3.kt."""
+    return f"result{model_index + 1}-{model_name.replace('/', '_')}.sample{sample}.{extension}"
+
+
+def summary_row(model_name, task_name, samples, passed, failed_requests, stopped_early, k, confidence):
+    """Row of pass-at-k.csv."""
+    low, high = wilson_interval(passed, samples, confidence)
+    return {
+        'model_name': model_name,
+        'task': task_name,
+        'samples': samples,
+        'passed': passed,
+        'failed_requests': failed_requests,
+        'stopped_early': stopped_early,
+        'pass_at_1': f"{passed / samples:.3f}" if samples else '',
+        'pass_at_1_low': f"{low:.3f}",
+        'pass_at_1_high': f"{high:.3f}",
+        'k': k,
+        'pass_at_k': f"{pass_at_k(samples, passed, k):.3f}" if samples else '',
+        # pass@k grows monotonically with the pass rate, so the bounds carry over
+        'pass_at_k_low': f"{1 - (1 - low) ** k:.3f}",
+        'pass_at_k_high': f"{1 - (1 - high) ** k:.3f}",
+    }
+
+
+async def draw_sample(client, semaphore, job, sample, seed, sampling, output_dir, cache):
+    """
+    Generate one sample of a pair and save it next to the pair's result file.
+
+    Returns:
+        Path of the saved sample, or None when the request failed
+    """
+    task = job['task']
+    cache_key = None
+    entry = None
+    if cache is not None:
+        cache_key = cache.key(job['model_name'], job['system_prompt'], job['user_prompt'], sampling)
+        entry = cache.get(cache_key)
+    if entry is not None:
+        content = entry['content']
+    else:
+        async with semaphore:
+            try:
+                content, usage = await chat_completion(client, job['model_name'], job['system_prompt'],
+                                                       job['user_prompt'], sampling)
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                print(f"Error generating {job['model_name']} - {task['name']} sample {sample}: {e!r}")
+                return None
+        if cache is not None:
+            cache.put(cache_key, content, usage, {'seed': seed})
+    result_path = sample_file_name(job['model_index'], job['model_name'], sample, task['extension'])
+    save_result(content, output_dir, task, result_path)
+    return Path(output_dir) / task['name'] / result_path
+
+
+async def evaluate_pair(client, semaphore, job, parsers, validation_cache, writer, output_dir, max_samples,
+                        min_samples, batch_size, temperature, seed, ci_width, confidence, response_cache):
+    """
+    Sample one (model, task) pair in batches until the stopping rule or max_samples ends it.
+
+    Sample i is requested with seed + i, so a rerun draws (and, cached, reuses) the same samples.
+
+    Returns:
+        Row of pass-at-k.csv
+    """
+    kotlin_parser, KOTLIN_LANGUAGE, diff_parser, diff_query = parsers
+    model_name = job['model_name']
+    task_name = job['task']['name']
+    samples = passed = failed_requests = 0
+    drawn = 0
+    stopped_early = False
+    while drawn < max_samples:
+        batch = range(drawn + 1, min(drawn + batch_size, max_samples) + 1)
+        drawn = batch[-1]
+        paths = await asyncio.gather(*(
+            draw_sample(client, semaphore, job, sample, seed + sample,
+                        {'temperature': temperature, 'seed': seed + sample}, output_dir, response_cache)
+            for sample in batch
+        ))
+        for sample, path in zip(batch, paths):
+            if path is None:
+                failed_requests += 1
+                continue
+            mapping = {'model_name': model_name, 'task': task_name, 'file_path': str(path)}
+            row = validate_mapping(mapping, kotlin_parser, KOTLIN_LANGUAGE, diff_parser, diff_query,
+                                   cache=validation_cache)
+            writer.writerow({**row, 'sample': sample, 'seed': seed + sample})
+            samples += 1
+            passed += row['is_valid'] is True
+        if drawn < max_samples and should_stop(passed, samples, min_samples, ci_width, confidence):
+            stopped_early = True
+            break
+
+    row = summary_row(model_name, task_name, samples, passed, failed_requests, stopped_early, max_samples,
+                      confidence)
+    print(f"{model_name} - {task_name}: {passed}/{samples} passed, pass@1 {row['pass_at_1']} "
+          f"[{row['pass_at_1_low']}, {row['pass_at_1_high']}], pass@{max_samples} {row['pass_at_k']}"
+          f"{' (stopped early)' if stopped_early else ''}\n")
+    return row
+
+
+async def evaluate_pass_at_k(tasks, models, base_url=DEFAULT_BASE_URL, output_dir=DEFAULT_OUTPUT_DIR,
+                             max_samples=DEFAULT_MAX_SAMPLES, min_samples=DEFAULT_MIN_SAMPLES,
+                             batch_size=DEFAULT_BATCH_SIZE, temperature=DEFAULT_TEMPERATURE, seed=0,
+                             ci_width=DEFAULT_CI_WIDTH, confidence=DEFAULT_CONFIDENCE, concurrency=1,
+                             timeout=DEFAULT_TIMEOUT_SECONDS, prompt_dir=PROMPT_DIR,
+                             cache_dir=DEFAULT_RESPONSE_CACHE_DIR,
+                             cache_max_bytes=DEFAULT_RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+                             validation_cache_dir=DEFAULT_CACHE_DIR,
+                             validation_cache_max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024):
+    """
+    Sample and validate every (model, task) pair, one model after another.
+
+    Args:
+        tasks: Entries of TASKS to evaluate
+        models: Model names; a model's position numbers its sample files
+        base_url: OpenAI-compatible endpoint
+        output_dir: Directory receiving <task name>/result*.sample<i>.kt|diff, samples.csv and pass-at-k.csv
+        max_samples: Samples per pair at most; also the k of pass@k
+        min_samples: Samples per pair before the stopping rule is applied
+        batch_size: Samples requested, then validated, at once
+        temperature: Sampling temperature
+        seed: Seed of the first sample; sample i uses seed + i
+        ci_width: Stop a pair once the width of its pass-rate interval is at most this
+        confidence: Confidence level of the intervals
+        concurrency: Requests in flight at once
+        timeout: Seconds a request may take
+        prompt_dir: Directory of the prompt files
+        cache_dir: Directory of the response cache, shared with run_generation.py (responses are
+                   keyed by the seed), or None to disable it
+        cache_max_bytes: Size above which least recently used response cache entries are evicted
+        validation_cache_dir: Directory of the validation result cache, shared with
+                              run_validation.py, or None to disable it
+        validation_cache_max_bytes: Size above which least recently used validation cache
+                                    entries are evicted
+
+    Returns:
+        List of pass-at-k.csv rows
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    response_cache = validation_cache = None
+    if cache_dir is not None:
+        response_cache = ResponseCache(cache_dir, cache_max_bytes)
+    if validation_cache_dir is not None:
+        validation_cache = ValidationCache(validation_cache_dir, validation_cache_max_bytes)
+    parsers = load_parsers(languages=mapping_languages([{'task': task['name']} for task in tasks]))
+
+    prompts = {task['name']: load_prompts(task, prompt_dir) for task in tasks}
+    jobs = plan_jobs(tasks, models, 'model')
+    for job in jobs:
+        job['system_prompt'], job['user_prompt'] = prompts[job['task']['name']]
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    summary = []
+    with open(output_dir / 'samples.csv', 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=SAMPLE_FIELDNAMES, extrasaction='ignore')
+        writer.writeheader()
+        async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+            for group in group_jobs(jobs, 'model'):
+                for job in group:
+                    summary.append(await evaluate_pair(
+                        client, semaphore, job, parsers, validation_cache, writer, output_dir, max_samples,
+                        min_samples, batch_size, temperature, seed, ci_width, confidence, response_cache
+                    ))
+                    csvfile.flush()
+
+    tmp_csv = output_dir / 'pass-at-k.csv.tmp'
+    with open(tmp_csv, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=SUMMARY_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(summary)
+    os.replace(tmp_csv, output_dir / 'pass-at-k.csv')
+
+    drawn = sum(row['samples'] + row['failed_requests'] for row in summary)
+    print(f"{drawn} of at most {max_samples * len(summary)} samples drawn "
+          f"({sum(row['stopped_early'] for row in summary)} of {len(summary)} pairs stopped early)")
+    print(f"Results written to {output_dir / 'samples.csv'} and {output_dir / 'pass-at-k.csv'}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Sample every (model, task) pair several times and report pass@1 and pass@k'
+    )
+    parser.add_argument(
+        '--base-url',
+        type=str,
+        default=DEFAULT_BASE_URL,
+        help=f'OpenAI-compatible endpoint (default: {DEFAULT_BASE_URL})'
+    )
+    parser.add_argument(
+        '--models',
+        nargs='+',
+        default=MODELS,
+        metavar='MODEL',
+        help='Models to evaluate, numbered in this order (default: the evaluated models)'
+    )
+    parser.add_argument(
+        '--tasks',
+        nargs='+',
+        choices=[task['name'] for task in TASKS],
+        metavar='TASK',
+        help='Only evaluate these tasks (default: all)'
+    )
+    parser.add_argument(
+        '--output-dir',
+        type=str,
+        default=str(DEFAULT_OUTPUT_DIR),
+        help='Directory receiving the samples, samples.csv and pass-at-k.csv (default: build/pass-at-k/)'
+    )
+    parser.add_argument(
+        '--max-samples',
+        type=int,
+        default=DEFAULT_MAX_SAMPLES,
+        help=f'Samples per pair at most, and the k of pass@k (default: {DEFAULT_MAX_SAMPLES})'
+    )
+    parser.add_argument(
+        '--min-samples',
+        type=int,
+        default=DEFAULT_MIN_SAMPLES,
+        help=f'Samples per pair before a pair may stop early (default: {DEFAULT_MIN_SAMPLES})'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f'Samples generated, then validated, at once (default: {DEFAULT_BATCH_SIZE})'
+    )
+    parser.add_argument(
+        '--temperature',
+        type=float,
+        default=DEFAULT_TEMPERATURE,
+        help=f'Sampling temperature (default: {DEFAULT_TEMPERATURE})'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Seed of the first sample; sample i is requested with seed + i (default: 0)'
+    )
+    parser.add_argument(
+        '--ci-width',
+        type=float,
+        default=DEFAULT_CI_WIDTH,
+        help=f'Stop a pair once its pass-rate interval is at most this wide; 0 always draws '
+             f'--max-samples (default: {DEFAULT_CI_WIDTH})'
+    )
+    parser.add_argument(
+        '--confidence',
+        type=float,
+        default=DEFAULT_CONFIDENCE,
+        help=f'Confidence level of the intervals (default: {DEFAULT_CONFIDENCE})'
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=1,
+        help='Requests in flight at once (default: 1)'
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=DEFAULT_TIMEOUT_SECONDS,
+        help=f'Seconds a request may take (default: {DEFAULT_TIMEOUT_SECONDS})'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Neither reuse nor store responses and validation results'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        default=DEFAULT_RESPONSE_CACHE_DIR,
+        help='Directory of the response cache (default: build/generation-cache next to run_generation.py)'
+    )
+    parser.add_argument(
+        '--cache-max-mb',
+        type=int,
+        default=DEFAULT_RESPONSE_CACHE_MAX_MB,
+        help='Size above which least recently used response cache entries are evicted '
+             f'(default: {DEFAULT_RESPONSE_CACHE_MAX_MB})'
+    )
+    parser.add_argument(
+        '--validation-cache-dir',
+        type=str,
+        default=DEFAULT_CACHE_DIR,
+        help='Directory of the validation result cache (default: build/validation-cache next to run_validation.py)'
+    )
+    parser.add_argument(
+        '--validation-cache-max-mb',
+        type=int,
+        default=DEFAULT_CACHE_MAX_MB,
+        help='Size above which least recently used validation cache entries are evicted '
+             f'(default: {DEFAULT_CACHE_MAX_MB})'
+    )
+    args = parser.parse_args()
+    if args.temperature <= 0:
+        parser.error('--temperature must be above 0, or every sample is the same')
+    if args.batch_size < 1 or args.max_samples < 1:
+        parser.error('--batch-size and --max-samples must be at least 1')
+
+    tasks = [task for task in TASKS if not args.tasks or task['name'] in args.tasks]
+    asyncio.run(evaluate_pass_at_k(
+        tasks,
+        args.models,
+        base_url=args.base_url,
+        output_dir=args.output_dir,
+        max_samples=args.max_samples,
+        min_samples=args.min_samples,
+        batch_size=args.batch_size,
+        temperature=args.temperature,
+        seed=args.seed,
+        ci_width=args.ci_width,
+        confidence=args.confidence,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+        validation_cache_dir=None if args.no_cache else args.validation_cache_dir,
+        validation_cache_max_bytes=args.validation_cache_max_mb * 1024 * 1024,
+    ))
@@ -0,0 +1,99 @@
+import time
+
+
+class RegisteredQuery:
+    """A compiled tree-sitter query whose captures are timed by its registry."""
+
+    def __init__(self, name, query, stats):
+        self.name = name
+        self.query = query
+        self._stats = stats
+
+    def captures(self, node):
+        start = time.perf_counter()
+        captures = self.query.captures(node)
+        stats = self._stats[self.name]
+        stats['matches'] += 1
+        stats['match_seconds'] += time.perf_counter() - start
+        return captures
+
+
+class QueryRegistry:
+    """
+    Compile each named query once per language and hand out the cached query afterwards.
+
+    Compile and match costs are recorded separately per query name, so a timing report
+    can show that compilation happens once while matching happens once per file.
+    """
+
+    def __init__(self):
+        self._sources = {}
+        self._queries = {}
+        self._stats = {}
+
+    def register(self, name, source):
+        """Register the source of a query; it is compiled on first use."""
+        self._sources[name] = source
+        self._stats.setdefault(name, _empty_stats())
+
+    def get(self, language, name):
+        """
+        Return the compiled query for a language, compiling it on first use.
+
+        Args:
+            language: Tree-sitter language instance the query is compiled for
+            name: Name the query source was registered under
+
+        Returns:
+            RegisteredQuery wrapping the compiled query
+        """
+        key = (id(language), name)
+        entry = self._queries.get(key)
+        if entry is None:
+            start = time.perf_counter()
+            query = language.query(self._sources[name])
+            stats = self._stats[name]
+            stats['compiles'] += 1
+            stats['compile_seconds'] += time.perf_counter() - start
+            # Keep the language alive so its id() cannot be reused by another language
+            entry = (language, RegisteredQuery(name, query, self._stats))
+            self._queries[key] = entry
+        return entry[1]
+
+    def precompile(self, language, names):
+        """Compile the given queries up front, e.g. when a worker starts."""
+        for name in names:
+            self.get(language, name)
+
+    def drain_stats(self):
+        """Return the stats recorded since the last call and reset the counters."""
+        drained = {name: dict(stats) for name, stats in self._stats.items()}
+        for stats in self._stats.values():
+            stats.update(_empty_stats())
+        return drained
+
+    def merge_stats(self, stats):
+        """Add stats drained from another registry, e.g. from a worker process."""
+        for name, other in stats.items():
+            own = self._stats.setdefault(name, _empty_stats())
+            for field, value in other.items():
+                own[field] += value
+
+    def timing_report(self):
+        """Format compile cost next to match cost for every query that was used."""
+        lines = [
+            f"{'query':<28}{'compiles':>9}{'compile ms':>12}{'matches':>9}{'match ms':>11}{'ms/match':>10}"
+        ]
+        for name, stats in self._stats.items():
+            if not stats['compiles'] and not stats['matches']:
+                continue
+            per_match = stats['match_seconds'] * 1000 / stats['matches'] if stats['matches'] else 0.0
+            lines.append(
+                f"{name:<28}{stats['compiles']:>9}{stats['compile_seconds'] * 1000:>12.2f}"
+                f"{stats['matches']:>9}{stats['match_seconds'] * 1000:>11.2f}{per_match:>10.3f}"
+            )
+        return '\n'.join(lines)
+
+
+def _empty_stats():
+    return {'compiles': 0, 'compile_seconds': 0.0, 'matches': 0, 'match_seconds': 0.0}
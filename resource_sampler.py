@@ -0,0 +1,385 @@
+from array import array
+from pathlib import Path
+import argparse
+import os
+import struct
+import threading
+import time
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# Channels of every sample: a perf_counter_ns timestamp, then memory in bytes
+CHANNELS = ('time_ns', 'ram_used', 'server_rss', 'server_pss', 'vram_used')
+# Value of a channel whose source does not exist, e.g. VRAM without an AMD GPU
+MISSING = -1
+
+FILE_MAGIC = b'RSMP'
+FILE_VERSION = 1
+# magic, version, channel count, sampling interval in seconds, perf_counter_ns to Unix time offset
+_FILE_HEADER = struct.Struct('<4sHHdq')
+
+# Formats of the samples files: the binary format written while sampling, or Parquet (needs pyarrow)
+SAMPLE_FORMATS = ('bin', 'parquet')
+
+
+class _ProcFile:
+    """A /proc or sysfs file kept open and re-read from offset 0, which regenerates its content."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def read(self):
+        return os.pread(self.fd, 16384, 0)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _open(path):
+    try:
+        return _ProcFile(path)
+    except OSError:
+        return None
+
+
+def _field_kb(data, name):
+    """Value of a 'Name:   1234 kB' line of /proc/meminfo or smaps_rollup in bytes, or None."""
+    start = data.find(name)
+    if start == -1:
+        return None
+    start += len(name)
+    end = data.find(b'kB', start)
+    return int(data[start:end]) * 1024
+
+
+def find_vram_file(sysfs_root='/sys'):
+    """
+    VRAM usage file of the amdgpu card with the most VRAM.
+
+    Args:
+        sysfs_root: Root of sysfs, e.g. a fixture directory in tests
+
+    Returns:
+        Path of <card>/device/mem_info_vram_used, or None without an amdgpu card
+    """
+    best_file = None
+    best_total = -1
+    for card in sorted(Path(sysfs_root, 'class', 'drm').glob('card*')):
+        if '-' in card.name:
+            continue
+        try:
+            total = int((card / 'device' / 'mem_info_vram_total').read_text().strip())
+        except (OSError, ValueError):
+            total = 0
+        if total > best_total:
+            best_file = card / 'device' / 'mem_info_vram_used'
+            best_total = total
+    return best_file
+
+
+def find_pid(process_name, proc_root='/proc'):
+    """PID of the first process whose name (/proc/<pid>/comm) is process_name, or None."""
+    for entry in sorted(os.scandir(proc_root), key=lambda entry: entry.name):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(os.path.join(entry.path, 'comm'), 'r', encoding='utf-8') as f:
+                if f.read().strip() == process_name:
+                    return int(entry.name)
+        except OSError:
+            continue
+    return None
+
+
+class SampleWindow:
+    """
+    Samples taken between ResourceSampler.open_window() and close_window().
+
+    The start values and the peaks of every channel are kept up to date by the sampler;
+    when a path is given the samples are also written to it as they leave the ring buffer.
+    """
+
+    def __init__(self, start_index, start, path=None):
+        self.start = dict(start)
+        self.peak = dict(self.start)
+        self.flushed = start_index
+        self.path = path
+        self.file = None
+
+
+class ResourceSampler:
+    """
+    Sample system RAM, the model server's RSS and PSS, and VRAM from a background thread.
+
+    Samples go into a ring buffer preallocated as one array of int64 values, so memory
+    stays bounded however long a run takes. Windows opened around a request track its
+    start values and peaks, and optionally stream its samples to a binary file (read it
+    with read_samples).
+
+    The sources are read with pread() on files opened once:
+        ram_used     MemTotal - MemAvailable of <proc_root>/meminfo
+        server_rss   Rss of <proc_root>/<server_pid>/smaps_rollup
+        server_pss   Pss of <proc_root>/<server_pid>/smaps_rollup
+        vram_used    <sysfs_root>/class/drm/card*/device/mem_info_vram_used of the largest amdgpu card
+    """
+
+    def __init__(self, interval=0.01, capacity=65536, proc_root='/proc', sysfs_root='/sys', server_pid=None):
+        """
+        Args:
+            interval: Seconds between samples, down to about 0.005
+            capacity: Samples the ring buffer holds; windows are flushed to their files
+                      before it wraps, so this only bounds memory
+            proc_root: Root of procfs, e.g. a fixture directory in tests
+            sysfs_root: Root of sysfs
+            server_pid: PID of the model server process, or None to skip its RSS and PSS
+        """
+        self.interval = interval
+        self.capacity = capacity
+        self.width = len(CHANNELS)
+        self.ring = array('q', bytes(8 * self.width * capacity))
+        self.count = 0
+        self.clock_offset_ns = time.time_ns() - time.perf_counter_ns()
+
+        self.meminfo = _open(os.path.join(proc_root, 'meminfo'))
+        self.smaps = None
+        if server_pid is not None:
+            self.smaps = _open(os.path.join(proc_root, str(server_pid), 'smaps_rollup'))
+        vram_file = find_vram_file(sysfs_root)
+        self.vram = _open(vram_file) if vram_file is not None else None
+
+        self.windows = []
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def read_sample(self):
+        """Read every source once; returns one value per CHANNELS entry."""
+        ram_used = rss = pss = vram_used = MISSING
+        if self.meminfo is not None:
+            data = self.meminfo.read()
+            total = _field_kb(data, b'MemTotal:')
+            available = _field_kb(data, b'MemAvailable:')
+            if total is not None and available is not None:
+                ram_used = total - available
+        if self.smaps is not None:
+            try:
+                data = self.smaps.read()
+            except OSError:
+                # The server exited
+                data = b''
+            rss = _field_kb(data, b'\nRss:')
+            pss = _field_kb(data, b'\nPss:')
+            rss = MISSING if rss is None else rss
+            pss = MISSING if pss is None else pss
+        if self.vram is not None:
+            try:
+                vram_used = int(self.vram.read())
+            except (OSError, ValueError):
+                pass
+        return time.perf_counter_ns(), ram_used, rss, pss, vram_used
+
+    def _store(self, sample):
+        """Append a sample to the ring and the open windows; call with the lock held."""
+        ring = self.ring
+        offset = (self.count % self.capacity) * self.width
+        for index, value in enumerate(sample):
+            ring[offset + index] = value
+        self.count += 1
+        for window in self.windows:
+            peak = window.peak
+            for name, value in zip(CHANNELS, sample):
+                if value > peak[name]:
+                    peak[name] = value
+        # Write out the windows' samples well before the ring wraps over them
+        if self.windows and self.count - min(window.flushed for window in self.windows) >= self.capacity // 2:
+            for window in self.windows:
+                self._flush(window)
+
+    def _flush(self, window):
+        """Write the samples of a window not written yet; call with the lock held."""
+        if window.file is not None and window.flushed < self.count:
+            first = window.flushed % self.capacity
+            last = self.count % self.capacity
+            if first < last:
+                window.file.write(self.ring[first * self.width:last * self.width].tobytes())
+            else:
+                window.file.write(self.ring[first * self.width:].tobytes())
+                window.file.write(self.ring[:last * self.width].tobytes())
+        window.flushed = self.count
+
+    def _run(self):
+        next_time = time.perf_counter()
+        while not self._stop.is_set():
+            sample = self.read_sample()
+            with self.lock:
+                self._store(sample)
+            next_time += self.interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                # Fell behind (slow source or busy machine): skip the missed ticks instead of bursting
+                next_time = time.perf_counter()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='resource-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self.lock:
+            for window in list(self.windows):
+                self._close(window)
+        for source in (self.meminfo, self.smaps, self.vram):
+            if source is not None:
+                source.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def open_window(self, path=None):
+        """
+        Start tracking the samples of a request, beginning with one taken now.
+
+        Args:
+            path: Binary file receiving the window's samples, or None to only track start and peak
+
+        Returns:
+            SampleWindow
+        """
+        sample = self.read_sample()
+        with self.lock:
+            window = SampleWindow(self.count, zip(CHANNELS, sample), path)
+            if path is not None:
+                window.file = open(path, 'wb')
+                write_header(window.file, self.interval, self.clock_offset_ns)
+            self.windows.append(window)
+            self._store(sample)
+        return window
+
+    def close_window(self, window):
+        """Stop tracking a window, ending it with a sample taken now, and close its file."""
+        sample = self.read_sample()
+        with self.lock:
+            self._store(sample)
+            self._close(window)
+
+    def _close(self, window):
+        self._flush(window)
+        if window.file is not None:
+            window.file.close()
+            window.file = None
+        self.windows.remove(window)
+
+
+def write_header(f, interval, clock_offset_ns):
+    """Write the header of a samples file: format, interval, clock offset and channel names."""
+    f.write(_FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, len(CHANNELS), interval, clock_offset_ns))
+    for name in CHANNELS:
+        encoded = name.encode('utf-8')
+        f.write(bytes([len(encoded)]) + encoded)
+
+
+def write_parquet(path, output=None):
+    """
+    Convert a samples file to Parquet, one int64 column per channel.
+
+    The interval and the clock offset are kept in the schema metadata, so read_samples
+    reads both formats alike.
+
+    Args:
+        path: Binary samples file written for a SampleWindow
+        output: Parquet file (default: path with a .parquet suffix instead of .bin)
+
+    Returns:
+        Path of the Parquet file
+    """
+    if pyarrow is None:
+        raise RuntimeError("Writing Parquet samples needs pyarrow (pip install pyarrow)")
+    from pyarrow import parquet
+    series = read_samples(path)
+    output = Path(output) if output is not None else Path(path).with_suffix('.parquet')
+    metadata = {'interval': repr(series['interval']), 'clock_offset_ns': str(series['clock_offset_ns'])}
+    table = pyarrow.table({name: pyarrow.array(series[name], type=pyarrow.int64()) for name in CHANNELS},
+                          metadata=metadata)
+    parquet.write_table(table, output)
+    return output
+
+
+def _read_parquet(path):
+    if pyarrow is None:
+        raise RuntimeError("Reading Parquet samples needs pyarrow (pip install pyarrow)")
+    from pyarrow import parquet
+    table = parquet.read_table(path)
+    metadata = table.schema.metadata or {}
+    series = {
+        'interval': float(metadata.get(b'interval', b'0')),
+        'clock_offset_ns': int(metadata.get(b'clock_offset_ns', b'0')),
+    }
+    for name in table.column_names:
+        series[name] = array('q', table.column(name).to_pylist())
+    return series
+
+
+def read_samples(path):
+    """
+    Read a samples file written by ResourceSampler, or its Parquet conversion.
+
+    Args:
+        path: File written for a SampleWindow, or by write_parquet (.parquet)
+
+    Returns:
+        Dict with 'interval', 'clock_offset_ns' (add to time_ns for Unix nanoseconds) and
+        an array('q') per channel name
+    """
+    if Path(path).suffix == '.parquet':
+        return _read_parquet(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, width, interval, clock_offset_ns = _FILE_HEADER.unpack_from(data)
+    if magic != FILE_MAGIC or version != FILE_VERSION:
+        raise ValueError(f"{path} is not a version {FILE_VERSION} samples file")
+    position = _FILE_HEADER.size
+    names = []
+    for _ in range(width):
+        length = data[position]
+        names.append(data[position + 1:position + 1 + length].decode('utf-8'))
+        position += 1 + length
+
+    values = array('q')
+    values.frombytes(data[position:])
+    series = {'interval': interval, 'clock_offset_ns': clock_offset_ns}
+    for index, name in enumerate(names):
+        series[name] = values[index::width]
+    return series
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Summarise resource samples files written by run_generation.py')
+    parser.add_argument('files', nargs='+', help='Samples files (*.samples.bin, or *.samples.parquet with pyarrow)')
+    args = parser.parse_args()
+
+    for file_path in args.files:
+        series = read_samples(file_path)
+        times = series['time_ns']
+        duration = (times[-1] - times[0]) / 1e9 if len(times) > 1 else 0.0
+        print(f"{file_path}: {len(times)} samples over {duration:.3f} s (interval {series['interval'] * 1000:g} ms)")
+        for name in CHANNELS[1:]:
+            values = [value for value in series[name] if value != MISSING]
+            if values:
+                print(f"  {name:<12} start {values[0] / 2 ** 30:8.3f} GB   peak {max(values) / 2 ** 30:8.3f} GB")
+            else:
+                print(f"  {name:<12} not available")
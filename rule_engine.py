@@ -0,0 +1,174 @@
+import hashlib
+import json
+
+from diff_matcher import RequirementMatcher
+
+# Facts of kotlin_collector each Kotlin rule type reads
+KOTLIN_RULE_FACTS = {
+    'correct_syntax': (),
+    'required_imports': ('imports',),
+    'annotated_functions': ('functions',),
+    'constructor_call': ('constructors',),
+    'parent_class': ('classes',),
+}
+
+# Capture kind of the changed lines each diff rule type is matched against
+DIFF_RULE_KINDS = {
+    'correct_syntax': None,
+    'required_deletions': 'deletion',
+    'required_additions': 'addition',
+}
+
+LANGUAGE_RULE_TYPES = {
+    'kotlin': KOTLIN_RULE_FACTS,
+    'diff': DIFF_RULE_KINDS,
+}
+
+
+def load_rule_spec(spec_path):
+    """
+    Load the task rules from a JSON spec and compile them.
+
+    Args:
+        spec_path: Path of the JSON spec, e.g. resources/config/validation-rules.json
+
+    Returns:
+        Tuple of (tasks, spec_hash): tasks maps every task name to its compiled rules, in
+        spec order, and spec_hash is the SHA-256 of the spec content, which changes
+        whenever a rule does
+    """
+    with open(spec_path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+
+    tasks = {name: compile_task(name, task_spec) for name, task_spec in spec['tasks'].items()}
+    spec_hash = hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+    return tasks, spec_hash
+
+
+def compile_task(name, task_spec):
+    """
+    Check the rules of one task and precompute what evaluating them needs.
+
+    Args:
+        name: Task name, e.g. 'test1-preview'
+        task_spec: Dict with 'language' ('kotlin' or 'diff') and an ordered 'rules' list
+
+    Returns:
+        Dictionary with keys 'name', 'language', 'rules', 'facts' (Kotlin facts to collect)
+        and 'constructors' (names the constructor_call rules look up) for Kotlin tasks; every
+        diff requirement rule carries its matcher
+    """
+    language = task_spec.get('language')
+    if language not in LANGUAGE_RULE_TYPES:
+        raise ValueError(f"Task '{name}' has unknown language '{language}'")
+
+    rule_types = LANGUAGE_RULE_TYPES[language]
+    rules = []
+    facts = set()
+    constructors = set()
+    for rule_spec in task_spec['rules']:
+        rule_type = rule_spec.get('type')
+        if rule_type not in rule_types:
+            raise ValueError(f"Task '{name}' rule '{rule_spec.get('name')}' has unknown {language} type '{rule_type}'")
+
+        rule = dict(rule_spec)
+        if language == 'kotlin':
+            facts.update(KOTLIN_RULE_FACTS[rule_type])
+            if rule_type == 'constructor_call':
+                constructors.add(rule['constructor'])
+        elif rule_type != 'correct_syntax':
+            rule['kind'] = DIFF_RULE_KINDS[rule_type]
+            rule['matcher'] = RequirementMatcher(rule['lines'])
+        rules.append(rule)
+
+    return {
+        'name': name,
+        'language': language,
+        'rules': rules,
+        'facts': tuple(sorted(facts)),
+        'constructors': tuple(sorted(constructors)),
+    }
+
+
+def kotlin_facts_needed(tasks):
+    """Union of the Kotlin facts the given tasks read, so one collector pass serves all of them."""
+    return tuple(sorted({fact for task in tasks for fact in task['facts']}))
+
+
+def kotlin_constructors_needed(tasks):
+    """Union of the constructor names the constructor_call rules of the given tasks look up."""
+    return tuple(sorted({name for task in tasks for name in task['constructors']}))
+
+
+def evaluate_kotlin_task(task, correct_syntax, facts):
+    """
+    Evaluate the rules of a Kotlin task against the facts collected from a file.
+
+    Args:
+        task: Compiled Kotlin task
+        correct_syntax: Whether the file parsed without errors
+        facts: Facts returned by collect_kotlin_facts
+
+    Returns:
+        Dictionary mapping every rule name to True/False, in spec order
+    """
+    validations = {}
+    for rule in task['rules']:
+        rule_type = rule['type']
+        if rule_type == 'correct_syntax':
+            passed = correct_syntax
+
+        elif rule_type == 'required_imports':
+            passed = all(required in facts['imports'] for required in rule['imports'])
+
+        elif rule_type == 'annotated_functions':
+            # A function counts when each listed annotation is part of one of its annotations
+            count = sum(
+                1 for function in facts['functions']
+                if all(any(required in annotation for annotation in function['annotations'])
+                       for required in rule['annotations'])
+            )
+            passed = count >= rule.get('min', 0) and ('max' not in rule or count <= rule['max'])
+
+        elif rule_type == 'constructor_call':
+            passed = rule['constructor'] in facts['constructors']
+
+        else:
+            passed = any(rule['parent'] in c['parents'] for c in facts['classes'])
+
+        validations[rule['name']] = passed
+    return validations
+
+
+def match_diff_task(task, lines, line_numbers):
+    """
+    Locate the required lines of every requirement rule of a diff task.
+
+    Args:
+        task: Compiled diff task
+        lines: Dict with 'deletion' and 'addition' lists of changed line contents
+        line_numbers: Dict with the diff line number of every entry of lines
+
+    Returns:
+        Dictionary mapping every requirement rule name to {required line: [line numbers]}
+    """
+    return {
+        rule['name']: rule['matcher'].match(lines[rule['kind']], line_numbers[rule['kind']])
+        for rule in task['rules'] if rule['type'] != 'correct_syntax'
+    }
+
+
+def evaluate_diff_task(task, correct_syntax, matches):
+    """
+    Evaluate the rules of a diff task from the requirement matches of match_diff_task.
+
+    Returns:
+        Dictionary mapping every rule name to True/False, in spec order
+    """
+    validations = {}
+    for rule in task['rules']:
+        if rule['type'] == 'correct_syntax':
+            validations[rule['name']] = correct_syntax
+        else:
+            validations[rule['name']] = all(matches[rule['name']].values())
+    return validations
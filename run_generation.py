@@ -0,0 +1,797 @@
+from importlib.util import find_spec
+from pathlib import Path
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+
+import httpx
+
+from disk_cache import DiskCache, sha256_bytes
+from resource_sampler import MISSING, SAMPLE_FORMATS, ResourceSampler, find_pid, write_parquet
+from run_history import DEFAULT_HISTORY_DB, RunRecorder, model_key, prompt_hash
+
+REPO_ROOT = Path(__file__).resolve().parent
+PROMPT_DIR = REPO_ROOT / 'resources' / 'prompts'
+BUILD_DIR = REPO_ROOT / 'build'
+
+DEFAULT_BASE_URL = 'http://127.0.0.1:1234/v1'
+DEFAULT_TIMEOUT_SECONDS = 20 * 60
+DEFAULT_SAMPLE_INTERVAL = 0.01
+
+# Sampling parameters of every request, as the notebook sets them; part of the response cache key
+SAMPLING_PARAMS = {'temperature': 0.0}
+
+DEFAULT_RESPONSE_CACHE_DIR = BUILD_DIR / 'generation-cache'
+DEFAULT_RESPONSE_CACHE_MAX_MB = 256
+# Bump when the stored entries change shape, to ignore older entries
+RESPONSE_CACHE_VERSION = 1
+
+MODELS = [
+    'microsoft/phi-4',
+    'openai/gpt-oss-20b',
+    'mistralai/devstral-small-2-2512',
+    'google/gemma-3-27b',
+    'qwen/qwen3-coder-30b',
+]
+
+# Same task list as notebooks/kotlin/code-generation.ipynb; the prompt is resources/prompts/<name>.md
+# and the results go to build/<name>/
+TASKS = [
+    {'name': 'test1-preview', 'system_prompt': 'system-prompt-kotlin.md', 'extension': 'kt'},
+    {'name': 'test2-unit-test', 'system_prompt': 'system-prompt-kotlin.md', 'extension': 'kt'},
+    {'name': 'test3-instrumentation-test', 'system_prompt': 'system-prompt-kotlin.md', 'extension': 'kt'},
+    {'name': 'test4-deprecated-material', 'system_prompt': 'system-prompt-diff.md', 'extension': 'diff'},
+    {'name': 'test5-deprecated-plugin', 'system_prompt': 'system-prompt-diff.md', 'extension': 'diff'},
+]
+
+# Columns of execution-results.csv, as written by the notebook's ModelExecutionResult
+EXECUTION_FIELDNAMES = [
+    'modelName', 'durationSeconds', 'inputTokenCount', 'outputTokenCount', 'totalTokenCount',
+    'startRamGb', 'peakRamGb', 'startVramGb', 'peakVramGb', 'resultPath',
+]
+
+# Columns added in streaming mode (--stream)
+STREAMING_FIELDNAMES = [
+    'ttftMs', 'prefillTokensPerSecond', 'decodeTokensPerSecond',
+    'interTokenP50Ms', 'interTokenP95Ms', 'interTokenMaxMs',
+]
+
+
+def trim_indent(text):
+    """
+    Python version of Kotlin's String.trimIndent(), which the notebook applies to every prompt.
+
+    Drops the first and last lines when they are blank, and removes the smallest indent
+    shared by the non-blank lines.
+    """
+    lines = text.split('\n')
+    if lines and not lines[0].strip():
+        lines = lines[1:]
+    if lines and not lines[-1].strip():
+        lines = lines[:-1]
+    indents = [len(line) - len(line.lstrip()) for line in lines if line.strip()]
+    indent = min(indents, default=0)
+    return '\n'.join(line[indent:] if line.strip() else '' for line in lines)
+
+
+def load_prompts(task, prompt_dir=PROMPT_DIR):
+    """
+    Read the system prompt and the user prompt of a task.
+
+    Args:
+        task: Entry of TASKS
+        prompt_dir: Directory of the prompt files
+
+    Returns:
+        Tuple of (system_prompt, user_prompt)
+    """
+    system_prompt = (Path(prompt_dir) / task['system_prompt']).read_text(encoding='utf-8')
+    user_prompt = (Path(prompt_dir) / f"{task['name']}.md").read_text(encoding='utf-8')
+    return trim_indent(system_prompt), trim_indent(user_prompt)
+
+
+def result_file_name(model_index, model_name, extension):
+    """Name of a result file, e.g. result1-microsoft_phi-4.kt, numbered by the model's position."""
+    return f"result{model_index + 1}-{model_name.replace('/', '_')}.{extension}"
+
+
+def samples_file_name(result_path):
+    """Name of the resource samples file of a result, e.g. result1-microsoft_phi-4.samples.bin."""
+    return Path(result_path).with_suffix('.samples.bin').name
+
+
+class ResponseCache:
+    """
+    Completions keyed by model, prompts and sampling parameters.
+
+    At temperature 0 the same request gives the same completion, so a hit replaces the
+    request. Entries keep the completion, its token usage and the measured columns of the
+    row that generated it.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.store = DiskCache(cache_dir, max_bytes)
+
+    def key(self, model_name, system_prompt, user_prompt, sampling=SAMPLING_PARAMS):
+        request = json.dumps({
+            'version': RESPONSE_CACHE_VERSION,
+            'model': model_name,
+            'system_prompt': system_prompt,
+            'user_prompt': user_prompt,
+            'sampling': sampling,
+        }, sort_keys=True)
+        return sha256_bytes(request.encode('utf-8'))
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def put(self, key, content, usage, row):
+        self.store.put(key, {'content': content, 'usage': usage, 'row': row})
+
+
+def save_result(content, output_dir, task, result_path):
+    """Write a completion to output_dir/<task name>/<result_path>."""
+    task_dir = Path(output_dir) / task['name']
+    task_dir.mkdir(parents=True, exist_ok=True)
+    (task_dir / result_path).write_text(content, encoding='utf-8')
+    print(f"Saved to: {task_dir / result_path}")
+
+
+def _gb(value):
+    return 0.0 if value == MISSING else value / (1024.0 * 1024.0 * 1024.0)
+
+
+class ResourceMonitor:
+    """
+    Start and peak RAM and VRAM usage of each request, like the notebook's ResourceMonitor.
+
+    The values come from a ResourceSampler running for the whole generation run, so a
+    spike shorter than the notebook's 100 ms polling is not missed. Missing sources read as 0.
+    """
+
+    def __init__(self, sampler, samples_format='bin'):
+        self.sampler = sampler
+        self.samples_format = samples_format
+
+    async def measure(self, awaitable, samples_path=None):
+        """
+        Await a request while its RAM and VRAM usage is sampled.
+
+        Args:
+            awaitable: Request to run
+            samples_path: Binary file receiving the request's samples, or None; with the
+                          parquet samples format it is converted once the request is done
+
+        Returns:
+            Tuple of (result, dict with 'startRamGb', 'peakRamGb', 'startVramGb', 'peakVramGb')
+        """
+        window = self.sampler.open_window(samples_path)
+        try:
+            result = await awaitable
+        finally:
+            self.sampler.close_window(window)
+            if samples_path is not None and self.samples_format == 'parquet':
+                write_parquet(samples_path)
+                os.remove(samples_path)
+        stats = {
+            'startRamGb': _gb(window.start['ram_used']),
+            'peakRamGb': _gb(window.peak['ram_used']),
+            'startVramGb': _gb(window.start['vram_used']),
+            'peakVramGb': _gb(window.peak['vram_used']),
+        }
+        return result, stats
+
+
+async def chat_completion(client, model_name, system_prompt, user_prompt, sampling=SAMPLING_PARAMS):
+    """
+    Request one chat completion.
+
+    Args:
+        client: httpx.AsyncClient whose base_url is the /v1 endpoint
+        model_name: Model to generate with
+        system_prompt: System message
+        user_prompt: User message
+        sampling: Sampling parameters of the request, e.g. temperature
+
+    Returns:
+        Tuple of (completion text, usage dict with prompt_tokens, completion_tokens, total_tokens)
+    """
+    response = await client.post('/chat/completions', json={
+        'model': model_name,
+        'messages': [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': user_prompt},
+        ],
+        **sampling,
+    })
+    response.raise_for_status()
+    body = response.json()
+    return body['choices'][0]['message']['content'], body.get('usage') or {}
+
+
+async def chat_completion_stream(client, model_name, system_prompt, user_prompt, sampling=SAMPLING_PARAMS):
+    """
+    Request one chat completion as server-sent events, timing the arrival of every content chunk.
+
+    Args:
+        client: httpx.AsyncClient whose base_url is the /v1 endpoint
+        model_name: Model to generate with
+        system_prompt: System message
+        user_prompt: User message
+        sampling: Sampling parameters of the request, e.g. temperature
+
+    Returns:
+        Tuple of (completion text, usage dict, request start time, arrival times of the
+        content chunks), times from time.perf_counter()
+    """
+    parts = []
+    token_times = []
+    usage = {}
+    start = time.perf_counter()
+    async with client.stream('POST', '/chat/completions', json={
+        'model': model_name,
+        'messages': [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': user_prompt},
+        ],
+        **sampling,
+        'stream': True,
+        # The token counts come in a last chunk of their own
+        'stream_options': {'include_usage': True},
+    }) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith('data:'):
+                continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                break
+            chunk = json.loads(data)
+            if chunk.get('usage'):
+                usage = chunk['usage']
+            for choice in chunk.get('choices') or []:
+                text = (choice.get('delta') or {}).get('content')
+                if text:
+                    token_times.append(time.perf_counter())
+                    parts.append(text)
+    return ''.join(parts), usage, start, token_times
+
+
+def percentile(sorted_values, fraction):
+    """Linearly interpolated percentile of sorted values, e.g. fraction 0.95 for p95."""
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def stream_metrics(start, token_times, input_tokens, output_tokens):
+    """
+    Latency metrics of a streamed completion, as STREAMING_FIELDNAMES columns.
+
+    Every content chunk is taken as one token. Time to first token covers the prompt
+    prefill; decode speed counts the tokens after the first over the time between the
+    first and the last chunk.
+
+    Args:
+        start: Time the request was sent
+        token_times: Arrival times of the content chunks
+        input_tokens: Prompt tokens reported by the server
+        output_tokens: Completion tokens reported by the server, or 0 to count the chunks
+
+    Returns:
+        Dictionary of formatted columns; empty values when no content arrived
+    """
+    if not token_times:
+        return {name: '' for name in STREAMING_FIELDNAMES}
+
+    output_tokens = output_tokens or len(token_times)
+    ttft = token_times[0] - start
+    decode_time = token_times[-1] - token_times[0]
+    gaps = sorted(later - earlier for earlier, later in zip(token_times, token_times[1:])) or [0.0]
+    return {
+        'ttftMs': f"{ttft * 1000:.1f}",
+        'prefillTokensPerSecond': f"{input_tokens / ttft:.2f}" if ttft > 0 else '',
+        'decodeTokensPerSecond': f"{(output_tokens - 1) / decode_time:.2f}" if decode_time > 0 else '',
+        'interTokenP50Ms': f"{percentile(gaps, 0.5) * 1000:.1f}",
+        'interTokenP95Ms': f"{percentile(gaps, 0.95) * 1000:.1f}",
+        'interTokenMaxMs': f"{gaps[-1] * 1000:.1f}",
+    }
+
+
+async def generate(client, semaphore, monitor, job, output_dir, cooldown, stream=False, cache=None):
+    """
+    Run one (task, model) job: request the completion, save it and build its CSV row.
+
+    Args:
+        client: Shared httpx.AsyncClient
+        semaphore: Bounds the number of requests in flight
+        monitor: ResourceMonitor sampling RAM and VRAM during the request into
+                 output_dir/<task name>/result*.samples.bin
+        job: Dict with 'task', 'model_name', 'model_index', 'system_prompt', 'user_prompt'
+        output_dir: Build directory; results go to output_dir/<task name>/
+        cooldown: Seconds to wait after the request before releasing its slot
+        stream: Stream the completion and add the STREAMING_FIELDNAMES columns
+        cache: Optional ResponseCache storing the completion under job['cache_key']
+
+    Returns:
+        Row of execution-results.csv, or None when the request failed
+    """
+    task = job['task']
+    model_name = job['model_name']
+    result_path = result_file_name(job['model_index'], model_name, task['extension'])
+    task_dir = Path(output_dir) / task['name']
+    task_dir.mkdir(parents=True, exist_ok=True)
+    samples_path = task_dir / samples_file_name(result_path)
+
+    async with semaphore:
+        print(f"Generating {model_name} - {task['name']}...")
+        start = time.monotonic()
+        try:
+            if stream:
+                (content, usage, request_start, token_times), resources = await monitor.measure(
+                    chat_completion_stream(client, model_name, job['system_prompt'], job['user_prompt']),
+                    samples_path
+                )
+            else:
+                (content, usage), resources = await monitor.measure(
+                    chat_completion(client, model_name, job['system_prompt'], job['user_prompt']),
+                    samples_path
+                )
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            print(f"Error generating {model_name} - {task['name']}: {e!r}")
+            return None
+        elapsed = time.monotonic() - start
+
+        save_result(content, output_dir, task, result_path)
+
+        if cooldown:
+            # Let RAM and VRAM settle before the next request is measured
+            await asyncio.sleep(cooldown)
+
+    row = {
+        'modelName': model_name,
+        'durationSeconds': int(elapsed),
+        'inputTokenCount': usage.get('prompt_tokens', 0),
+        'outputTokenCount': usage.get('completion_tokens', 0),
+        'totalTokenCount': usage.get('total_tokens', 0),
+        'startRamGb': f"{resources['startRamGb']:.2f}",
+        'peakRamGb': f"{resources['peakRamGb']:.2f}",
+        'startVramGb': f"{resources['startVramGb']:.2f}",
+        'peakVramGb': f"{resources['peakVramGb']:.2f}",
+        'resultPath': result_path,
+        # Not a CSV column: the unrounded duration the run history computes tokens per second from
+        'elapsedSeconds': elapsed,
+    }
+    if stream:
+        row.update(stream_metrics(request_start, token_times, row['inputTokenCount'], row['outputTokenCount']))
+    if cache is not None:
+        cache.put(job['cache_key'], content, usage, row)
+        row['cached'] = 'false'
+    return row
+
+
+def cached_row(job, entry, output_dir):
+    """
+    Save a cached completion as the job's result file and build its CSV row.
+
+    Args:
+        job: Dict with 'task', 'model_name', 'model_index'
+        entry: ResponseCache entry
+        output_dir: Build directory; results go to output_dir/<task name>/
+
+    Returns:
+        Row of execution-results.csv with the measurements of the run that generated it
+    """
+    result_path = result_file_name(job['model_index'], job['model_name'], job['task']['extension'])
+    print(f"Cached {job['model_name']} - {job['task']['name']}")
+    save_result(entry['content'], output_dir, job['task'], result_path)
+    return {**entry['row'], 'modelName': job['model_name'], 'resultPath': result_path, 'cached': 'true'}
+
+
+def write_execution_results(rows, output_csv, fieldnames=EXECUTION_FIELDNAMES):
+    """Write the rows of one task to its execution-results.csv, replacing it."""
+    Path(output_csv).parent.mkdir(parents=True, exist_ok=True)
+    tmp_csv = f"{output_csv}.tmp"
+    with open(tmp_csv, 'w', newline='', encoding='utf-8') as csvfile:
+        # Cached rows may carry columns of the run that generated them, e.g. streaming metrics
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, lineterminator='\n', restval='',
+                                extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_csv, output_csv)
+
+
+def plan_jobs(tasks, models, order='model'):
+    """
+    Order the (task, model) matrix into the list of jobs to run.
+
+    The model server keeps one model loaded, so every change of model between two
+    consecutive requests is a load. The notebook's task-major order (order='task')
+    changes model on every request; model-major order (order='model') loads each model
+    once and runs all its tasks.
+
+    Args:
+        tasks: Entries of TASKS to run
+        models: Model names; a model's position numbers its result files
+        order: 'model' for model-major or 'task' for task-major (the notebook's order)
+
+    Returns:
+        List of dicts with 'task', 'model_name' and 'model_index'
+    """
+    if order == 'model':
+        pairs = [(task, model_index) for model_index in range(len(models)) for task in tasks]
+    elif order == 'task':
+        pairs = [(task, model_index) for task in tasks for model_index in range(len(models))]
+    else:
+        raise ValueError(f"Unknown order: {order}")
+    return [
+        {'task': task, 'model_name': models[model_index], 'model_index': model_index}
+        for task, model_index in pairs
+    ]
+
+
+def count_model_loads(jobs):
+    """Model loads needed to run jobs one after another: the first job's model, then every change of model."""
+    return sum(1 for index, job in enumerate(jobs) if index == 0 or job['model_name'] != jobs[index - 1]['model_name'])
+
+
+def group_jobs(jobs, order):
+    """Split planned jobs into the groups run one after another: one per model, or one per task."""
+    key = 'model_name' if order == 'model' else 'task'
+    groups = []
+    for job in jobs:
+        if groups and groups[-1][0][key] == job[key]:
+            groups[-1].append(job)
+        else:
+            groups.append([job])
+    return groups
+
+
+def print_plan(jobs, order):
+    """Print the planned order of the jobs and the model loads it needs."""
+    print(f"Planned order ({order}-major):")
+    for index, job in enumerate(jobs):
+        load = index == 0 or job['model_name'] != jobs[index - 1]['model_name']
+        print(f"{index + 1:>4}. {job['model_name']:<36}{job['task']['name']:<32}{'load' if load else ''}".rstrip())
+    print(f"\n{len(jobs)} requests, {count_model_loads(jobs)} model loads (swaps)")
+
+
+async def warm_up_model(client, model_name):
+    """
+    Send a throwaway one-token request so the server loads the model before it is measured.
+
+    Returns:
+        Seconds the request took, mostly loading the model
+    """
+    start = time.monotonic()
+    response = await client.post('/chat/completions', json={
+        'model': model_name,
+        'messages': [{'role': 'user', 'content': 'Hi'}],
+        'temperature': 0.0,
+        'max_tokens': 1,
+    })
+    response.raise_for_status()
+    return time.monotonic() - start
+
+
+async def run_generation(tasks, models, base_url=DEFAULT_BASE_URL, output_dir=BUILD_DIR, concurrency=1,
+                         timeout=DEFAULT_TIMEOUT_SECONDS, cooldown=0.0, prompt_dir=PROMPT_DIR, stream=False,
+                         order='model', warm_up=False, cache_dir=None,
+                         cache_max_bytes=DEFAULT_RESPONSE_CACHE_MAX_MB * 1024 * 1024, refresh=False,
+                         sampler=None, history=None, samples_format='bin'):
+    """
+    Generate every task with every model and write the result files and CSVs.
+
+    All requests share one keep-alive connection pool, and at most concurrency of them
+    are in flight at once. The jobs run in groups, one model (or task, in task-major
+    order) after another, so concurrent requests never make the server swap models;
+    every task's execution-results.csv is rewritten after each group.
+
+    Args:
+        tasks: Entries of TASKS to run
+        models: Model names; a model's position numbers its result files
+        base_url: OpenAI-compatible endpoint, e.g. http://127.0.0.1:1234/v1
+        output_dir: Build directory receiving <task name>/result*.kt|diff and execution-results.csv
+        concurrency: Maximum number of requests in flight
+        timeout: Seconds a request may take
+        cooldown: Seconds to wait after each request, e.g. for VRAM to go back to normal
+        prompt_dir: Directory of the prompt files
+        stream: Stream the completions and record their latency metrics (STREAMING_FIELDNAMES)
+        order: 'model' for model-major or 'task' for the notebook's task-major order, see plan_jobs
+        warm_up: In model-major order, load each model with a throwaway request first and
+                 record its time in the modelLoadSeconds column
+        cache_dir: Directory of the response cache, or None to disable it; cached jobs send
+                   no request and get cached=true
+        cache_max_bytes: Size above which least recently used cache entries are evicted
+        refresh: Send every request even when it is cached, and store the new responses
+        sampler: ResourceSampler to measure RAM and VRAM with, started and stopped here
+                 (default: a sample every DEFAULT_SAMPLE_INTERVAL seconds)
+        history: Optional RunRecorder receiving the rows of every group as its CSVs are written
+        samples_format: 'bin' to keep the samples files as written, or 'parquet' to convert
+                        each to result*.samples.parquet (needs pyarrow)
+
+    Returns:
+        Dictionary mapping task names to their rows
+    """
+    if warm_up and order != 'model':
+        raise ValueError("warm_up needs model-major order")
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    if sampler is None:
+        sampler = ResourceSampler(DEFAULT_SAMPLE_INTERVAL)
+    monitor = ResourceMonitor(sampler, samples_format)
+    fieldnames = list(EXECUTION_FIELDNAMES)
+    if warm_up:
+        fieldnames.insert(fieldnames.index('durationSeconds') + 1, 'modelLoadSeconds')
+    if stream:
+        fieldnames += STREAMING_FIELDNAMES
+    cache = None
+    if cache_dir is not None:
+        cache = ResponseCache(cache_dir, cache_max_bytes)
+        fieldnames.append('cached')
+
+    prompts = {task['name']: load_prompts(task, prompt_dir) for task in tasks}
+    jobs = plan_jobs(tasks, models, order)
+    for job in jobs:
+        job['system_prompt'], job['user_prompt'] = prompts[job['task']['name']]
+        if cache is not None:
+            job['cache_key'] = cache.key(job['model_name'], job['system_prompt'], job['user_prompt'])
+
+    rows_by_task = {task['name']: {} for task in tasks}
+    with sampler:
+        async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+            for group in group_jobs(jobs, order):
+                rows = {}
+                if cache is not None and not refresh:
+                    for index, job in enumerate(group):
+                        entry = cache.get(job['cache_key'])
+                        if entry is not None:
+                            rows[index] = cached_row(job, entry, output_dir)
+                requests = [index for index in range(len(group)) if index not in rows]
+
+                load_seconds = None
+                # A model whose tasks are all cached is not loaded at all
+                if warm_up and requests:
+                    model_name = group[0]['model_name']
+                    print(f"Loading {model_name}...")
+                    try:
+                        load_seconds = await warm_up_model(client, model_name)
+                    except httpx.HTTPError as e:
+                        print(f"Error loading {model_name}: {e!r}")
+
+                generated = await asyncio.gather(*(
+                    generate(client, semaphore, monitor, group[index], output_dir, cooldown, stream, cache)
+                    for index in requests
+                ))
+                rows.update(zip(requests, generated))
+                for index, job in enumerate(group):
+                    row = rows[index]
+                    if row is None:
+                        continue
+                    if warm_up:
+                        # The load is counted once, on the first generated row of the model
+                        first = bool(requests) and index == requests[0] and load_seconds is not None
+                        row['modelLoadSeconds'] = f"{load_seconds:.2f}" if first else ''
+                    rows_by_task[job['task']['name']][job['model_index']] = row
+
+                for task_name in sorted({job['task']['name'] for job in group}):
+                    task_rows = [rows_by_task[task_name][index] for index in sorted(rows_by_task[task_name])]
+                    output_csv = Path(output_dir) / task_name / 'execution-results.csv'
+                    write_execution_results(task_rows, output_csv, fieldnames)
+
+                if history is not None:
+                    # The rows of the group, once their CSVs are written, so a crash keeps them
+                    for index, job in enumerate(group):
+                        if rows[index] is None:
+                            continue
+                        task_name = job['task']['name']
+                        # As written to execution-results.csv, so the history can export it again
+                        row = {name: rows[index].get(name, '') for name in fieldnames}
+                        history.add(row, model_key(row['modelName'], row['resultPath']), task_name,
+                                    prompt_hash(*prompts[task_name]), rows[index].get('elapsedSeconds'))
+                    history.flush()
+
+    for task in tasks:
+        print(f"Results written to {Path(output_dir) / task['name'] / 'execution-results.csv'}")
+    return {
+        task_name: [rows[index] for index in sorted(rows)]
+        for task_name, rows in rows_by_task.items()
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Generate the task results with every model through an OpenAI-compatible endpoint'
+    )
+    parser.add_argument(
+        '--base-url',
+        type=str,
+        default=DEFAULT_BASE_URL,
+        help=f'OpenAI-compatible endpoint (default: {DEFAULT_BASE_URL})'
+    )
+    parser.add_argument(
+        '--models',
+        nargs='+',
+        default=MODELS,
+        metavar='MODEL',
+        help='Models to generate with, numbered in this order (default: the evaluated models)'
+    )
+    parser.add_argument(
+        '--tasks',
+        nargs='+',
+        choices=[task['name'] for task in TASKS],
+        metavar='TASK',
+        help='Only run these tasks (default: all)'
+    )
+    parser.add_argument(
+        '--output-dir',
+        type=str,
+        default=str(BUILD_DIR),
+        help='Directory receiving <task>/result*.kt|diff and execution-results.csv (default: build/)'
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=1,
+        help='Requests in flight at once over the shared connection pool (default: 1)'
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=DEFAULT_TIMEOUT_SECONDS,
+        help=f'Seconds a request may take (default: {DEFAULT_TIMEOUT_SECONDS})'
+    )
+    parser.add_argument(
+        '--cooldown',
+        type=float,
+        default=0.0,
+        help='Seconds to wait after each request for RAM and VRAM to settle; the notebook waits 80 (default: 0)'
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Stream the completions and record time to first token, prefill and decode speed and inter-token gaps'
+    )
+    parser.add_argument(
+        '--order',
+        choices=['model', 'task'],
+        default='model',
+        help='Run all tasks of a model before the next model (model), or the notebook order (task) (default: model)'
+    )
+    parser.add_argument(
+        '--warm-up',
+        action='store_true',
+        help='Load each model with a throwaway request first and record it as modelLoadSeconds (model order only)'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Print the planned order and the number of model loads, without sending requests'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Neither reuse nor store responses'
+    )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Send every request even when its response is cached, and store the new responses'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        default=DEFAULT_RESPONSE_CACHE_DIR,
+        help='Directory of the response cache (default: build/generation-cache next to this script)'
+    )
+    parser.add_argument(
+        '--cache-max-mb',
+        type=int,
+        default=DEFAULT_RESPONSE_CACHE_MAX_MB,
+        help='Size above which least recently used cache entries are evicted '
+             f'(default: {DEFAULT_RESPONSE_CACHE_MAX_MB})'
+    )
+    parser.add_argument(
+        '--sample-interval',
+        type=float,
+        default=DEFAULT_SAMPLE_INTERVAL,
+        help=f'Seconds between RAM/VRAM samples, down to 0.005 (default: {DEFAULT_SAMPLE_INTERVAL})'
+    )
+    parser.add_argument(
+        '--samples-format',
+        choices=SAMPLE_FORMATS,
+        default='bin',
+        help='Format of the per-request samples files; parquet needs pyarrow (default: bin)'
+    )
+    parser.add_argument(
+        '--server-pid',
+        type=int,
+        help='PID of the model server, whose RSS and PSS are sampled too'
+    )
+    parser.add_argument(
+        '--server-process',
+        type=str,
+        help='Name of the model server process (as in /proc/<pid>/comm) to sample, instead of --server-pid'
+    )
+    parser.add_argument(
+        '--proc-root',
+        type=str,
+        default='/proc',
+        help='Root of procfs to sample (default: /proc)'
+    )
+    parser.add_argument(
+        '--sysfs-root',
+        type=str,
+        default='/sys',
+        help='Root of sysfs to read VRAM usage from (default: /sys)'
+    )
+    parser.add_argument(
+        '--history',
+        type=str,
+        default=DEFAULT_HISTORY_DB,
+        help='Run history database the run is recorded in (default: build/run-history.sqlite next to this script)'
+    )
+    parser.add_argument(
+        '--no-history',
+        action='store_true',
+        help='Do not record the run in the history database'
+    )
+    args = parser.parse_args()
+    if args.warm_up and args.order != 'model':
+        parser.error('--warm-up needs --order model')
+    if args.samples_format == 'parquet' and find_spec('pyarrow') is None:
+        parser.error('--samples-format parquet needs pyarrow (pip install pyarrow)')
+
+    tasks = [task for task in TASKS if not args.tasks or task['name'] in args.tasks]
+    if args.dry_run:
+        print_plan(plan_jobs(tasks, args.models, args.order), args.order)
+        raise SystemExit(0)
+
+    server_pid = args.server_pid
+    if server_pid is None and args.server_process:
+        server_pid = find_pid(args.server_process, args.proc_root)
+        if server_pid is None:
+            print(f"No {args.server_process} process found, its memory is not sampled")
+    sampler = ResourceSampler(args.sample_interval, proc_root=args.proc_root, sysfs_root=args.sysfs_root,
+                              server_pid=server_pid)
+
+    history = None
+    if not args.no_history:
+        history = RunRecorder(args.history, 'generation', config={
+            'base_url': args.base_url,
+            'sampling': SAMPLING_PARAMS,
+            'stream': args.stream,
+            'order': args.order,
+            'concurrency': args.concurrency,
+        })
+
+    start = time.monotonic()
+    try:
+        asyncio.run(run_generation(
+            tasks,
+            args.models,
+            base_url=args.base_url,
+            output_dir=args.output_dir,
+            concurrency=max(1, args.concurrency),
+            timeout=args.timeout,
+            cooldown=args.cooldown,
+            stream=args.stream,
+            order=args.order,
+            warm_up=args.warm_up,
+            cache_dir=None if args.no_cache else args.cache_dir,
+            cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+            refresh=args.refresh,
+            sampler=sampler,
+            history=history,
+            samples_format=args.samples_format
+        ))
+    finally:
+        if history is not None:
+            history.close()
+            print(f"Recorded as run {history.run_id} in {args.history}")
+    print(f"\nGenerated {len(tasks)} tasks with {len(args.models)} models in {time.monotonic() - start:.1f} s")
@@ -0,0 +1,461 @@
+"""
+Append-only SQLite history of generation and validation runs.
+
+run_generation.py and run_validation.py overwrite their CSVs on every run; they also
+record every run here, under a run id with the git commit, the prompt hashes and every
+row, so trends across runs can be queried:
+
+    python run_history.py runs
+    python run_history.py trend --model qwen/qwen3-coder-30b --task test1-preview --metric tokens_per_second
+    python run_history.py regressions --metric tokens_per_second --window 10 --threshold 0.1
+    python run_history.py export <run id> --task test1-preview --output execution-results.csv
+"""
+from pathlib import Path
+import argparse
+import csv
+import json
+import os
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+
+from disk_cache import sha256_bytes
+
+REPO_ROOT = Path(__file__).resolve().parent
+DEFAULT_HISTORY_DB = REPO_ROOT / 'build' / 'run-history.sqlite'
+
+SCHEMA_VERSION = 1
+# Rows inserted per transaction
+BATCH_ROWS = 500
+
+KINDS = ('generation', 'validation')
+# Line endings of the CSVs each kind of run writes: run_generation.py writes '\n',
+# run_validation.py the csv module default
+LINE_TERMINATORS = {'generation': '\n', 'validation': '\r\n'}
+
+# Result files as named by run_generation.py and pass_at_k.py, e.g. result1-microsoft_phi-4.kt
+_RESULT_NAME = re.compile(r'result\d+-(.+?)(?:\.sample\d+)?\.(?:kt|diff)$')
+
+# Metrics stored as columns of the results table, and whether a higher value is better
+METRICS = {
+    'tokens_per_second': True,
+    'decode_tokens_per_second': True,
+    'duration_seconds': False,
+    'ttft_ms': False,
+    'output_tokens': None,
+    'input_tokens': None,
+    'peak_ram_gb': False,
+    'peak_vram_gb': False,
+    'is_valid': True,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    git_commit TEXT,
+    git_dirty INTEGER,
+    host TEXT,
+    command TEXT,
+    config TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    kind TEXT NOT NULL,
+    run_time REAL NOT NULL,
+    model TEXT NOT NULL,
+    task TEXT NOT NULL,
+    prompt_hash TEXT,
+    cached INTEGER NOT NULL DEFAULT 0,
+    is_valid INTEGER,
+    duration_seconds REAL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    tokens_per_second REAL,
+    decode_tokens_per_second REAL,
+    ttft_ms REAL,
+    peak_ram_gb REAL,
+    peak_vram_gb REAL,
+    row TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_model_task_time ON results (model, task, run_time);
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id);
+"""
+
+
+def git_state(repo_root=REPO_ROOT):
+    """
+    Commit checked out in repo_root, and whether tracked files have uncommitted changes.
+
+    Returns:
+        Tuple of (commit hash or None outside a git checkout, dirty flag or None)
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo_root, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_root,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def prompt_hash(system_prompt, user_prompt):
+    """Hash of the prompts a result was generated from."""
+    return sha256_bytes(json.dumps([system_prompt, user_prompt]).encode('utf-8'))[:16]
+
+
+def model_key(model_name, result_path=None):
+    """
+    Key a model is recorded under, the same for generation and validation runs.
+
+    Generation rows name a model in full (microsoft/phi-4) and validation rows by the short
+    name of the file mappings (phi-4). Both are keyed by the model part of their result file
+    name instead (microsoft_phi-4), which is the full name with '/' replaced.
+
+    Args:
+        model_name: Model name of the row, used when result_path is not a result file name
+        result_path: Result file of the row, e.g. build/test1-preview/result1-microsoft_phi-4.kt
+    """
+    if result_path:
+        match = _RESULT_NAME.match(Path(result_path).name)
+        if match:
+            return match.group(1)
+    return model_name.replace('/', '_')
+
+
+def _number(value, kind=float):
+    """A CSV cell as a number, or None when it is empty or not a number."""
+    if value is None or value == '':
+        return None
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _bool(value):
+    if value is None or value == '':
+        return None
+    return int(value is True or str(value).lower() == 'true')
+
+
+def connect(db_path):
+    """Open (and create) a history database."""
+    if str(db_path) != ':memory:':
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(db_path))
+    connection.row_factory = sqlite3.Row
+    # WAL lets queries run while a run is being recorded; NORMAL syncs once per checkpoint
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(_SCHEMA)
+    connection.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+    return connection
+
+
+class RunRecorder:
+    """
+    Records the rows of one run, in transactions of BATCH_ROWS rows.
+
+    Rows are the CSV rows of the run: execution-results.csv rows (with their task) for a
+    generation run, results CSV rows for a validation run. Each is stored whole, as JSON,
+    next to the indexed metric columns, so the CSVs can be exported again.
+    """
+
+    def __init__(self, db_path, kind, config=None, run_id=None, repo_root=REPO_ROOT):
+        """
+        Args:
+            db_path: History database
+            kind: 'generation' or 'validation'
+            config: JSON-serialisable settings of the run, e.g. the sampling parameters
+            run_id: Id of the run (default: a new UUID)
+            repo_root: Checkout whose git commit is recorded
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown run kind: {kind}")
+        self.connection = connect(db_path)
+        self.kind = kind
+        self.run_id = run_id or uuid.uuid4().hex
+        self.started_at = time.time()
+        self.pending = []
+        self.count = 0
+        commit, dirty = git_state(repo_root)
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO runs (run_id, kind, started_at, git_commit, git_dirty, host, command, config) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.run_id, kind, self.started_at, commit, None if dirty is None else int(dirty),
+                 socket.gethostname(), ' '.join(sys.argv), json.dumps(config or {}, sort_keys=True))
+            )
+
+    def add(self, row, model, task, prompt_digest=None, duration=None):
+        """
+        Queue one CSV row of the run, whose model is keyed by model_key(); written with the next batch.
+
+        durationSeconds is whole seconds, too coarse for tokens per second (0 under a second),
+        so a generation row's tokens_per_second comes from duration, the unrounded request
+        time in seconds. It is left empty without one, e.g. for a row cached before it was
+        kept, or when it is 0.
+        """
+        if self.kind == 'generation':
+            output_tokens = _number(row.get('outputTokenCount'), int)
+            values = (
+                None,
+                duration if duration is not None else _number(row.get('durationSeconds')),
+                _number(row.get('inputTokenCount'), int),
+                output_tokens,
+                output_tokens / duration if duration and output_tokens is not None else None,
+                _number(row.get('decodeTokensPerSecond')),
+                _number(row.get('ttftMs')),
+                _number(row.get('peakRamGb')),
+                _number(row.get('peakVramGb')),
+            )
+        else:
+            values = (_bool(row.get('is_valid')),) + (None,) * 8
+        self.pending.append((self.run_id, self.kind, self.started_at, model, task, prompt_digest,
+                             _bool(row.get('cached')) or 0) + values + (json.dumps(row, default=str),))
+        if len(self.pending) >= BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO results (run_id, kind, run_time, model, task, prompt_hash, cached, is_valid, '
+                'duration_seconds, input_tokens, output_tokens, tokens_per_second, decode_tokens_per_second, '
+                'ttft_ms, peak_ram_gb, peak_vram_gb, row) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                self.pending
+            )
+        self.count += len(self.pending)
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def list_runs(connection, kind=None, limit=20):
+    """Latest runs with their number of results, newest first."""
+    query = ('SELECT runs.*, COUNT(results.id) AS results FROM runs LEFT JOIN results USING (run_id) '
+             + ('WHERE runs.kind = ? ' if kind else '')
+             + 'GROUP BY runs.run_id ORDER BY runs.started_at DESC LIMIT ?')
+    return connection.execute(query, ((kind,) if kind else ()) + (limit,)).fetchall()
+
+
+def _metric(metric):
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric}; one of {', '.join(METRICS)}")
+    return metric
+
+
+def trend(connection, model, task, metric, last=50):
+    """
+    A metric of one model and task over its last runs, oldest first; cached results are left out.
+
+    Returns:
+        List of rows with run_id, run_time, git_commit and value
+    """
+    metric = _metric(metric)
+    rows = connection.execute(
+        f'SELECT results.run_id, results.run_time, runs.git_commit, results.{metric} AS value '
+        'FROM results JOIN runs USING (run_id) '
+        f'WHERE results.model = ? AND results.task = ? AND results.cached = 0 AND results.{metric} IS NOT NULL '
+        'ORDER BY results.run_time DESC LIMIT ?',
+        (model, task, last)
+    ).fetchall()
+    return rows[::-1]
+
+
+def regressions(connection, metric, window=10, threshold=0.1, model=None):
+    """
+    (model, task) pairs whose latest value of a metric is worse than the median of the runs before it.
+
+    Args:
+        connection: History database
+        metric: Entry of METRICS with a direction
+        window: Earlier runs the latest one is compared with
+        threshold: Relative change counted as a regression, e.g. 0.1 for 10%
+        model: Only check this model
+
+    Returns:
+        List of dicts with model, task, latest, baseline (median), change (relative) and run_id,
+        worst first
+    """
+    metric = _metric(metric)
+    higher_is_better = METRICS[metric]
+    if higher_is_better is None:
+        raise ValueError(f"{metric} has no better direction")
+    rows = connection.execute(
+        'SELECT model, task, run_id, value FROM ('
+        f'  SELECT model, task, run_id, {metric} AS value,'
+        '          ROW_NUMBER() OVER (PARTITION BY model, task ORDER BY run_time DESC, id DESC) AS position'
+        f'  FROM results WHERE cached = 0 AND {metric} IS NOT NULL' + (' AND model = ?' if model else '') +
+        ') WHERE position <= ? ORDER BY model, task, position',
+        ((model,) if model else ()) + (window + 1,)
+    ).fetchall()
+
+    by_pair = {}
+    for row in rows:
+        by_pair.setdefault((row['model'], row['task']), []).append(row)
+    found = []
+    for (pair_model, task), pair_rows in by_pair.items():
+        if len(pair_rows) < 2:
+            continue
+        latest = pair_rows[0]['value']
+        earlier = sorted(row['value'] for row in pair_rows[1:])
+        middle = len(earlier) // 2
+        baseline = earlier[middle] if len(earlier) % 2 else (earlier[middle - 1] + earlier[middle]) / 2
+        if baseline == 0:
+            change = 0.0 if latest == 0 else (1.0 if latest > 0 else -1.0)
+        else:
+            change = (latest - baseline) / abs(baseline)
+        worse = -change if higher_is_better else change
+        if worse > threshold:
+            found.append({'model': pair_model, 'task': task, 'latest': latest, 'baseline': baseline,
+                          'change': change, 'run_id': pair_rows[0]['run_id'], 'worse': worse})
+    found.sort(key=lambda item: item['worse'], reverse=True)
+    return found
+
+
+def export_rows(connection, run_id, task=None):
+    """
+    The CSV rows recorded for a run, in recording order.
+
+    Args:
+        connection: History database
+        run_id: Run id, or a unique prefix of one
+        task: Only the rows of this task, e.g. to rebuild one execution-results.csv
+
+    Returns:
+        Tuple of (run kind, fieldnames in order of first appearance, rows)
+    """
+    runs = list(connection.execute('SELECT run_id, kind FROM runs WHERE run_id LIKE ?', (f"{run_id}%",)))
+    if len(runs) != 1:
+        raise ValueError(f"{'No' if not runs else 'More than one'} run matches {run_id}")
+    query = 'SELECT row FROM results WHERE run_id = ?' + (' AND task = ?' if task else '') + ' ORDER BY id'
+    fieldnames = []
+    rows = []
+    for record in connection.execute(query, (runs[0]['run_id'],) + ((task,) if task else ())):
+        row = json.loads(record['row'])
+        for field in row:
+            if field not in fieldnames:
+                fieldnames.append(field)
+        rows.append(row)
+    return runs[0]['kind'], fieldnames, rows
+
+
+def write_export(output, kind, fieldnames, rows):
+    """
+    Write exported rows as the CSV the run wrote, with its line endings.
+
+    Args:
+        output: Text file opened with newline=''
+        kind: Run kind, 'generation' or 'validation'
+        fieldnames: Columns, from export_rows
+        rows: Rows, from export_rows
+    """
+    writer = csv.DictWriter(output, fieldnames=fieldnames, restval='', lineterminator=LINE_TERMINATORS[kind])
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def _time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+
+def _format(value):
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query the history of generation and validation runs')
+    parser.add_argument('--db', type=str, default=DEFAULT_HISTORY_DB,
+                        help='History database (default: build/run-history.sqlite next to this script)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    runs_parser = commands.add_parser('runs', help='List the latest runs')
+    runs_parser.add_argument('--kind', choices=KINDS, help='Only runs of this kind')
+    runs_parser.add_argument('--limit', type=int, default=20, help='Runs to list (default: 20)')
+
+    trend_parser = commands.add_parser('trend', help='A metric of one model and task over its last runs')
+    trend_parser.add_argument('--model', required=True, help='Model name, e.g. microsoft/phi-4')
+    trend_parser.add_argument('--task', required=True, help='Task name')
+    trend_parser.add_argument('--metric', choices=list(METRICS), default='tokens_per_second',
+                              help='Metric (default: tokens_per_second)')
+    trend_parser.add_argument('--last', type=int, default=50, help='Runs to show (default: 50)')
+
+    regressions_parser = commands.add_parser('regressions',
+                                             help='Pairs whose latest run is worse than the runs before it')
+    directed_metrics = [name for name, higher_is_better in METRICS.items() if higher_is_better is not None]
+    regressions_parser.add_argument('--metric', choices=directed_metrics, default='tokens_per_second',
+                                    help='Metric (default: tokens_per_second)')
+    regressions_parser.add_argument('--window', type=int, default=10,
+                                    help='Earlier runs whose median is the baseline (default: 10)')
+    regressions_parser.add_argument('--threshold', type=float, default=0.1,
+                                    help='Relative change counted as a regression (default: 0.1)')
+    regressions_parser.add_argument('--model', help='Only check this model')
+
+    export_parser = commands.add_parser('export', help='Write the CSV rows of a run')
+    export_parser.add_argument('run_id', help='Run id, or a unique prefix of one')
+    export_parser.add_argument('--task', help='Only the rows of this task, as in its execution-results.csv')
+    export_parser.add_argument('--output', help='Output CSV (default: standard output)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"no history database at {args.db}")
+    connection = connect(args.db)
+
+    if args.command == 'runs':
+        print(f"{'run id':<34}{'kind':<12}{'started':<21}{'commit':<10}{'results':>8}")
+        for run in list_runs(connection, args.kind, args.limit):
+            commit = (run['git_commit'] or '')[:8] + ('+' if run['git_dirty'] else '')
+            print(f"{run['run_id']:<34}{run['kind']:<12}{_time(run['started_at']):<21}{commit:<10}{run['results']:>8}")
+
+    elif args.command == 'trend':
+        rows = trend(connection, model_key(args.model), args.task, args.metric, args.last)
+        if not rows:
+            print(f"No {args.metric} recorded for {args.model} - {args.task}")
+        for row in rows:
+            print(f"{_time(row['run_time'])}  {(row['git_commit'] or '')[:8]:<10}{row['run_id'][:12]:<14}"
+                  f"{_format(row['value']):>12}")
+        if len(rows) > 1:
+            values = [row['value'] for row in rows]
+            print(f"\n{len(values)} runs: min {_format(min(values))}, mean {_format(sum(values) / len(values))}, "
+                  f"max {_format(max(values))}, latest {_format(values[-1])}")
+
+    elif args.command == 'regressions':
+        found = regressions(connection, args.metric, args.window, args.threshold,
+                            model_key(args.model) if args.model else None)
+        for item in found:
+            print(f"{item['model']:<36}{item['task']:<30}{_format(item['latest']):>12} vs "
+                  f"{_format(item['baseline']):>12} ({item['change']:+.1%})  run {item['run_id'][:12]}")
+        print(f"{len(found)} regressions of {args.metric} beyond {args.threshold:.0%}")
+        if found:
+            sys.exit(1)
+
+    elif args.command == 'export':
+        try:
+            kind, fieldnames, rows = export_rows(connection, args.run_id, args.task)
+        except ValueError as e:
+            parser.error(str(e))
+        output = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+        try:
+            write_export(output, kind, fieldnames, rows)
+        finally:
+            if args.output:
+                output.close()
@@ -1,408 +1,648 @@
 from pathlib import Path
-from tree_sitter import Language, Parser
+from tree_sitter import Parser
+from diff_sections import iter_diff_sections
+from disk_cache import DiskCache, sha256_bytes, sha256_file
+from file_watcher import FileWatcher
+from grammars import grammar_digest, grammar_library_path, load_language
+from incremental_parser import IncrementalParser
+from kotlin_collector import collect_kotlin_facts
+from query_registry import QueryRegistry
+from stage_timer import NULL_TIMER, STAGES, StageTimer, TraceWriter
+from run_history import DEFAULT_HISTORY_DB, RunRecorder, model_key
+from similarity import GOLDEN_REFERENCE_DIR, SIMILARITY_FIELDNAMES, SimilarityIndex
+from rule_engine import (evaluate_diff_task, evaluate_kotlin_task, kotlin_constructors_needed, kotlin_facts_needed,
+                         load_rule_spec, match_diff_task)
 import csv
 import argparse
+import io
 import json
+import math
+import multiprocessing
 import os
+import time
 
-def validate_preview_generation(kt_bytes, parser, KOTLIN_LANGUAGE):
-    """Validate Kotlin code for Preview generation task."""
-    tree = parser.parse(kt_bytes)
-    root_node = tree.root_node
+RULES_SPEC_PATH = Path(__file__).resolve().parent / 'resources' / 'config' / 'validation-rules.json'
 
-    correct_syntax = not root_node.has_error
+# Bump when the meaning of a rule type changes; edits to the spec change its hash by themselves
+RULE_ENGINE_VERSION = 1
 
-    query = KOTLIN_LANGUAGE.query("""
-        ; Pattern 1: Standard declarations
-        (function_declaration (simple_identifier) @func_name)
+# Task rules are compiled once from the spec, in spec order
+TASK_RULES, RULES_SPEC_HASH = load_rule_spec(RULES_SPEC_PATH)
 
-        ; Pattern 2: Expression-style (infix 'fun')
-        (infix_expression
-            (simple_identifier) @keyword_fun
-            (#eq? @keyword_fun "fun")
-            (call_expression (simple_identifier) @func_name)
-        )
-    """)
+KOTLIN_TASKS = [name for name, task in TASK_RULES.items() if task['language'] == 'kotlin']
+DIFF_TASKS = [name for name, task in TASK_RULES.items() if task['language'] == 'diff']
 
-    all_functions = []
+# Part of every cache key, so cached validation results are invalidated whenever a rule changes
+VALIDATION_RULES_VERSION = f"{RULE_ENGINE_VERSION}:{RULES_SPEC_HASH[:16]}"
 
-    for node, capture_name in query.captures(root_node):
-        if capture_name == "func_name":
-            func_name = node.text.decode('utf8')
-            annotations = []
-
-            anchor = node
-            while anchor and anchor.type not in ('function_declaration', 'infix_expression'):
-                anchor = anchor.parent
-
-            if anchor:
-                for child in anchor.children:
-                    if child.type == 'modifiers':
-                        for mod in child.children:
-                            if mod.type == 'annotation':
-                                annotations.append(mod.text.decode('utf8'))
-
-                curr = anchor.parent
-                while curr and curr.type in ('prefix_expression', 'annotated_lambda'):
-                    for child in curr.children:
-                        if child.type == 'annotation':
-                            ann_text = child.text.decode('utf8')
-                            if ann_text not in annotations:
-                                annotations.append(ann_text)
-                    curr = curr.parent
-
-                all_functions.append({
-                    'name': func_name,
-                    'annotations': annotations
-                })
-
-    total_preview_composable_functions = sum(
-        1 for func in all_functions
-        if any('@Preview' in ann for ann in func['annotations']) and
-        any('@Composable' in ann for ann in func['annotations'])
-    )
-    has_preview_composable = total_preview_composable_functions > 0
 
-    validations = {
-        'correct_syntax': correct_syntax,
-        'has_preview_and_composable': has_preview_composable
-    }
+def _compiled_tasks(tasks, language):
+    """Look up the compiled rules of the given task names, checking they are tasks of language."""
+    compiled = []
+    for task in tasks:
+        if task not in TASK_RULES or TASK_RULES[task]['language'] != language:
+            raise ValueError(f"Unknown {'Kotlin' if language == 'kotlin' else language} task: {task}")
+        compiled.append(TASK_RULES[task])
+    return compiled
 
-    return validations
 
+def validate_kotlin_tasks(kt_bytes, tasks, kotlin_parser, tree=None, timer=NULL_TIMER):
+    """
+    Validate Kotlin code against the rules of one or more tasks.
 
-def validate_unit_test_generation(kt_bytes, parser, KOTLIN_LANGUAGE):
-    """Validate Kotlin code for Unit Test generation task."""
-    tree = parser.parse(kt_bytes)
-    root_node = tree.root_node
+    The file is parsed once and its facts are collected in a single pass for the union of
+    what the tasks' rules read, so checking N tasks costs about as much as checking one.
 
-    correct_syntax = not root_node.has_error
+    Args:
+        kt_bytes: The Kotlin file content as bytes
+        tasks: List of Kotlin task names
+        kotlin_parser: Tree-sitter parser instance for Kotlin
+        tree: Tree already parsed from kt_bytes, parsed here if None
+        timer: StageTimer recording the parse, query (fact collection) and check stages
+
+    Returns:
+        Dictionary mapping every task to its dictionary of validations
+    """
+    compiled = _compiled_tasks(tasks, 'kotlin')
 
-    query = KOTLIN_LANGUAGE.query("""
-        ; 1. Capture all import paths
-        (import_header (identifier) @import_path)
+    if tree is None:
+        with timer.stage('parse'):
+            tree = kotlin_parser.parse(kt_bytes)
+    correct_syntax = not tree.root_node.has_error
 
-        ; 2. Capture function names and their surrounding annotations
-        (function_declaration (simple_identifier) @func_name)
-        (infix_expression
-            (simple_identifier) @kw_fun (#eq? @kw_fun "fun")
-            (call_expression (simple_identifier) @func_name))
+    facts = kotlin_facts_needed(compiled)
+    with timer.stage('query'):
+        results = (collect_kotlin_facts(tree, kt_bytes, facts=facts, constructors=kotlin_constructors_needed(compiled))
+                   if facts else {})
 
-        ; 3. Capture constructor calls in properties (e.g., val x = ClassName())
-        (property_declaration
-            (variable_declaration (simple_identifier) @prop_name)
-            (call_expression (simple_identifier) @constructor_name))
-    """)
+    with timer.stage('check'):
+        return {task['name']: evaluate_kotlin_task(task, correct_syntax, results) for task in compiled}
 
-    results = {
-        "imports": [],
-        "functions": [],
-        "constructors": []
-    }
+
+def collect_changed_lines(root_node, query):
+    """
+    Collect the content of the deleted and added lines of a parsed diff.
+
+    Args:
+        root_node: Root node of the parsed diff
+        query: Tree-sitter query capturing deletion and addition lines
+
+    Returns:
+        Tuple of (lines, line_numbers), both dictionaries with keys 'deletion' and
+        'addition' holding parallel lists of line contents and diff line numbers
+    """
+    lines = {'deletion': [], 'addition': []}
+    line_numbers = {'deletion': [], 'addition': []}
 
     for node, capture_name in query.captures(root_node):
-        text = node.text.decode('utf8')
-
-        if capture_name == "import_path":
-            results["imports"].append(text)
-
-        elif capture_name == "func_name":
-            annotations = []
-            anchor = node
-            while anchor and anchor.type not in ('function_declaration', 'infix_expression'):
-                anchor = anchor.parent
-
-            if anchor:
-                for child in anchor.children:
-                    if child.type == 'modifiers':
-                        for mod in child.children:
-                            if mod.type == 'annotation':
-                                annotations.append(mod.text.decode('utf8'))
-
-                curr = anchor.parent
-                while curr and curr.type in ('prefix_expression', 'annotated_lambda'):
-                    for child in curr.children:
-                        if child.type == 'annotation':
-                            ann_text = child.text.decode('utf8')
-                            if ann_text not in annotations:
-                                annotations.append(ann_text)
-                    curr = curr.parent
-
-            results["functions"].append({"name": text, "annotations": annotations})
-
-        elif capture_name == "constructor_name":
-            results["constructors"].append(text)
-
-    required_imports = [
-        "com.google.samples.apps.nowinandroid.core.model.data.FollowableTopic",
-        "com.google.samples.apps.nowinandroid.core.model.data.Topic",
-    ]
-    has_all_required_imports = all(req_import in results['imports'] for req_import in required_imports)
+        if capture_name in lines:
+            text = node.text.decode('utf-8')
+            # Remove - or + character and leading & trailing whitespaces
+            lines[capture_name].append(text[1:].strip() if len(text) > 1 else "")
+            line_numbers[capture_name].append(node.start_point[0] + 1)
 
-    has_use_case_constructor = "GetFollowableTopicsUseCase" in results['constructors']
+    return lines, line_numbers
 
-    test_functions_count = sum(
-        1 for f in results['functions']
-        if any("@Test" in a for a in f['annotations'])
-    )
-    has_exactly_two_test_functions = (test_functions_count == 2)
 
-    validations = {
-        'correct_syntax': correct_syntax,
-        'has_all_required_imports': has_all_required_imports,
-        'has_use_case_constructor': has_use_case_constructor,
-        'has_exactly_two_test_functions': has_exactly_two_test_functions
-    }
+def validate_diff_tasks(diff_text, tasks, diff_parser, diff_query, tree=None, timer=NULL_TIMER):
+    """
+    Validate a diff against the rules of one or more tasks.
 
-    return validations
+    The diff is parsed and its changed lines are captured once, whatever the number of tasks.
 
+    Args:
+        diff_text: The diff file content as string
+        tasks: List of diff task names
+        diff_parser: Tree-sitter parser instance for diff files
+        diff_query: Tree-sitter query for diff parsing
+        tree: Tree already parsed from the UTF-8 encoded diff_text, parsed here if None
+        timer: StageTimer recording the parse, query (changed-line captures) and check stages
 
-def validate_instrumentation_test_generation(kt_bytes, parser, KOTLIN_LANGUAGE):
-    """Validate Kotlin code for Instrumentation Test generation task."""
-    tree = parser.parse(kt_bytes)
-    root_node = tree.root_node
+    Returns:
+        Dictionary mapping every task to its dictionary of validations
+    """
+    compiled = _compiled_tasks(tasks, 'diff')
 
-    correct_syntax = not root_node.has_error
+    if tree is None:
+        with timer.stage('parse'):
+            tree = diff_parser.parse(bytes(diff_text, 'utf-8'))
+    correct_syntax = not tree.root_node.has_error
 
-    query = KOTLIN_LANGUAGE.query("""
-        (import_header (identifier) @import_path)
+    with timer.stage('query'):
+        lines, line_numbers = collect_changed_lines(tree.root_node, diff_query)
 
-        (function_declaration (simple_identifier) @func_name)
-        (infix_expression
-            (simple_identifier) @kw_fun (#eq? @kw_fun "fun")
-            (call_expression (simple_identifier) @func_name))
+    with timer.stage('check'):
+        return {
+            task['name']: evaluate_diff_task(task, correct_syntax, match_diff_task(task, lines, line_numbers))
+            for task in compiled
+        }
 
-        (class_declaration
-            (type_identifier) @class_name
-            (delegation_specifier
-                (constructor_invocation
-                    (user_type
-                        (type_identifier) @parent_class)))?
-            (class_body)?)
-    """)
 
-    results = {
-        "imports": [],
-        "functions": [],
-        "classes": {}
-    }
+def validate_diff_sections(file_path, task, diff_parser, diff_query, timer=NULL_TIMER):
+    """
+    Validate a large diff one file section at a time, with memory bounded by the largest section.
 
-    for node, capture_name in query.captures(root_node):
-        text = node.text.decode('utf8')
-
-        if capture_name == "import_path":
-            results["imports"].append(text)
-
-        elif capture_name == "func_name":
-            annotations = []
-            anchor = node
-            while anchor and anchor.type not in ('function_declaration', 'infix_expression'):
-                anchor = anchor.parent
-
-            if anchor:
-                for child in anchor.children:
-                    if child.type == 'modifiers':
-                        for mod in child.children:
-                            if mod.type == 'annotation':
-                                annotations.append(mod.text.decode('utf8'))
-                curr = anchor.parent
-                while curr and curr.type in ('prefix_expression', 'annotated_lambda'):
-                    for child in curr.children:
-                        if child.type == 'annotation':
-                            if (ann := child.text.decode('utf8')) not in annotations:
-                                annotations.append(ann)
-                    curr = curr.parent
-
-            results["functions"].append({"name": text, "annotations": annotations})
-
-        elif capture_name == "class_name":
-            if text not in results["classes"]:
-                results["classes"][text] = {"parents": []}
-
-        elif capture_name == "parent_class":
-            # Find which class this parent belongs to by traversing up
-            curr = node
-            while curr:
-                if curr.type == 'class_declaration':
-                    for child in curr.children:
-                        if child.type == 'type_identifier':
-                            class_name = child.text.decode('utf8')
-                            if class_name in results["classes"]:
-                                results["classes"][class_name]["parents"].append(text)
-                            break
-                    break
-                curr = curr.parent
-
-    results["classes"] = [{"name": k, "parents": v["parents"]} for k, v in results["classes"].items()]
-
-    required_import = "com.google.samples.apps.nowinandroid.core.database.model.TopicEntity"
-    has_topic_entity_import = required_import in results["imports"]
-
-    implements_database_test = any("DatabaseTest" in c["parents"] for c in results["classes"])
-
-    test_functions_count = sum(
-        1 for f in results['functions']
-        if any("@Test" in a for a in f['annotations'])
-    )
-    has_at_least_5_tests = (test_functions_count >= 5)
+    Every section is parsed and matched on its own and the results are merged: the syntax
+    is correct when every section parses, and a required line counts as found when any
+    section contains it.
 
-    validations = {
-        'correct_syntax': correct_syntax,
-        'has_topic_entity_import': has_topic_entity_import,
-        'implements_database_test': implements_database_test,
-        'has_at_least_5_tests': has_at_least_5_tests
-    }
+    Args:
+        file_path: Path of the diff file
+        task: Diff task name
+        diff_parser: Tree-sitter parser instance for diff files
+        diff_query: Tree-sitter query for diff parsing
+        timer: StageTimer; the stages of all sections add up
 
-    return validations
+    Returns:
+        Dictionary of validations, as validate_diff_tasks
+    """
+    compiled = _compiled_tasks([task], 'diff')[0]
+    found = None
+    syntax_errors = []
 
+    for section in iter_diff_sections(file_path):
+        description = f"section {section['index']} ({section['name']}, line {section['first_line']})"
+        try:
+            with timer.stage('read'):
+                # Decode like Path.read_text() (locale encoding, universal newlines)
+                diff_text = io.TextIOWrapper(io.BytesIO(section['data'])).read()
+            with timer.stage('parse'):
+                tree = diff_parser.parse(bytes(diff_text, 'utf-8'))
+            if tree.root_node.has_error:
+                syntax_errors.append(description)
+
+            with timer.stage('query'):
+                lines, line_numbers = collect_changed_lines(tree.root_node, diff_query)
+                offset = section['first_line'] - 1
+                for kind in lines:
+                    line_numbers[kind] = [line_number + offset for line_number in line_numbers[kind]]
+
+            with timer.stage('check'):
+                matches = match_diff_task(compiled, lines, line_numbers)
+                if found is None:
+                    found = matches
+                else:
+                    for rule_name, rule_matches in matches.items():
+                        for requirement, found_on in rule_matches.items():
+                            found[rule_name][requirement].extend(found_on)
+        except Exception as e:
+            raise ValueError(f"{description}: {e}") from e
 
-def validate_material_diff(diff_text, parser, query):
-    """Validate diff for Material deprecation task."""
-    tree = parser.parse(bytes(diff_text, 'utf-8'))
-    root_node = tree.root_node
+    if found is None:
+        found = match_diff_task(compiled, {'deletion': [], 'addition': []}, {'deletion': [], 'addition': []})
+    if syntax_errors:
+        print(f"Syntax errors in {file_path}: {', '.join(syntax_errors)}")
 
-    correct_syntax = not root_node.has_error
+    return evaluate_diff_task(compiled, not syntax_errors, found)
 
-    captures = query.captures(root_node)
 
-    deletions = []
-    additions = []
+def process_diff_file(diff_text, task, diff_parser, diff_query, tree=None, timer=NULL_TIMER):
+    """
+    Process a single diff file and return validations.
 
-    for node, capture_name in captures:
-        text = node.text.decode('utf-8')
-        # Remove - or + character and leading & trailing whitespaces
-        content = text[1:].strip() if len(text) > 1 else ""
-        if capture_name == 'deletion':
-            deletions.append(content)
-        elif capture_name == 'addition':
-            additions.append(content)
+    Args:
+        diff_text: The diff file content as string
+        task: One of DIFF_TASKS
+        diff_parser: Tree-sitter parser instance for diff files
+        diff_query: Tree-sitter query for diff parsing
+        tree: Tree already parsed from the UTF-8 encoded diff_text, parsed here if None
+        timer: StageTimer recording the parse, query and check stages
 
-    required_deletions = [
-        "colors = TopAppBarDefaults.centerAlignedTopAppBarColors(",
-        "colors: TopAppBarColors = TopAppBarDefaults.centerAlignedTopAppBarColors(),",
-    ]
-    required_additions = [
-        "colors = TopAppBarDefaults.topAppBarColors(",
-        "colors: TopAppBarColors = TopAppBarDefaults.topAppBarColors(),",
-    ]
+    Returns:
+        Dictionary of validations
+    """
+    return validate_diff_tasks(diff_text, [task], diff_parser, diff_query, tree, timer)[task]
 
-    contains_all_deletions = all(
-        any(req in deletion for deletion in deletions)
-        for req in required_deletions
-    )
 
-    contains_all_additions = all(
-        any(req in addition for addition in additions)
-        for req in required_additions
-    )
+def process_kotlin_file(kt_bytes, task, kotlin_parser, KOTLIN_LANGUAGE, tree=None, timer=NULL_TIMER):
+    """
+    Process a single Kotlin file and return validations.
 
-    validations = {
-        'correct_syntax': correct_syntax,
-        'contains_all_deletions': contains_all_deletions,
-        'contains_all_additions': contains_all_additions
-    }
+    Args:
+        kt_bytes: The Kotlin file content as bytes
+        task: One of KOTLIN_TASKS
+        kotlin_parser: Tree-sitter parser instance for Kotlin
+        KOTLIN_LANGUAGE: Kotlin language instance
+        tree: Tree already parsed from kt_bytes, parsed here if None
+        timer: StageTimer recording the parse, query and check stages
 
-    return validations
+    Returns:
+        Dictionary of validations
+    """
+    return validate_kotlin_tasks(kt_bytes, [task], kotlin_parser, tree, timer)[task]
 
 
-def validate_plugin_diff(diff_text, parser, query):
-    """Validate diff for Plugin migration task."""
-    tree = parser.parse(bytes(diff_text, 'utf-8'))
-    root_node = tree.root_node
+LANGUAGES = ('kotlin', 'diff')
 
-    correct_syntax = not root_node.has_error
+# Diffs at least this large are validated section by section instead of as one tree
+DIFF_STREAM_MIN_BYTES = 16 * 1024 * 1024
 
-    captures = query.captures(root_node)
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / 'build' / 'validation-cache'
+DEFAULT_CACHE_MAX_MB = 256
 
-    deletions = []
-    additions = []
+DIFF_QUERY_SOURCE = """
+    (deletion) @deletion
+    (addition) @addition
+"""
 
-    for node, capture_name in captures:
-        text = node.text.decode('utf-8')
-        # Remove - or + character and leading & trailing whitespaces
-        content = text[1:].strip() if len(text) > 1 else ""
-        if capture_name == 'deletion':
-            deletions.append(content)
-        elif capture_name == 'addition':
-            additions.append(content)
+# Queries are compiled once per language and shared by every file of a run
+query_registry = QueryRegistry()
+query_registry.register('diff', DIFF_QUERY_SOURCE)
 
-    required_deletions = [
-        "import org.jetbrains.kotlin.gradle.dsl.KotlinTopLevelExtension",
-        "private inline fun <reified T : KotlinTopLevelExtension> Project.configureKotlin() = configure<T> {",
-    ]
-    required_additions = [
-        "import org.jetbrains.kotlin.gradle.dsl.KotlinBaseExtension",
-        "private inline fun <reified T : KotlinBaseExtension> Project.configureKotlin() = configure<T> {"
-    ]
+CSV_FIELDNAMES = ['model_name', 'task', 'is_valid', 'success_validation_count',
+                  'failed_validation_count', 'success_validation_list', 'failed_validation_list',
+                  'file_path', 'cache_status']
 
-    contains_all_deletions = all(
-        any(req in deletion for deletion in deletions)
-        for req in required_deletions
-    )
+# Columns added with --stage-times: milliseconds spent in each stage of validating the file
+STAGE_FIELDNAMES = [f"{stage}_ms" for stage in STAGES]
+# Stage added to STAGES by --similarity
+SIMILARITY_STAGE = 'similarity'
 
-    contains_all_additions = all(
-        any(req in addition for addition in additions)
-        for req in required_additions
-    )
 
-    validations = {
-        'correct_syntax': correct_syntax,
-        'contains_all_deletions': contains_all_deletions,
-        'contains_all_additions': contains_all_additions
-    }
+class ValidationCache:
+    """
+    Validation results keyed by file content, task, rule version and grammar binary.
+
+    A hit returns the stored validations dict, so the file is neither parsed nor queried.
+    """
+
+    def __init__(self, cache_dir, max_bytes, kotlin_library=None, diff_library=None, writers=1):
+        self.store = DiskCache(cache_dir, max_bytes, writers)
+        self.libraries = {'kotlin': kotlin_library, 'diff': diff_library}
+        # Grammars are only hashed once a file of their language is looked up
+        self.grammar_hashes = {}
+
+    def key(self, file_bytes, task):
+        return self.key_for_digest(sha256_bytes(file_bytes), task)
+
+    def key_for_digest(self, content_digest, task):
+        """Key for a file whose SHA-256 was computed without reading it whole, e.g. a streamed diff."""
+        language = 'diff' if task in DIFF_TASKS else 'kotlin'
+        grammar_hash = self.grammar_hashes.get(language)
+        if grammar_hash is None:
+            grammar_hash = grammar_digest(self.libraries[language] or grammar_library_path(language))
+            self.grammar_hashes[language] = grammar_hash
+        return sha256_bytes(
+            f"{content_digest}:{task}:{VALIDATION_RULES_VERSION}:{grammar_hash}".encode('utf-8')
+        )
 
-    return validations
+    def get(self, key):
+        return self.store.get(key)
 
+    def put(self, key, validations):
+        self.store.put(key, validations)
 
-def process_diff_file(diff_text, task, diff_parser, diff_query):
+
+def mapping_languages(file_mappings):
+    """Languages whose grammar is needed to validate the given mappings."""
+    tasks = {mapping['task'] for mapping in file_mappings}
+    languages = []
+    if tasks.intersection(KOTLIN_TASKS):
+        languages.append('kotlin')
+    if tasks.intersection(DIFF_TASKS):
+        languages.append('diff')
+    return tuple(languages)
+
+
+def load_parsers(kotlin_library=None, diff_library=None, languages=LANGUAGES):
     """
-    Process a single diff file and return validations.
+    Load the Kotlin and diff grammars and build their parsers.
 
     Args:
-        diff_text: The diff file content as string
-        task: Either 'material_diff' or 'plugin_diff'
+        kotlin_library: Path to the compiled Kotlin tree-sitter grammar (default: resolved by grammars.py)
+        diff_library: Path to the compiled diff tree-sitter grammar (default: resolved by grammars.py)
+        languages: Grammars to load; the parsers of the other languages are None
+
+    Returns:
+        Tuple of (kotlin_parser, KOTLIN_LANGUAGE, diff_parser, diff_query)
+    """
+    kotlin_parser = KOTLIN_LANGUAGE = None
+    if 'kotlin' in languages:
+        kotlin_parser = Parser()
+        KOTLIN_LANGUAGE = load_language('kotlin', kotlin_library)
+        kotlin_parser.set_language(KOTLIN_LANGUAGE)
+
+    diff_parser = diff_query = None
+    if 'diff' in languages:
+        diff_parser = Parser()
+        DIFF_LANGUAGE = load_language('diff', diff_library)
+        diff_parser.set_language(DIFF_LANGUAGE)
+        diff_query = query_registry.get(DIFF_LANGUAGE, 'diff')
+
+    return kotlin_parser, KOTLIN_LANGUAGE, diff_parser, diff_query
+
+
+def similarity_columns(similarity, task, file_bytes, tree, kotlin_parser, diff_parser):
+    """
+    Score a file against the golden references of its task.
+
+    Args:
+        similarity: SimilarityIndex
+        task: One of KOTLIN_TASKS or DIFF_TASKS
+        file_bytes: The file content as bytes
+        tree: Tree already parsed by the validation, or None to parse it here
+        kotlin_parser: Tree-sitter parser instance for Kotlin
         diff_parser: Tree-sitter parser instance for diff files
-        diff_query: Tree-sitter query for diff parsing
 
     Returns:
-        Dictionary of validations
+        SIMILARITY_FIELDNAMES columns
     """
-    if task == 'test4-deprecated-material':
-        return validate_material_diff(diff_text, diff_parser, diff_query)
-    elif task == 'test5-deprecated-plugin':
-        return validate_plugin_diff(diff_text, diff_parser, diff_query)
+    if task in DIFF_TASKS:
+        language, parser = 'diff', diff_parser
+        # The diff validators parse the text decoded like Path.read_text()
+        source = bytes(io.TextIOWrapper(io.BytesIO(file_bytes)).read(), 'utf-8')
     else:
-        raise ValueError(f"Unknown diff task: {task}")
+        language, parser, source = 'kotlin', kotlin_parser, file_bytes
+    if tree is None:
+        tree = parser.parse(source)
+    return similarity.score_tree(task, language, tree, source, parser)
 
 
-def process_kotlin_file(kt_bytes, task, kotlin_parser, KOTLIN_LANGUAGE):
+def validate_mapping(mapping, kotlin_parser, KOTLIN_LANGUAGE, diff_parser=None, diff_query=None, cache=None,
+                     trees=None, timer=NULL_TIMER, similarity=None):
     """
-    Process a single Kotlin file and return validations.
+    Validate the file referenced by a single mapping and build its CSV row.
 
     Args:
-        kt_bytes: The Kotlin file content as bytes
-        task: One of 'preview_generation', 'unit_test_generation', 'instrumentation_test_generation'
+        mapping: Dict with keys: 'model_name', 'task', 'file_path'
         kotlin_parser: Tree-sitter parser instance for Kotlin
         KOTLIN_LANGUAGE: Kotlin language instance
+        diff_parser: Tree-sitter parser instance for diff files (required for diff tasks)
+        diff_query: Tree-sitter query for diff parsing (required for diff tasks)
+        cache: Optional ValidationCache; a hit skips parsing entirely
+        trees: Optional IncrementalParser keeping the previous tree of the file, so a
+               regenerated file is reparsed incrementally
+        timer: Optional StageTimer; its read_ms, parse_ms, query_ms and check_ms columns are
+               added to the row
+        similarity: Optional SimilarityIndex; the SIMILARITY_FIELDNAMES columns are added to
+                    the row, reusing the tree of the validation (diffs of DIFF_STREAM_MIN_BYTES
+                    or more are not scored)
 
     Returns:
-        Dictionary of validations
+        Result row as a dictionary, or None when the task is unknown
+    """
+    model_name = mapping['model_name']
+    task = mapping['task']
+    file_path = Path(mapping['file_path'])
+
+    print(f"Processing {model_name} - {task}...")
+
+    if task not in DIFF_TASKS and task not in KOTLIN_TASKS:
+        print(f"Unknown task: {task}")
+        return None
+
+    cache_status = 'off' if cache is None else 'miss'
+
+    try:
+        # Large diffs are never read whole; they are hashed and validated in sections
+        streamed = task in DIFF_TASKS and file_path.stat().st_size >= DIFF_STREAM_MIN_BYTES
+        with timer.stage('read'):
+            file_bytes = None if streamed else file_path.read_bytes()
+
+        validations = None
+        tree = None
+        if cache is not None:
+            if streamed:
+                cache_key = cache.key_for_digest(sha256_file(file_path), task)
+            else:
+                cache_key = cache.key(file_bytes, task)
+            validations = cache.get(cache_key)
+            if validations is not None:
+                cache_status = 'hit'
+
+        if validations is None:
+            if task in DIFF_TASKS and (diff_parser is None or diff_query is None):
+                raise ValueError("diff_parser and diff_query are required for diff tasks")
+            if task in KOTLIN_TASKS and kotlin_parser is None:
+                raise ValueError("kotlin_parser is required for Kotlin tasks")
+
+            if streamed:
+                validations = validate_diff_sections(file_path, task, diff_parser, diff_query, timer)
+
+            elif task in DIFF_TASKS:
+                with timer.stage('read'):
+                    # Decode like Path.read_text() (locale encoding, universal newlines)
+                    diff_text = io.TextIOWrapper(io.BytesIO(file_bytes)).read()
+                if trees is not None:
+                    with timer.stage('parse'):
+                        tree = trees.parse(mapping['file_path'], diff_parser, bytes(diff_text, 'utf-8'))
+                elif similarity is not None:
+                    # Parsed here so the similarity stage can reuse the tree
+                    with timer.stage('parse'):
+                        tree = diff_parser.parse(bytes(diff_text, 'utf-8'))
+                validations = process_diff_file(diff_text, task, diff_parser, diff_query, tree, timer)
+
+            else:
+                if trees is not None:
+                    with timer.stage('parse'):
+                        tree = trees.parse(mapping['file_path'], kotlin_parser, file_bytes)
+                elif similarity is not None:
+                    with timer.stage('parse'):
+                        tree = kotlin_parser.parse(file_bytes)
+                validations = process_kotlin_file(file_bytes, task, kotlin_parser, KOTLIN_LANGUAGE, tree, timer)
+
+            if cache is not None:
+                cache.put(cache_key, validations)
+
+        similarity_row = {}
+        if similarity is not None and not streamed:
+            with timer.stage(SIMILARITY_STAGE):
+                similarity_row = similarity_columns(similarity, task, file_bytes, tree, kotlin_parser, diff_parser)
+
+        success_validations = [k for k, v in validations.items() if v]
+        failed_validations = [k for k, v in validations.items() if not v]
+
+        is_valid = len(failed_validations) == 0
+
+        row = {
+            'model_name': model_name,
+            'task': task,
+            'is_valid': is_valid,
+            'success_validation_count': len(success_validations),
+            'failed_validation_count': len(failed_validations),
+            'success_validation_list': ', '.join(success_validations) if success_validations else 'None',
+            'failed_validation_list': ', '.join(failed_validations) if failed_validations else 'None',
+            'file_path': mapping['file_path'],
+            'cache_status': cache_status,
+            **similarity_row,
+        }
+
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        row = {
+            'model_name': model_name,
+            'task': task,
+            'is_valid': False,
+            'success_validation_count': 0,
+            'failed_validation_count': 0,
+            'success_validation_list': 'None',
+            'failed_validation_list': f'Error: {str(e)}',
+            'file_path': mapping['file_path'],
+            'cache_status': cache_status
+        }
+
+    if timer.durations is not None:
+        row.update(timer.columns(STAGES + (SIMILARITY_STAGE,) if similarity is not None else STAGES))
+    return row
+
+
+def _mapping_timer(mapping, stage_times, trace):
+    """
+    Timer for validating one mapping.
+
+    Args:
+        mapping: Dict with keys: 'model_name', 'task', 'file_path'
+        stage_times: Whether the row gets the STAGE_FIELDNAMES columns
+        trace: TraceWriter or list the stages are appended to as trace events, or None
+
+    Returns:
+        StageTimer, or NULL_TIMER when neither stage times nor a trace are wanted
     """
-    if task == 'test1-preview':
-        return validate_preview_generation(kt_bytes, kotlin_parser, KOTLIN_LANGUAGE)
-    elif task == 'test2-unit-test':
-        return validate_unit_test_generation(kt_bytes, kotlin_parser, KOTLIN_LANGUAGE)
-    elif task == 'test3-instrumentation-test':
-        return validate_instrumentation_test_generation(kt_bytes, kotlin_parser, KOTLIN_LANGUAGE)
+    if not stage_times and trace is None:
+        return NULL_TIMER
+    args = {'model_name': mapping['model_name'], 'task': mapping['task'], 'file_path': mapping['file_path']}
+    return StageTimer(trace, args)
+
+
+# Parsers and cache owned by a worker process of the --jobs pool, loaded once per worker
+_worker_parsers = None
+_worker_cache = None
+_worker_timing = (False, False)
+_worker_similarity = None
+
+
+def _init_worker(kotlin_library, diff_library, languages, cache_dir, cache_max_bytes, stage_times=False,
+                 tracing=False, references=None, writers=1):
+    """Pool initializer: load the grammars and open the cache once for the lifetime of the worker."""
+    global _worker_parsers, _worker_cache, _worker_timing, _worker_similarity
+    # A forked worker inherits the parent's counters, which the parent already reports
+    query_registry.drain_stats()
+    _worker_parsers = load_parsers(kotlin_library, diff_library, languages)
+    if cache_dir is not None:
+        # Every worker of the pool writes to the cache, and they share its size budget
+        _worker_cache = ValidationCache(cache_dir, cache_max_bytes, kotlin_library, diff_library, writers)
+    _worker_timing = (stage_times, tracing)
+    if references is not None:
+        _worker_similarity = SimilarityIndex(references)
+
+
+def _validate_in_worker(mapping):
+    """Validate a mapping with the worker's parsers; query timings and trace events travel back with the row."""
+    stage_times, tracing = _worker_timing
+    events = [] if tracing else None
+    timer = _mapping_timer(mapping, stage_times, events)
+    with timer.stage('validate'):
+        row = validate_mapping(mapping, *_worker_parsers, cache=_worker_cache, timer=timer,
+                               similarity=_worker_similarity)
+    return row, query_registry.drain_stats(), events
+
+
+def default_batch_size(mapping_count, jobs):
+    """Split the work into roughly four batches per worker to balance uneven files."""
+    return max(1, math.ceil(mapping_count / (jobs * 4)))
+
+
+def result_key(model_name, task, file_path):
+    """Key identifying a row of the output CSV, used to skip finished files on --resume."""
+    return model_name, task, str(file_path)
+
+
+def _truncate_partial_row(f):
+    """Cut a trailing row left half-written by a crash, so appending starts on a fresh line."""
+    size = f.seek(0, os.SEEK_END)
+    position = size
+    while position > 0:
+        block_start = max(0, position - 65536)
+        f.seek(block_start)
+        block = f.read(position - block_start)
+        newline = block.rfind(b'\n')
+        if newline != -1:
+            end = block_start + newline + 1
+            if end != size:
+                f.truncate(end)
+            return
+        position = block_start
+    f.truncate(0)
+
+
+def read_completed_keys(output_csv, fieldnames=CSV_FIELDNAMES):
+    """
+    Read the keys of the rows already written to a partial output CSV.
+
+    Args:
+        output_csv: CSV written by an earlier, interrupted run
+        fieldnames: Columns the CSV must have, as this run writes them
+
+    Returns:
+        Set of (model_name, task, file_path) tuples
+    """
+    if not os.path.exists(output_csv):
+        return set()
+
+    with open(output_csv, 'rb+') as f:
+        _truncate_partial_row(f)
+
+    with open(output_csv, 'r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        if reader.fieldnames is None:
+            return set()
+        if reader.fieldnames != fieldnames:
+            raise ValueError(f"{output_csv} has different columns than this version writes; rerun without --resume")
+        return {result_key(row['model_name'], row['task'], row['file_path']) for row in reader}
+
+
+def print_result(result):
+    """Print the summary of one validated file."""
+    print(f"{result['model_name']} - {result['task']}: Valid={result['is_valid']}")
+    print(f"  Success ({result['success_validation_count']}): {result['success_validation_list']}")
+    print(f"  Failed ({result['failed_validation_count']}): {result['failed_validation_list']}\n")
+
+
+def _iter_results(file_mappings, kotlin_parser, KOTLIN_LANGUAGE, diff_parser, diff_query, jobs, batch_size,
+                  kotlin_library, diff_library, cache_dir, cache_max_bytes, stage_times=False, trace=None,
+                  references=None):
+    """Yield the result row of each mapping, in mappings order, as soon as it is available."""
+    if jobs > 1 and len(file_mappings) > 1:
+        if batch_size is None:
+            batch_size = default_batch_size(len(file_mappings), jobs)
+
+        # imap keeps the mappings order, so the CSV is identical to a serial run
+        with multiprocessing.Pool(jobs, initializer=_init_worker,
+                                  initargs=(kotlin_library, diff_library, mapping_languages(file_mappings),
+                                            cache_dir, cache_max_bytes, stage_times, trace is not None,
+                                            references, jobs)) as pool:
+            for row, query_stats, events in pool.imap(_validate_in_worker, file_mappings, chunksize=batch_size):
+                query_registry.merge_stats(query_stats)
+                if events:
+                    trace.extend(events)
+                if row is not None:
+                    yield row
     else:
-        raise ValueError(f"Unknown Kotlin task: {task}")
+        cache = None
+        if cache_dir is not None:
+            cache = ValidationCache(cache_dir, cache_max_bytes, kotlin_library, diff_library)
+        similarity = SimilarityIndex(references) if references is not None else None
+
+        for mapping in file_mappings:
+            timer = _mapping_timer(mapping, stage_times, trace)
+            with timer.stage('validate'):
+                row = validate_mapping(mapping, kotlin_parser, KOTLIN_LANGUAGE, diff_parser, diff_query, cache,
+                                       timer=timer, similarity=similarity)
+            if row is not None:
+                yield row
 
 
 def process_all_files(file_mappings, kotlin_parser, KOTLIN_LANGUAGE, diff_parser=None, diff_query=None,
-                      output_csv='validation_results.csv'):
+                      output_csv='validation_results.csv', jobs=1, batch_size=None,
+                      kotlin_library=None, diff_library=None,
+                      cache_dir=None, cache_max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024, resume=False,
+                      stage_times=False, trace=None, history=None, references=None):
     """
     Process multiple Kotlin files and diffs, generate CSV report.
 
+    Each row is written and flushed as soon as its file is validated, so an interrupted
+    run keeps everything done so far and memory does not grow with the number of mappings.
+
     Args:
         file_mappings: List of dicts with keys: 'model_name', 'task', 'file_path'
                       task should be one of: 'preview_generation', 'unit_test_generation',
@@ -412,76 +652,167 @@ def process_all_files(file_mappings, kotlin_parser, KOTLIN_LANGUAGE, diff_parser
         diff_parser: Tree-sitter parser instance for diff files (required for diff tasks)
         diff_query: Tree-sitter query for diff parsing (required for diff tasks)
         output_csv: Output CSV file path
+        jobs: Number of worker processes; 1 validates in the current process
+        batch_size: Mappings handed to a worker at once (default: about four batches per worker)
+        kotlin_library: Kotlin grammar loaded by each worker when jobs > 1 (default: resolved by grammars.py)
+        diff_library: Diff grammar loaded by each worker when jobs > 1 (default: resolved by grammars.py)
+        cache_dir: Directory of the validation result cache, or None to disable caching
+        cache_max_bytes: Size above which least recently used cache entries are evicted
+        resume: Keep the rows of an existing output_csv, skip their files and append the rest
+        stage_times: Add the read_ms, parse_ms, query_ms and check_ms columns to every row
+        trace: Optional TraceWriter receiving the stages of every file, and the CSV writes,
+               as Chrome trace events
+        history: Optional RunRecorder receiving every row written, in batched transactions
+        references: Directory of golden references (<reference>/<task>.kt|diff) to add the
+                    SIMILARITY_FIELDNAMES columns against, or None
+
+    Returns:
+        Dictionary of run totals: 'written', 'skipped', 'valid', 'cache_hits', 'cache_misses'
     """
+    fieldnames = CSV_FIELDNAMES + STAGE_FIELDNAMES if stage_times else CSV_FIELDNAMES
+    if references is not None:
+        if stage_times:
+            fieldnames = fieldnames + [f"{SIMILARITY_STAGE}_ms"]
+        fieldnames = fieldnames + SIMILARITY_FIELDNAMES
+    completed = read_completed_keys(output_csv, fieldnames) if resume else set()
+    pending = [
+        mapping for mapping in file_mappings
+        if result_key(mapping['model_name'], mapping['task'], mapping['file_path']) not in completed
+    ]
 
-    results = []
+    summary = {
+        'written': 0,
+        'skipped': len(file_mappings) - len(pending),
+        'valid': 0,
+        'cache_hits': 0,
+        'cache_misses': 0,
+    }
+    if summary['skipped']:
+        print(f"Resuming {output_csv}: skipping {summary['skipped']} already validated files")
+
+    output_dir = os.path.dirname(output_csv)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    append = resume and os.path.exists(output_csv) and os.path.getsize(output_csv) > 0
+
+    write_timer = NULL_TIMER if trace is None else StageTimer(trace, {'file_path': output_csv})
+
+    with open(output_csv, 'a' if append else 'w', newline='', encoding='utf-8') as csvfile:
+        # Stage times measured only for the trace are left out of the CSV
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+        if not append:
+            writer.writeheader()
+
+        for result in _iter_results(pending, kotlin_parser, KOTLIN_LANGUAGE, diff_parser, diff_query, jobs,
+                                    batch_size, kotlin_library, diff_library, cache_dir, cache_max_bytes,
+                                    stage_times, trace, references):
+            with write_timer.stage('write'):
+                writer.writerow(result)
+                csvfile.flush()
+            if history is not None:
+                history.add({name: result.get(name, '') for name in fieldnames},
+                            model_key(result['model_name'], result['file_path']), result['task'])
+            print_result(result)
+
+            summary['written'] += 1
+            summary['valid'] += result['is_valid'] is True
+            summary['cache_hits'] += result['cache_status'] == 'hit'
+            summary['cache_misses'] += result['cache_status'] == 'miss'
 
-    kotlin_tasks = ['test1-preview', 'test2-unit-test', 'test3-instrumentation-test']
-    diff_tasks = ['test4-deprecated-material', 'test5-deprecated-plugin']
+    print(f"\nResults written to {output_csv}")
+    if cache_dir is not None:
+        print(f"Cache: {summary['cache_hits']} hits, {summary['cache_misses']} misses ({cache_dir})")
+    return summary
 
-    for mapping in file_mappings:
-        model_name = mapping['model_name']
-        task = mapping['task']
-        file_path = Path(mapping['file_path'])
 
-        print(f"Processing {model_name} - {task}...")
+def write_results_snapshot(results, output_csv):
+    """
+    Replace output_csv and the JSON file next to it with the given rows.
 
-        try:
-            if task in diff_tasks:
-                if diff_parser is None or diff_query is None:
-                    raise ValueError("diff_parser and diff_query are required for diff tasks")
+    Both files are written to a temporary file first and moved into place, so a reader
+    never sees a half-written snapshot.
 
-                diff_text = file_path.read_text()
-                validations = process_diff_file(diff_text, task, diff_parser, diff_query)
+    Args:
+        results: List of result rows
+        output_csv: Output CSV file path; the JSON snapshot uses the same path with a .json suffix
+    """
+    output_dir = os.path.dirname(output_csv)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
 
-            elif task in kotlin_tasks:
-                kt_bytes = file_path.read_bytes()
-                validations = process_kotlin_file(kt_bytes, task, kotlin_parser, KOTLIN_LANGUAGE)
+    tmp_csv = f"{output_csv}.tmp"
+    with open(tmp_csv, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
+        writer.writeheader()
+        for result in results:
+            writer.writerow(result)
+    os.replace(tmp_csv, output_csv)
 
-            else:
-                print(f"Unknown task: {task}")
-                continue
-
-            success_validations = [k for k, v in validations.items() if v]
-            failed_validations = [k for k, v in validations.items() if not v]
-
-            is_valid = len(failed_validations) == 0
-
-            results.append({
-                'model_name': model_name,
-                'task': task,
-                'is_valid': is_valid,
-                'success_validation_count': len(success_validations),
-                'failed_validation_count': len(failed_validations),
-                'success_validation_list': ', '.join(success_validations) if success_validations else 'None',
-                'failed_validation_list': ', '.join(failed_validations) if failed_validations else 'None'
-            })
+    output_json = os.path.splitext(output_csv)[0] + '.json'
+    tmp_json = f"{output_json}.tmp"
+    with open(tmp_json, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp_json, output_json)
 
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-            results.append({
-                'model_name': model_name,
-                'task': task,
-                'is_valid': False,
-                'success_validation_count': 0,
-                'failed_validation_count': 0,
-                'success_validation_list': 'None',
-                'failed_validation_list': f'Error: {str(e)}'
-            })
 
-    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+def watch_files(file_mappings, kotlin_parser, KOTLIN_LANGUAGE, diff_parser=None, diff_query=None,
+                output_csv='validation_results.csv', cache_dir=None,
+                cache_max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024, poll_interval=0.5):
+    """
+    Validate every mapping, then keep revalidating the files that change on disk.
 
-    with open(output_csv, 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['model_name', 'task', 'is_valid', 'success_validation_count',
-                      'failed_validation_count', 'success_validation_list', 'failed_validation_list']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    Meant to run next to the code-generation notebook: each time a result file is written
+    its mappings are validated again and the CSV and JSON snapshots are replaced. The last
+    tree of every file is kept, so a regenerated file is reparsed incrementally. Runs until
+    interrupted.
 
-        writer.writeheader()
-        for result in results:
-            writer.writerow(result)
+    Args:
+        file_mappings: List of dicts with keys: 'model_name', 'task', 'file_path'
+        kotlin_parser: Tree-sitter parser instance for Kotlin
+        KOTLIN_LANGUAGE: Kotlin language instance
+        diff_parser: Tree-sitter parser instance for diff files (required for diff tasks)
+        diff_query: Tree-sitter query for diff parsing (required for diff tasks)
+        output_csv: Output CSV file path; a JSON snapshot is written next to it
+        cache_dir: Directory of the validation result cache, or None to disable caching
+        cache_max_bytes: Size above which least recently used cache entries are evicted
+        poll_interval: Seconds between checks when inotify is not available
+    """
+    cache = None
+    if cache_dir is not None:
+        cache = ValidationCache(cache_dir, cache_max_bytes)
+    trees = IncrementalParser()
+
+    mappings_by_path = {}
+    for index, mapping in enumerate(file_mappings):
+        mappings_by_path.setdefault(mapping['file_path'], []).append(index)
 
+    # Start watching before the first pass, so files written meanwhile are not missed
+    watcher = FileWatcher(mappings_by_path, poll_interval=poll_interval)
+
+    rows = [
+        validate_mapping(mapping, kotlin_parser, KOTLIN_LANGUAGE, diff_parser, diff_query, cache, trees)
+        for mapping in file_mappings
+    ]
+    write_results_snapshot([row for row in rows if row is not None], output_csv)
     print(f"\nResults written to {output_csv}")
-    return results
+    print(f"Watching {len(mappings_by_path)} files ({watcher.mode}), press Ctrl+C to stop")
+
+    try:
+        while True:
+            for file_path in watcher.wait():
+                if not os.path.exists(file_path):
+                    trees.forget(file_path)
+                for index in mappings_by_path[file_path]:
+                    start = time.perf_counter()
+                    rows[index] = validate_mapping(file_mappings[index], kotlin_parser, KOTLIN_LANGUAGE,
+                                                   diff_parser, diff_query, cache, trees)
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+                    if rows[index] is not None:
+                        print_result(rows[index])
+                        print(f"  Revalidated in {elapsed_ms:.1f} ms\n")
+            write_results_snapshot([row for row in rows if row is not None], output_csv)
+    finally:
+        watcher.close()
 
 
 def load_file_mappings_from_json(json_path):
@@ -507,32 +838,180 @@ if __name__ == "__main__":
         help='Output CSV file path (default: validation_results.csv)'
     )
 
+    parser.add_argument(
+        '--tasks',
+        nargs='+',
+        choices=KOTLIN_TASKS + DIFF_TASKS,
+        metavar='TASK',
+        help='Only validate the mappings of these tasks; only their grammars are loaded'
+    )
+
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=1,
+        help='Number of worker processes, 0 for one per CPU core (default: 1)'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=None,
+        help='Mappings sent to a worker at once (default: about four batches per worker)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Validate every file again instead of reusing cached results'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        default=DEFAULT_CACHE_DIR,
+        help='Directory of the validation result cache (default: build/validation-cache next to this script)'
+    )
+    parser.add_argument(
+        '--cache-max-mb',
+        type=int,
+        default=DEFAULT_CACHE_MAX_MB,
+        help=f'Size above which least recently used cache entries are evicted (default: {DEFAULT_CACHE_MAX_MB})'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Keep the rows already in --output, skip their files and append the rest'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Keep running and revalidate files as they are regenerated'
+    )
+    parser.add_argument(
+        '--poll-interval',
+        type=float,
+        default=0.5,
+        help='Seconds between checks for changed files when inotify is not available (default: 0.5)'
+    )
+    parser.add_argument(
+        '--timing',
+        action='store_true',
+        help='Print query compile time next to query match time after the run'
+    )
+    parser.add_argument(
+        '--stage-times',
+        action='store_true',
+        help='Add read_ms, parse_ms, query_ms and check_ms columns to every row'
+    )
+    parser.add_argument(
+        '--trace',
+        type=str,
+        metavar='PATH',
+        help='Write the stages of every file as Chrome trace events, e.g. out.json for ui.perfetto.dev'
+    )
+    parser.add_argument(
+        '--profile',
+        type=str,
+        metavar='PATH',
+        help='Run under cProfile, dump the stats to this file and print the slowest functions'
+    )
+    parser.add_argument(
+        '--similarity',
+        action='store_true',
+        help='Add similarity, similarity_reference and missing_subtrees columns, scored against --references'
+    )
+    parser.add_argument(
+        '--references',
+        type=str,
+        default=str(GOLDEN_REFERENCE_DIR),
+        help='Directory of the golden references, <reference>/<task>.kt|diff (default: resources/golden-reference)'
+    )
+    parser.add_argument(
+        '--history',
+        type=str,
+        default=DEFAULT_HISTORY_DB,
+        help='Run history database the run is recorded in (default: build/run-history.sqlite next to this script)'
+    )
+    parser.add_argument(
+        '--no-history',
+        action='store_true',
+        help='Do not record the run in the history database (--watch runs are never recorded)'
+    )
+
     args = parser.parse_args()
+    if args.watch and (args.stage_times or args.trace or args.similarity):
+        parser.error('--stage-times, --trace and --similarity are not supported with --watch')
 
     file_mappings = load_file_mappings_from_json(args.mappings)
+    if args.tasks:
+        file_mappings = [mapping for mapping in file_mappings if mapping['task'] in args.tasks]
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
 
-    kotlin_parser = Parser()
-    KOTLIN_LANGUAGE = Language('build/tree-sitter-binaries/kotlin.so', 'kotlin')
-    kotlin_parser.set_language(KOTLIN_LANGUAGE)
-
-    diff_parser = Parser()
-    DIFF_LANGUAGE = Language('build/tree-sitter-binaries/diff.so', 'diff')
-    diff_parser.set_language(DIFF_LANGUAGE)
-    diff_query = DIFF_LANGUAGE.query("""
-        (deletion) @deletion
-        (addition) @addition
-    """)
-
-    results = process_all_files(
-        file_mappings,
-        kotlin_parser,
-        KOTLIN_LANGUAGE,
-        diff_parser,
-        diff_query,
-        args.output
-    )
+    profiler = None
+    if args.profile:
+        # Imported here so runs without --profile do not pay for it
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    # A grammar is only loaded (and built, the first time) when a mapping needs it
+    kotlin_parser, KOTLIN_LANGUAGE, diff_parser, diff_query = load_parsers(languages=mapping_languages(file_mappings))
 
-    for result in results:
-        print(f"{result['model_name']} - {result['task']}: Valid={result['is_valid']}")
-        print(f"  Success ({result['success_validation_count']}): {result['success_validation_list']}")
-        print(f"  Failed ({result['failed_validation_count']}): {result['failed_validation_list']}\n")
\ No newline at end of file
+    if args.watch:
+        try:
+            watch_files(
+                file_mappings,
+                kotlin_parser,
+                KOTLIN_LANGUAGE,
+                diff_parser,
+                diff_query,
+                args.output,
+                cache_dir=None if args.no_cache else args.cache_dir,
+                cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+                poll_interval=args.poll_interval
+            )
+        except KeyboardInterrupt:
+            print("\nStopped watching")
+    else:
+        trace = TraceWriter(args.trace) if args.trace else None
+        history = None
+        if not args.no_history:
+            history = RunRecorder(args.history, 'validation', config={
+                'mappings': args.mappings,
+                'rules_version': VALIDATION_RULES_VERSION,
+                'resume': args.resume,
+            })
+        try:
+            process_all_files(
+                file_mappings,
+                kotlin_parser,
+                KOTLIN_LANGUAGE,
+                diff_parser,
+                diff_query,
+                args.output,
+                jobs=jobs,
+                batch_size=args.batch_size,
+                cache_dir=None if args.no_cache else args.cache_dir,
+                cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+                resume=args.resume,
+                stage_times=args.stage_times,
+                trace=trace,
+                history=history,
+                references=args.references if args.similarity else None
+            )
+        finally:
+            if history is not None:
+                history.close()
+                print(f"Recorded as run {history.run_id} in {args.history}")
+            if trace is not None:
+                trace.close()
+                print(f"Trace written to {args.trace}")
+
+    if profiler is not None:
+        import pstats
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        # With --jobs the workers are not profiled, only the parent distributing the work
+        print(f"Profile written to {args.profile}")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+
+    if args.timing:
+        print(query_registry.timing_report())
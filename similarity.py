@@ -0,0 +1,289 @@
+"""
+Structural similarity of generated files to the golden references, by subtree hashing.
+
+Every subtree of a tree-sitter tree gets a Merkle-style hash computed bottom-up from its
+node type and the hashes of its children, so equal code gets equal hashes wherever it
+appears in the file. Whitespace and comments never reach a hash, and in Kotlin the names
+a file declares itself (after fun, val, var, class, ...) hash as one placeholder, so
+renaming a test function or a local variable does not count as a difference; calls,
+annotations and types used from elsewhere keep their names.
+
+Each reference in resources/golden-reference/<reference>/<task>.kt|diff is hashed once
+and kept as a multiset of subtree hashes. An output is scored in one pass over its own
+hashes: the Dice coefficient 2 * matched / (output subtrees + reference subtrees), where
+matched counts the subtrees both have (with multiplicity). No tree edit distance is
+computed, so thousands of outputs are scored in seconds.
+
+    python similarity.py --task test2-unit-test build/test2-unit-test/*.kt
+"""
+from collections import Counter
+from pathlib import Path
+import argparse
+import re
+import time
+
+GOLDEN_REFERENCE_DIR = Path(__file__).resolve().parent / 'resources' / 'golden-reference'
+
+# Columns added to the results CSV by run_validation.py --similarity
+SIMILARITY_FIELDNAMES = ['similarity', 'similarity_reference', 'missing_subtrees']
+
+# Largest reference subtrees without a match reported per output
+DEFAULT_MAX_MISSING = 3
+# Smaller missing subtrees are not worth reporting
+MIN_MISSING_SIZE = 4
+# Share of a missing subtree no match may cover for it to be reported
+MISSING_FRACTION = 0.75
+
+EXTENSIONS = {'kotlin': 'kt', 'diff': 'diff'}
+
+# Per language:
+#   skip        nodes left out entirely (comments)
+#   identifiers leaves whose declared names hash as a placeholder
+#   text        nodes hashed whole from their text, without whitespace (lines of a diff)
+#   opaque      nodes hashed by their type only (commit ids, hunk line numbers)
+LANGUAGE_RULES = {
+    'kotlin': {
+        'skip': frozenset({'comment', 'line_comment', 'multiline_comment'}),
+        'identifiers': frozenset({'simple_identifier', 'type_identifier'}),
+        'text': frozenset(),
+        'opaque': frozenset(),
+    },
+    'diff': {
+        'skip': frozenset(),
+        'identifiers': frozenset(),
+        'text': frozenset({'addition', 'deletion', 'context'}),
+        'opaque': frozenset({'commit', 'mode', 'location', 'linerange'}),
+    },
+}
+
+_DECLARATION = re.compile(rb'\b(?:fun|val|var|class|interface|object)\s+(?:<[^>]*>\s*)?(?:[A-Za-z_][\w.]*\.)?'
+                          rb'([A-Za-z_]\w*)')
+_PLACEHOLDER = b'$'
+
+
+def declared_names(source):
+    """Names a Kotlin file declares: functions (including extensions), properties and classes."""
+    return frozenset(match.group(1) for match in _DECLARATION.finditer(source))
+
+
+def _normalized(data):
+    """Text with all whitespace removed."""
+    return b''.join(data.split())
+
+
+def subtree_hashes(tree, source, language, keep_nodes=False):
+    """
+    Hash every subtree of a tree bottom-up in one cursor walk.
+
+    Args:
+        tree: Tree-sitter tree parsed from source
+        source: The file content as bytes
+        language: 'kotlin' or 'diff', see LANGUAGE_RULES
+        keep_nodes: Also return where each counted subtree is, e.g. to report missing ones
+
+    Returns:
+        Tuple of (hashes of the counted subtrees in post-order, nodes or None); the counted
+        subtrees are the inner nodes and the text nodes. Each node is a tuple of (hash,
+        size in nodes, start byte, end byte, type, start row).
+    """
+    rules = LANGUAGE_RULES[language]
+    skip = rules['skip']
+    identifiers = rules['identifiers']
+    text_types = rules['text']
+    opaque = rules['opaque']
+    declared = declared_names(source) if identifiers else frozenset()
+
+    hashes = []
+    nodes = [] if keep_nodes else None
+    # One frame per inner node being hashed: [node, child hashes, size]
+    frames = []
+    cursor = tree.walk()
+    while True:
+        node = cursor.node
+        node_type = node.type
+        if node_type not in skip:
+            leaf_hash = None
+            if node_type in opaque:
+                leaf_hash = hash((node_type,))
+            elif node_type in text_types:
+                leaf_hash = hash((node_type, _normalized(source[node.start_byte:node.end_byte])))
+                hashes.append(leaf_hash)
+                if keep_nodes:
+                    nodes.append((leaf_hash, 1, node.start_byte, node.end_byte, node_type, node.start_point[0]))
+            elif node.child_count == 0:
+                if not node.is_named:
+                    leaf_hash = hash((node_type,))
+                else:
+                    text = source[node.start_byte:node.end_byte]
+                    if node_type in identifiers and text in declared:
+                        text = _PLACEHOLDER
+                    leaf_hash = hash((node_type, _normalized(text)))
+            elif cursor.goto_first_child():
+                frames.append([node, [], 1])
+                continue
+            if frames:
+                frames[-1][1].append(leaf_hash)
+                frames[-1][2] += 1
+
+        # Move on to the next sibling, finishing the inner nodes whose last child was done
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return hashes, nodes
+            node, children, size = frames.pop()
+            subtree_hash = hash((node.type, tuple(children)))
+            hashes.append(subtree_hash)
+            if keep_nodes:
+                nodes.append((subtree_hash, size, node.start_byte, node.end_byte, node.type, node.start_point[0]))
+            if frames:
+                frames[-1][1].append(subtree_hash)
+                frames[-1][2] += size
+
+
+class Reference:
+    """The subtree hashes of one golden reference, and where its counted subtrees are."""
+
+    def __init__(self, name, path, tree, source, language):
+        self.name = name
+        self.path = path
+        self.source = source
+        hashes, nodes = subtree_hashes(tree, source, language, keep_nodes=True)
+        self.counts = Counter(hashes)
+        self.total = len(hashes)
+        self.nodes = nodes
+        # Counted subtrees directly below each one; in post-order the children of a node
+        # are the nodes still pending on the stack that lie inside it
+        self.children = [[] for _ in nodes]
+        pending = []
+        for index, (_, _, start, end, _, _) in enumerate(nodes):
+            while pending and nodes[pending[-1]][2] >= start and nodes[pending[-1]][3] <= end:
+                self.children[index].append(pending.pop())
+            pending.append(index)
+
+    def missing(self, output_counts, limit=DEFAULT_MAX_MISSING):
+        """
+        Reference subtrees the output has no match for, most unmatched code first.
+
+        A subtree's uncovered size is its size minus the sizes of its largest descendants
+        the output does have. Subtrees mostly covered by matches, such as a class whose
+        functions mostly match, are not reported; no reported subtree lies inside another.
+
+        Returns:
+            List of descriptions, e.g. 'function_declaration at line 42 (37 nodes): fun test() {'
+        """
+        nodes = self.nodes
+        covered = [0] * len(nodes)
+        candidates = []
+        for index, (subtree_hash, size, _, _, _, _) in enumerate(nodes):
+            if subtree_hash in output_counts:
+                covered[index] = size
+                continue
+            covered[index] = sum(covered[child] for child in self.children[index])
+            uncovered = size - covered[index]
+            # The root is missing whenever the files differ; its parts say more
+            if index < len(nodes) - 1 and uncovered >= MIN_MISSING_SIZE and uncovered >= MISSING_FRACTION * size:
+                candidates.append((uncovered, index))
+        candidates.sort(reverse=True)
+
+        found = []
+        for _, index in candidates:
+            if len(found) >= limit:
+                break
+            _, size, start, end, node_type, row = nodes[index]
+            if any(start < other_end and end > other_start for other_start, other_end, _ in found):
+                continue
+            first_line = self.source[start:end].decode('utf-8', 'replace').strip().split('\n', 1)[0].strip()
+            snippet = first_line if len(first_line) <= 60 else first_line[:57] + '...'
+            found.append((start, end, f"{node_type} at line {row + 1} ({size} nodes): {snippet}"))
+        return [description for _, _, description in found]
+
+
+def score(output_counts, output_total, reference):
+    """Dice coefficient of the subtree multisets of an output and a reference, from 0 to 1."""
+    if output_total + reference.total == 0:
+        return 1.0
+    reference_counts = reference.counts
+    matched = 0
+    for subtree_hash, count in output_counts.items():
+        reference_count = reference_counts.get(subtree_hash)
+        if reference_count:
+            matched += count if count < reference_count else reference_count
+    return 2 * matched / (output_total + reference.total)
+
+
+class SimilarityIndex:
+    """
+    Golden references hashed once per task, scoring outputs against all of them.
+
+    A task's references are every <reference_dir>/<reference>/<task>.<extension>; they are
+    parsed and hashed the first time an output of the task is scored.
+    """
+
+    def __init__(self, reference_dir=GOLDEN_REFERENCE_DIR, max_missing=DEFAULT_MAX_MISSING):
+        self.reference_dir = Path(reference_dir)
+        self.max_missing = max_missing
+        self.references = {}
+
+    def task_references(self, task, language, parser):
+        references = self.references.get(task)
+        if references is None:
+            references = []
+            for path in sorted(self.reference_dir.glob(f"*/{task}.{EXTENSIONS[language]}")):
+                source = path.read_bytes()
+                references.append(Reference(path.parent.name, path, parser.parse(source), source, language))
+            self.references[task] = references
+        return references
+
+    def score_tree(self, task, language, tree, source, parser):
+        """
+        Score a parsed output against every reference of its task.
+
+        Args:
+            task: Task name, e.g. test2-unit-test
+            language: 'kotlin' or 'diff'
+            tree: Tree parsed from source
+            source: The output as bytes
+            parser: Parser of the language, used to parse the references the first time
+
+        Returns:
+            SIMILARITY_FIELDNAMES columns for the best matching reference; empty without references
+        """
+        references = self.task_references(task, language, parser)
+        if not references:
+            return {name: '' for name in SIMILARITY_FIELDNAMES}
+        hashes, _ = subtree_hashes(tree, source, language)
+        output_counts = Counter(hashes)
+        best_score, best = max(((score(output_counts, len(hashes), reference), reference)
+                                for reference in references), key=lambda item: item[0])
+        return {
+            'similarity': round(best_score, 4),
+            'similarity_reference': best.name,
+            'missing_subtrees': ' | '.join(best.missing(output_counts, self.max_missing)) or 'None',
+        }
+
+
+if __name__ == "__main__":
+    from run_validation import DIFF_TASKS, KOTLIN_TASKS, load_parsers
+
+    parser = argparse.ArgumentParser(description='Score files by structural similarity to the golden references')
+    parser.add_argument('files', nargs='+', help='Generated files of one task')
+    parser.add_argument('--task', required=True, choices=KOTLIN_TASKS + DIFF_TASKS, help='Task of the files')
+    parser.add_argument('--references', type=str, default=str(GOLDEN_REFERENCE_DIR),
+                        help='Directory of <reference>/<task>.kt|diff (default: resources/golden-reference)')
+    parser.add_argument('--max-missing', type=int, default=DEFAULT_MAX_MISSING,
+                        help=f'Largest missing subtrees listed per file (default: {DEFAULT_MAX_MISSING})')
+    args = parser.parse_args()
+
+    language = 'diff' if args.task in DIFF_TASKS else 'kotlin'
+    kotlin_parser, _, diff_parser, _ = load_parsers(languages=(language,))
+    language_parser = diff_parser if language == 'diff' else kotlin_parser
+    index = SimilarityIndex(args.references, args.max_missing)
+
+    start = time.perf_counter()
+    for file_path in args.files:
+        source = Path(file_path).read_bytes()
+        columns = index.score_tree(args.task, language, language_parser.parse(source), source, language_parser)
+        print(f"{file_path}: {columns['similarity']} ({columns['similarity_reference']})")
+        if columns['missing_subtrees'] != 'None':
+            for missing in columns['missing_subtrees'].split(' | '):
+                print(f"  missing {missing}")
+    print(f"\nScored {len(args.files)} files in {time.perf_counter() - start:.3f} s")
@@ -0,0 +1,109 @@
+import json
+import os
+import time
+
+# Stages reported as <stage>_ms columns of the output CSV
+STAGES = ('read', 'parse', 'query', 'check')
+
+
+class _Stage:
+    """Context manager timing one stage of a StageTimer."""
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        timer = self.timer
+        timer.durations[self.name] = timer.durations.get(self.name, 0.0) + elapsed
+        if timer.trace is not None:
+            timer.trace.append({
+                'name': self.name,
+                'cat': 'validation',
+                'ph': 'X',
+                'ts': self.start * 1e6,
+                'dur': elapsed * 1e6,
+                'pid': os.getpid(),
+                'tid': 0,
+                'args': timer.args,
+            })
+        return False
+
+
+class StageTimer:
+    """
+    Wall time spent in each stage (read, parse, query, check, ...) of validating a file.
+
+    Durations of a stage entered several times, e.g. once per diff section, add up. When
+    a trace is given, every stage is also appended to it as a Chrome trace event.
+    """
+
+    def __init__(self, trace=None, args=None):
+        self.durations = {}
+        self.trace = trace
+        self.args = args or {}
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def columns(self, stages=STAGES):
+        """Durations of the stages (default: STAGES) in milliseconds, as <stage>_ms CSV columns."""
+        return {f"{stage}_ms": round(self.durations.get(stage, 0.0) * 1000, 3) for stage in stages}
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullTimer:
+    """Timer used when timing is off: entering a stage does nothing."""
+
+    durations = None
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+
+NULL_TIMER = NullTimer()
+
+
+class TraceWriter:
+    """
+    Stream trace events to a Chrome trace-event file (JSON array format).
+
+    Events are written as they are appended, so a long run does not keep them in memory.
+    Open the file in chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write('[')
+        self.path = path
+        self._separator = '\n'
+
+    def append(self, event):
+        self.file.write(self._separator)
+        self.file.write(json.dumps(event))
+        self._separator = ',\n'
+
+    def extend(self, events):
+        for event in events:
+            self.append(event)
+
+    def close(self):
+        self.append({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': 'run_validation'}})
+        self.file.write('\n]\n')
+        self.file.close()
@@ -0,0 +1,352 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+from contextlib import contextmanager
+import itertools
+import json
+import random
+import threading
+import time
+
+DEFAULT_COMPLETION = """@Preview
+@Composable
+fun StubPreview() {
+    Text(text = "Stub")
+}
+"""
+
+
+def count_tokens(text):
+    """Rough token count (about four characters per token), enough for the usage fields."""
+    return max(1, len(text) // 4)
+
+
+def split_tokens(text):
+    """Split a completion into the pieces streamed one per event, about four characters each."""
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def completion_of_tokens(text, token_count):
+    """Repeat a completion until it is token_count tokens long (by count_tokens)."""
+    repeated = text * (token_count * 4 // max(1, len(text)) + 1)
+    return repeated[:token_count * 4]
+
+
+def pick_variant(completions, model, seed):
+    """
+    One of several completions of a model: the first without a seed, else one picked by the seed.
+
+    The same model and seed always pick the same completion, like a seeded sampler.
+    """
+    if seed is None:
+        return completions[0]
+    return random.Random(f"{model}:{seed}").choice(completions)
+
+
+class ServiceTimeModel:
+    """
+    How long a local model server takes to serve a request.
+
+    A request first prefills its prompt at prefill_tps tokens per second, then decodes at
+    decode_tps tokens per second. At most parallel requests are served at once and the
+    others queue, like the parallel slots of LM Studio or llama.cpp; requests sharing the
+    server decode batch_slowdown slower per other active request. jitter is the sigma of
+    a log-normal factor applied to every duration. A rate of 0 costs no time.
+    """
+
+    def __init__(self, prefill_tps=0.0, decode_tps=0.0, parallel=0, batch_slowdown=0.0, jitter=0.0, seed=0):
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.batch_slowdown = batch_slowdown
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.slots = threading.BoundedSemaphore(parallel) if parallel > 0 else None
+        self.lock = threading.Lock()
+        self.active = 0
+
+    def _jittered(self, seconds):
+        if not self.jitter or not seconds:
+            return seconds
+        with self.lock:
+            return seconds * self.random.lognormvariate(0.0, self.jitter)
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the parallel slots while serving a request, waiting for one if all are busy."""
+        if self.slots is not None:
+            self.slots.acquire()
+        with self.lock:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active -= 1
+            if self.slots is not None:
+                self.slots.release()
+
+    def prefill_seconds(self, prompt_tokens):
+        return self._jittered(prompt_tokens / self.prefill_tps) if self.prefill_tps else 0.0
+
+    def token_seconds(self):
+        """Seconds to decode one token, slower while other requests are active."""
+        if not self.decode_tps:
+            return 0.0
+        return self._jittered((1 + self.batch_slowdown * max(0, self.active - 1)) / self.decode_tps)
+
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI-compatible chat completions endpoint returning canned completions.
+
+    A request with "stream": true gets the completion as server-sent events, one
+    piece of about four characters per event: the first after the server's first-token
+    delay, the next ones after its token intervals, cycled. Like a local model server it
+    keeps one model loaded, and a request for another model first waits the load delay.
+    Connections are kept alive (HTTP/1.1), and every new connection is numbered in the log,
+    so a client reusing its connections is easy to spot.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; without this each response waits for a delayed ACK
+    disable_nagle_algorithm = True
+    connection_ids = itertools.count(1)
+
+    def setup(self):
+        super().setup()
+        self.connection_id = next(self.connection_ids)
+        self.log_message("connection %d opened", self.connection_id)
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_chunk(self, data):
+        """Write one chunk of a chunked (Transfer-Encoding) response."""
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+
+    def send_event(self, body):
+        self.send_chunk(f"data: {json.dumps(body)}\n\n".encode('utf-8'))
+
+    def stream_completion(self, request_id, model, content, usage, include_usage, service):
+        """Send a completion as chat.completion.chunk events, sleeping the scripted delays between them."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        chunk = {
+            'id': f"chatcmpl-stub-{request_id}",
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': model,
+        }
+        time.sleep(self.server.first_token_delay + service.prefill_seconds(usage['prompt_tokens']))
+        intervals = self.server.token_intervals
+        for index, piece in enumerate(split_tokens(content)):
+            if index:
+                time.sleep((intervals[(index - 1) % len(intervals)] if intervals else 0.0) + service.token_seconds())
+            self.send_event({**chunk, 'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]})
+        self.send_event({**chunk, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+        if include_usage:
+            self.send_event({**chunk, 'choices': [], 'usage': usage})
+        self.send_chunk(b"data: [DONE]\n\n")
+        self.send_chunk(b"")
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/v1/models':
+            models = sorted(self.server.responses)
+            self.send_json(200, {'object': 'list', 'data': [{'id': model, 'object': 'model'} for model in models]})
+        else:
+            self.send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self.send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+            return
+
+        request = self.read_json()
+        model = request.get('model', '')
+        content = self.server.responses.get(model, self.server.default_completion)
+        if isinstance(content, list):
+            content = pick_variant(content, model, request.get('seed'))
+        prompt_tokens = sum(count_tokens(message.get('content', '')) for message in request.get('messages', []))
+        completion_tokens = count_tokens(content)
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+
+        with self.server.lock:
+            self.server.request_count += 1
+            request_id = self.server.request_count
+        self.log_message("request %d on connection %d: %s", request_id, self.connection_id, model)
+
+        if model in self.server.failing_models:
+            self.send_json(503, {'error': {'message': f"Stub failed to load {model} (--failing-models)"}})
+            return
+
+        with self.server.model_lock:
+            if model != self.server.loaded_model:
+                self.log_message("loading %s (load %d)", model, self.server.load_count + 1)
+                time.sleep(self.server.load_delay)
+                self.server.loaded_model = model
+                self.server.load_count += 1
+
+        if self.server.error_rate and self.server.random.random() < self.server.error_rate:
+            self.send_json(503, {'error': {'message': 'Stub error (--error-rate)'}})
+            return
+
+        service = self.server.service
+        with service.slot():
+            if request.get('stream'):
+                include_usage = (request.get('stream_options') or {}).get('include_usage', False)
+                self.stream_completion(request_id, model, content, usage, include_usage, service)
+                return
+
+            decode_seconds = sum(service.token_seconds() for _ in range(completion_tokens))
+            time.sleep(self.server.delay + service.prefill_seconds(prompt_tokens) + decode_seconds)
+
+        self.send_json(200, {
+            'id': f"chatcmpl-stub-{request_id}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': usage,
+        })
+
+
+def create_server(host='127.0.0.1', port=1234, responses=None, default_completion=DEFAULT_COMPLETION, delay=0.0,
+                  first_token_delay=0.0, token_intervals=None, load_delay=0.0, service=None, error_rate=0.0,
+                  seed=0, failing_models=()):
+    """
+    Create a stub server; call serve_forever() on it, or shutdown() from another thread.
+
+    Args:
+        host: Address to listen on
+        port: Port to listen on, 0 for any free port (see server.server_address)
+        responses: Dict mapping a model name to the completion it returns, or to a list of
+                   completions picked by the request's seed (see pick_variant)
+        default_completion: Completion of every model not in responses
+        delay: Seconds every request takes, to simulate generation
+        first_token_delay: Seconds before the first event of a streamed completion (prefill)
+        token_intervals: Seconds between the events of a streamed completion, cycled
+        load_delay: Seconds a request waits when it asks for another model than the loaded one
+        service: ServiceTimeModel adding prefill and decode time (default: none)
+        error_rate: Fraction of the requests answered with a 503 error
+        seed: Seed of the random generator picking the failed requests
+        failing_models: Models whose requests all fail with a 503, like a model that cannot be loaded
+
+    Returns:
+        ThreadingHTTPServer
+    """
+    server = ThreadingHTTPServer((host, port), StubModelHandler)
+    server.daemon_threads = True
+    server.responses = responses or {}
+    server.default_completion = default_completion
+    server.delay = delay
+    server.first_token_delay = first_token_delay
+    server.token_intervals = token_intervals or []
+    server.load_delay = load_delay
+    server.service = service or ServiceTimeModel()
+    server.error_rate = error_rate
+    server.random = random.Random(seed)
+    server.failing_models = set(failing_models)
+    server.loaded_model = None
+    server.load_count = 0
+    # Held while a model is loaded, so requests for the loaded model wait for it too
+    server.model_lock = threading.Lock()
+    server.lock = threading.Lock()
+    server.request_count = 0
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Serve canned chat completions on an OpenAI-compatible endpoint, for testing run_generation.py'
+    )
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=1234, help='Port to listen on (default: 1234)')
+    parser.add_argument(
+        '--responses',
+        type=str,
+        help='JSON file mapping model names to the completion each returns, or to a list picked by the '
+             'request seed (default: a small @Preview function)'
+    )
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds every request takes (default: 0)')
+    parser.add_argument(
+        '--first-token-delay',
+        type=float,
+        default=0.0,
+        help='Seconds before the first event of a streamed completion (default: 0)'
+    )
+    parser.add_argument(
+        '--token-intervals',
+        type=str,
+        default='',
+        help='Comma-separated seconds between streamed events, cycled, e.g. 0.01,0.01,0.05 (default: none)'
+    )
+    parser.add_argument(
+        '--load-delay',
+        type=float,
+        default=0.0,
+        help='Seconds to load a model when a request asks for another model than the loaded one (default: 0)'
+    )
+    parser.add_argument(
+        '--completion-tokens',
+        type=int,
+        help='Make the default completion this many tokens long'
+    )
+    parser.add_argument('--prefill-tps', type=float, default=0.0,
+                        help='Prompt tokens prefilled per second by the service-time model (default: 0, no time)')
+    parser.add_argument('--decode-tps', type=float, default=0.0,
+                        help='Tokens decoded per second by the service-time model (default: 0, no time)')
+    parser.add_argument('--parallel', type=int, default=0,
+                        help='Requests served at once, others queue (default: 0, unlimited)')
+    parser.add_argument('--batch-slowdown', type=float, default=0.0,
+                        help='Relative decode slowdown per other active request, e.g. 0.3 (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Sigma of the log-normal noise on prefill and decode times, e.g. 0.2 (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of requests answered with a 503 error (default: 0)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the jitter and the errors (default: 0)')
+    parser.add_argument('--failing-models', nargs='+', default=[], metavar='MODEL',
+                        help='Models whose requests all fail with a 503, as if they cannot be loaded')
+    args = parser.parse_args()
+
+    responses = {}
+    if args.responses:
+        with open(args.responses, 'r', encoding='utf-8') as f:
+            responses = json.load(f)
+
+    token_intervals = [float(interval) for interval in args.token_intervals.split(',') if interval]
+    default_completion = DEFAULT_COMPLETION
+    if args.completion_tokens:
+        default_completion = completion_of_tokens(DEFAULT_COMPLETION, args.completion_tokens)
+    service = ServiceTimeModel(args.prefill_tps, args.decode_tps, args.parallel, args.batch_slowdown, args.jitter,
+                               args.seed)
+    server = create_server(args.host, args.port, responses, default_completion, delay=args.delay,
+                           first_token_delay=args.first_token_delay, token_intervals=token_intervals,
+                           load_delay=args.load_delay, service=service, error_rate=args.error_rate,
+                           seed=args.seed, failing_models=args.failing_models)
+    print(f"Stub model server on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,45 @@
+import pytest
+
+from diff_sections import iter_diff_sections
+from run_validation import DIFF_TASKS, load_parsers, process_diff_file, validate_diff_sections
+
+# The first hunk deletes an SQL comment `-- x` and adds `++ y`, which read `--- x` and
+# `+++ y` in the diff, like the header pair of a new file section
+PLAIN_DIFF = """\
+--- a/db/schema.sql
++++ b/db/schema.sql
+@@ -1,3 +1,3 @@
+ CREATE TABLE topics (id TEXT);
+--- x
++++ y
+ CREATE INDEX topics_id ON topics (id);
+--- a/ui/TopAppBar.kt
++++ b/ui/TopAppBar.kt
+@@ -10,2 +10,2 @@
+-    colors = TopAppBarDefaults.centerAlignedTopAppBarColors(
++    colors = TopAppBarDefaults.topAppBarColors(
+     modifier = modifier,
+"""
+
+
+@pytest.fixture
+def diff_path(tmp_path):
+    path = tmp_path / 'plain.diff'
+    path.write_text(PLAIN_DIFF, encoding='utf-8')
+    return path
+
+
+def test_header_like_hunk_lines_do_not_start_a_section(diff_path):
+    sections = list(iter_diff_sections(diff_path))
+
+    assert [section['name'] for section in sections] == ['--- a/db/schema.sql', '--- a/ui/TopAppBar.kt']
+    assert [section['first_line'] for section in sections] == [1, 8]
+    assert b''.join(section['data'] for section in sections) == PLAIN_DIFF.encode('utf-8')
+
+
+def test_sectioned_validation_matches_full_parse(diff_path):
+    _, _, diff_parser, diff_query = load_parsers(languages=('diff',))
+
+    for task in DIFF_TASKS:
+        expected = process_diff_file(PLAIN_DIFF, task, diff_parser, diff_query)
+        assert validate_diff_sections(diff_path, task, diff_parser, diff_query) == expected
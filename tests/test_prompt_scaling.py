@@ -0,0 +1,37 @@
+import asyncio
+import threading
+
+import pytest
+
+from benchmarks.prompt_scaling import fit_model, load_context_files, prompt_scaling
+from stub_model_server import ServiceTimeModel, completion_of_tokens, create_server, DEFAULT_COMPLETION
+
+
+@pytest.fixture
+def stub_url():
+    # Slow enough prefill that the TTFT grows measurably with the prompt
+    service = ServiceTimeModel(prefill_tps=100000, decode_tps=2000)
+    server = create_server(port=0, default_completion=completion_of_tokens(DEFAULT_COMPLETION, 8), service=service,
+                           failing_models=['broken'])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def test_failed_warm_up_skips_only_that_model(tmp_path, stub_url):
+    (tmp_path / 'Padding.kt').write_text('fun padding() = "' + 'x' * 400 + '"\n', encoding='utf-8')
+    context_files = load_context_files(['*.kt'], root=tmp_path)
+
+    rows, measurements = asyncio.run(prompt_scaling(['first', 'broken', 'last'], [1000, 4000], 1, stub_url, 10,
+                                                    context_files, max_tokens=16))
+
+    assert sorted(measurements) == ['first', 'last']
+    assert {row['modelName'] for row in rows} == {'first', 'last'}
+    assert not any(row.get('error') for row in rows)
+    for model_name in ('first', 'last'):
+        assert len(measurements[model_name]) == 2
+        fit = fit_model(measurements[model_name])
+        assert fit['ttft'] is not None
+        assert fit['decode'] is not None
@@ -0,0 +1,48 @@
+import io
+from pathlib import Path
+
+from run_history import RunRecorder, connect, export_rows, write_export
+from run_validation import load_file_mappings_from_json, load_parsers, process_all_files
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_validation_export_matches_its_csv(tmp_path, monkeypatch):
+    # The mappings name their files relative to the repository
+    monkeypatch.chdir(REPO_ROOT)
+    file_mappings = load_file_mappings_from_json('resources/config/file-mappings-golden.json')
+    kotlin_parser, kotlin_language, diff_parser, diff_query = load_parsers()
+    output_csv = tmp_path / 'results.csv'
+    db_path = tmp_path / 'history.sqlite'
+
+    with RunRecorder(db_path, 'validation', repo_root=tmp_path) as history:
+        process_all_files(file_mappings, kotlin_parser, kotlin_language, diff_parser, diff_query,
+                          output_csv=str(output_csv), history=history)
+        run_id = history.run_id
+
+    connection = connect(db_path)
+    kind, fieldnames, rows = export_rows(connection, run_id)
+    connection.close()
+    output = io.StringIO(newline='')
+    write_export(output, kind, fieldnames, rows)
+
+    assert kind == 'validation'
+    assert output.getvalue().encode('utf-8') == output_csv.read_bytes()
+
+
+def test_tokens_per_second_uses_the_unrounded_duration(tmp_path):
+    db_path = tmp_path / 'history.sqlite'
+    row = {'modelName': 'microsoft/phi-4', 'durationSeconds': 0, 'outputTokenCount': 100,
+           'resultPath': 'result1-microsoft_phi-4.kt'}
+
+    with RunRecorder(db_path, 'generation', repo_root=tmp_path) as history:
+        history.add(row, 'microsoft_phi-4', 'measured', duration=0.4)
+        history.add(row, 'microsoft_phi-4', 'instant', duration=0.0)
+        history.add(row, 'microsoft_phi-4', 'unmeasured')
+
+    connection = connect(db_path)
+    values = {record['task']: (record['duration_seconds'], record['tokens_per_second'])
+              for record in connection.execute('SELECT task, duration_seconds, tokens_per_second FROM results')}
+    connection.close()
+
+    assert values == {'measured': (0.4, 250.0), 'instant': (0.0, None), 'unmeasured': (0.0, None)}